@@ -0,0 +1,210 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config import config
+from github_auth import get_github_token
+from metrics import invocation
+from utils import build_review_job, construct_pull_request_url
+
+# Pause bulk work when fewer core GitHub requests than this are left in the window.
+MIN_RATE_LIMIT_REMAINING = 100
+
+
+def _iter_list(url, params=None, github_token=None):
+    """Yields the items of a paginated GitHub list or search endpoint."""
+    from github_http import get_github_client
+
+    params = dict(params or {}, per_page=100)
+    while url:
+        response = get_github_client().get(url, token=github_token, params=params)
+        response.raise_for_status()
+        payload = response.json()
+        yield from payload["items"] if isinstance(payload, dict) else payload
+        url = response.links.get('next', {}).get('url')
+        # The next link already carries the query string.
+        params = None
+
+
+def _job_from_pull_request(pull_request):
+    job = build_review_job({
+        'action': 'synchronize',
+        'pull_request': pull_request,
+        'repository': pull_request['base']['repo'],
+    })
+    # Re-reviews replace the comment instead of appending to the last reviewed head.
+    job['full_review'] = True
+    return job
+
+
+def _fetch_pull_request(repository_full_name, pr_number):
+    from github_http import get_github_client
+
+    response = get_github_client().get(
+        construct_pull_request_url(repository_full_name, pr_number),
+        token=get_github_token(repository_full_name),
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def iter_review_jobs(targets, query=None):
+    """
+    Resolves targets and a search query into review jobs for open PRs.
+
+    Each repository is read with its own token from get_github_token, so with a GitHub App
+    every PR is fetched as the installation on its repository. The search itself spans
+    repositories and uses GITHUB_ACCESS_TOKEN.
+
+    Args:
+        targets (list): `owner/repo` for every open PR of a repository, or `owner/repo#123`.
+        query (str, optional): A GitHub issue search query, e.g. `org:acme is:open`.
+
+    Yields:
+        dict: Review jobs as built by build_review_job, with `full_review` set.
+    """
+    for target in targets:
+        repository_full_name, _, pr_number = target.partition("#")
+        if pr_number:
+            yield _job_from_pull_request(_fetch_pull_request(repository_full_name, int(pr_number)))
+        else:
+            url = f"{config.GITHUB_API_URL}/repos/{repository_full_name}/pulls"
+            for pull_request in _iter_list(url, {'state': 'open'}, get_github_token(repository_full_name)):
+                yield _job_from_pull_request(pull_request)
+    if query:
+        search_query = query if "is:pr" in query else f"{query} is:pr"
+        for issue in _iter_list(f"{config.GITHUB_API_URL}/search/issues", {'q': search_query}):
+            repository_full_name = issue['repository_url'].split("/repos/", 1)[1]
+            yield _job_from_pull_request(_fetch_pull_request(repository_full_name, issue['number']))
+
+
+def _job_key(job):
+    return f"{job['repository_full_name']}#{job['pr_number']}@{job['head_sha']}"
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines record of finished jobs, so an interrupted batch can resume.
+
+    A PR counts as done for the head commit it was reviewed at; a new push reviews it again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry['status'] < 500:
+                        self.done.add(entry['key'])
+
+    def is_done(self, job):
+        return _job_key(job) in self.done
+
+    def record(self, job, status):
+        if not self.path:
+            return
+        with self._lock:
+            self.done.add(_job_key(job))
+            with open(self.path, "a") as f:
+                f.write(json.dumps({'key': _job_key(job), 'status': status}) + "\n")
+
+
+def _wait_for_rate_limit():
+    """Sleeps until the GitHub rate limit window resets when little of it is left."""
+    from github_http import get_github_client
+
+    client = get_github_client()
+    if client.rate_limit_remaining is None or client.rate_limit_remaining >= MIN_RATE_LIMIT_REMAINING:
+        return
+    delay = max(0.0, (client.rate_limit_reset or 0) - time.time()) + 1
+    print(f"Only {client.rate_limit_remaining} GitHub requests left; pausing {delay:.0f}s for the reset.")
+    time.sleep(delay)
+
+
+def _review(job):
+    # Imported here so --dry-run never loads the review stack.
+    from worker import run_review_job
+
+    _wait_for_rate_limit()
+    with invocation("batch_review") as metrics:
+        metrics.set_property("Repository", job['repository_full_name'])
+        metrics.set_property("PullRequest", job['pr_number'])
+        result = run_review_job(job)
+        metrics.set_property("StatusCode", result['statusCode'])
+        return result
+
+
+def run_batch(jobs, checkpoint, concurrency, dry_run=False):
+    """
+    Reviews jobs on a bounded thread pool, skipping those the checkpoint has done.
+
+    Returns:
+        dict: Counts of reviewed, skipped and failed jobs.
+    """
+    counts = {'reviewed': 0, 'skipped': 0, 'failed': 0}
+    pending = []
+    for job in jobs:
+        if checkpoint.is_done(job):
+            counts['skipped'] += 1
+        elif dry_run:
+            print(f"Would review {job['repository_full_name']}#{job['pr_number']} at {job['head_sha']}: {job['pr_title']}")
+            counts['reviewed'] += 1
+        else:
+            pending.append(job)
+    if dry_run:
+        return counts
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(_review, job): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                status = future.result()['statusCode']
+            except Exception as e:
+                print(f"Review of {job['repository_full_name']}#{job['pr_number']} raised: {e}")
+                status = 500
+            checkpoint.record(job, status)
+            counts['failed' if status >= 500 else 'reviewed'] += 1
+            print(f"[{sum(counts.values())}/{len(pending) + counts['skipped']}] "
+                  f"{job['repository_full_name']}#{job['pr_number']}: {status}")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-review many open PRs, e.g. after a prompt change.")
+    parser.add_argument("targets", nargs="*", help="owner/repo (all open PRs) or owner/repo#123")
+    parser.add_argument("--query", help="GitHub search query selecting PRs, e.g. 'org:acme is:open label:review'")
+    parser.add_argument("--from-file", help="File with one target per line")
+    parser.add_argument("--concurrency", type=int, default=4, help="PRs reviewed at once")
+    parser.add_argument("--github-concurrency", type=int, default=8, help="GitHub requests in flight at once")
+    parser.add_argument("--model-concurrency", type=int, default=4, help="Model calls in flight at once per model")
+    parser.add_argument("--checkpoint", default="batch_review.checkpoint.jsonl",
+                        help="Progress file; finished PRs are skipped when the batch is rerun")
+    parser.add_argument("--dry-run", action="store_true", help="List the PRs that would be reviewed and exit")
+    args = parser.parse_args(argv)
+
+    targets = list(args.targets)
+    if args.from_file:
+        with open(args.from_file) as f:
+            targets.extend(line.strip() for line in f if line.strip() and not line.startswith("#"))
+    if not targets and not args.query:
+        parser.error("give at least one target, --from-file or --query")
+
+    # Set before anything reads the config, so the shared clients are built with these limits.
+    config.GITHUB_MAX_CONCURRENCY = args.github_concurrency
+    config.LLM_MAX_CONCURRENCY = args.model_concurrency
+
+    counts = run_batch(iter_review_jobs(targets, args.query), Checkpoint(args.checkpoint), args.concurrency, args.dry_run)
+    verb = "Would review" if args.dry_run else "Reviewed"
+    print(f"{verb} {counts['reviewed']}, skipped {counts['skipped']} already done, {counts['failed']} failed.")
+    return 1 if counts['failed'] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
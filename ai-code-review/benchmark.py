@@ -0,0 +1,433 @@
+import argparse
+import contextlib
+import glob
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Synthetic corpus: (case name, number of files, changed lines per file)
+CORPUS_SIZES = [
+    ("tiny", 1, 10),
+    ("small", 3, 60),
+    ("medium", 10, 200),
+    ("large", 25, 400),
+]
+BENCH_REPOSITORY = "bench/sample-repo"
+
+
+def _synthetic_patch(rng, filename, changed_lines):
+    """Builds a unified diff of roughly changed_lines lines in hunks of up to 40."""
+    hunks = []
+    line_number = 1
+    remaining = changed_lines
+    while remaining > 0:
+        size = min(40, remaining)
+        lines = [f" # context above {filename}:{line_number}"]
+        for offset in range(size):
+            name = f"value_{rng.randrange(10_000)}"
+            if rng.random() < 0.4:
+                lines.append(f"-    {name} = compute({line_number + offset})")
+            lines.append(f"+    {name} = compute({line_number + offset}, cache=True)")
+        lines.append(f" # context below {filename}:{line_number + size}")
+        removed = sum(line.startswith("-") for line in lines)
+        added = sum(line.startswith("+") for line in lines)
+        hunks.append(f"@@ -{line_number},{removed + 2} +{line_number},{added + 2} @@\n" + "\n".join(lines))
+        line_number += size + 20
+        remaining -= size
+    return "\n".join(hunks)
+
+
+def synthetic_corpus(seed=0):
+    """
+    Generates a deterministic corpus of webhook events and compare API payloads, from a
+    one-file change to a diff of about 10k lines.
+
+    Returns:
+        list: Cases as dicts with name, event (webhook body) and comparison.
+    """
+    rng = random.Random(seed)
+    cases = []
+    for index, (name, file_count, changed_lines) in enumerate(CORPUS_SIZES):
+        head_sha = f"{index + 1:02x}" * 20
+        files = []
+        for file_index in range(file_count):
+            filename = f"src/module_{file_index}.py"
+            patch = _synthetic_patch(rng, filename, changed_lines)
+            files.append({
+                "filename": filename,
+                "status": "modified",
+                "additions": patch.count("\n+"),
+                "deletions": patch.count("\n-"),
+                "patch": patch,
+            })
+        cases.append({
+            "name": name,
+            "event": {
+                "action": "synchronize",
+                "pull_request": {
+                    "title": f"Benchmark change ({name})",
+                    "number": index + 1,
+                    "body": "Refactors compute() callers to use the cache.",
+                    "state": "open",
+                    "base": {"ref": "main"},
+                    "head": {"ref": f"bench-{name}", "sha": head_sha},
+                },
+                "repository": {"name": "sample-repo", "full_name": BENCH_REPOSITORY},
+            },
+            "comparison": {
+                "status": "ahead",
+                "files": files,
+                "commits": [{"commit": {"message": f"Use the compute cache ({name})"}}],
+            },
+        })
+    return cases
+
+
+def load_corpus(directory):
+    """
+    Loads recorded cases from a directory of JSON files, each holding the webhook body as
+    "event" and the compare API response as "comparison".
+    """
+    cases = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path) as f:
+            case = json.load(f)
+        case.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+        cases.append(case)
+    if not cases:
+        raise ValueError(f"No *.json cases found in {directory}")
+    return cases
+
+
+def write_corpus(cases, directory):
+    os.makedirs(directory, exist_ok=True)
+    for case in cases:
+        with open(os.path.join(directory, f"{case['name']}.json"), "w") as f:
+            json.dump(case, f, indent=2)
+
+
+class StubGitHubServer:
+    """
+    Deterministic local stand-in for the GitHub REST endpoints a review touches.
+
+    Compare requests are answered from the corpus by head SHA or branch, PR requests by
+    PR number modulo 1000 (replays offset the numbers), and comments are kept in memory.
+    Like GitHub, the PR files endpoint pages its results and leaves out patches over
+    omit_patches_over characters, which are then served from the PR diff. Point
+    GITHUB_API_URL at `url` to use it.
+    """
+
+    def __init__(self, cases, latency_s=0.0, page_size=30, omit_patches_over=12_000):
+        self.latency_s = latency_s
+        self.page_size = page_size
+        self.omit_patches_over = omit_patches_over
+        self.comparisons = {}
+        self.pull_requests = {}
+        for case in cases:
+            head = case["event"]["pull_request"]["head"]
+            for ref in (head.get("sha"), head.get("ref")):
+                if ref:
+                    self.comparisons[ref] = case["comparison"]
+            self.pull_requests[case["event"]["pull_request"]["number"] % 1000] = case
+        self.comments = {}
+        self._next_comment_id = 1
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _pull_request_files(self, comparison, page):
+        files = comparison.get("files", [])[(page - 1) * self.page_size:page * self.page_size]
+        return [
+            {key: value for key, value in file.items() if key != "patch"}
+            if len(file.get("patch", "")) > self.omit_patches_over else file
+            for file in files
+        ]
+
+    def _pull_request_diff(self, comparison):
+        return "\n".join(
+            f"diff --git a/{file['filename']} b/{file['filename']}\n"
+            f"--- a/{file['filename']}\n+++ b/{file['filename']}\n{file.get('patch', '')}"
+            for file in comparison.get("files", [])
+        ) + "\n"
+
+    def _route(self, method, path, body, headers=None):
+        path, _, query = path.partition("?")
+        params = dict(part.partition("=")[::2] for part in query.split("&") if part)
+        if match := re.fullmatch(r"/repos/[^/]+/[^/]+/pulls/(\d+)(/files|/commits)?", path):
+            case = self.pull_requests.get(int(match.group(1)) % 1000)
+            if case is None:
+                return 404, {"message": "Not Found"}
+            comparison = case["comparison"]
+            if match.group(2) == "/commits":
+                return 200, comparison.get("commits", [])
+            if match.group(2) == "/files":
+                page = int(params.get("page", 1))
+                files = self._pull_request_files(comparison, page)
+                more = page * self.page_size < len(comparison.get("files", []))
+                link = f'<{self.url}{path}?page={page + 1}>; rel="next"' if more else None
+                return 200, files, link
+            if "diff" in (headers or {}).get("Accept", ""):
+                return 200, self._pull_request_diff(comparison)
+            pull_request = case["event"]["pull_request"]
+            base = dict(pull_request["base"], repo=case["event"]["repository"])
+            return 200, dict(pull_request, number=int(match.group(1)), base=base)
+        if method == "GET" and (match := re.fullmatch(r"/repos/[^/]+/[^/]+/compare/[^/]+\.\.\.(.+)", path)):
+            comparison = self.comparisons.get(match.group(1))
+            return (200, comparison) if comparison else (404, {"message": "Not Found"})
+        if method == "GET" and re.fullmatch(r"/repos/[^/]+/[^/]+", path):
+            return 200, {"full_name": path[len("/repos/"):]}
+        if match := re.fullmatch(r"/repos/[^/]+/[^/]+/issues/(\d+)/comments", path):
+            with self._lock:
+                if method == "GET":
+                    return 200, [c for c in self.comments.values() if c["issue"] == match.group(1)]
+                comment = {"id": self._next_comment_id, "issue": match.group(1), "body": body.get("body", "")}
+                self.comments[comment["id"]] = comment
+                self._next_comment_id += 1
+                return 201, comment
+        if match := re.fullmatch(r"/repos/[^/]+/[^/]+/issues/comments/(\d+)", path):
+            with self._lock:
+                comment = self.comments.get(int(match.group(1)))
+                if comment is None:
+                    return 404, {"message": "Not Found"}
+                if method == "PATCH":
+                    comment["body"] = body.get("body", "")
+                return 200, comment
+        return 404, {"message": "Not Found"}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                if server.latency_s:
+                    time.sleep(server.latency_s)
+                status, payload, *link = server._route(self.command, self.path, body, self.headers)
+                if isinstance(payload, str):
+                    data, content_type = payload.encode("utf-8"), "text/plain; charset=utf-8"
+                else:
+                    data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                if link and link[0]:
+                    self.send_header("Link", link[0])
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PATCH = _respond
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class RecordingProvider:
+    """Wraps a model provider and adds up the prompt, cached and completion tokens it serves."""
+
+    def __init__(self, provider):
+        self.provider = provider
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _record(self, completion):
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += completion.usage.prompt_tokens
+            self.cached_tokens += completion.usage.cached_tokens
+            self.completion_tokens += completion.usage.completion_tokens
+        return completion
+
+    def complete(self, *args, **kwargs):
+        return self._record(self.provider.complete(*args, **kwargs))
+
+    async def acomplete(self, *args, **kwargs):
+        return self._record(await self.provider.acomplete(*args, **kwargs))
+
+    def stream(self, model, messages, max_completion_tokens, timeout=None):
+        from tokenizer import count_tokens
+
+        text = ""
+        for piece in self.provider.stream(model, messages, max_completion_tokens, timeout):
+            text += piece
+            yield piece
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += sum(count_tokens(message["content"]) for message in messages)
+            self.completion_tokens += count_tokens(text)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def configure(github_url, args):
+    """
+    Points the app at the stub server and stub model. Must run before anything reads config.
+    """
+    from config import config
+
+    config.GITHUB_API_URL = github_url
+    config.GITHUB_ACCESS_TOKEN = "bench-token"
+    config.OPENAI_API_KEY = "bench-key"
+    config.TEST_MODE = False
+    config.LLM_PROVIDER = "stub"
+    config.STUB_LLM_LATENCY_SECONDS = args.llm_latency
+    config.STUB_LLM_FAILURE_RATE = args.llm_failure_rate
+    config.COMMENT_INDEX_URL = "memory://"
+    config.EVENT_STORE_URL = ""
+    config.REVIEW_QUEUE_URL = ""
+    config.STREAM_REVIEW = args.stream
+    config.ASYNC_REVIEW = args.async_review
+    config.REVIEW_CACHE_URL = args.cache_url
+
+
+def run_benchmark(cases, iterations, concurrency):
+    """
+    Replays every case through lambda_handler `iterations` times.
+
+    Each replay uses a fresh PR number so incremental review and the comment index
+    start from scratch, as for a newly opened PR.
+
+    Returns:
+        dict: Results per case name and for the whole run.
+    """
+    from lambda_handler import lambda_handler
+    from model_router import get_model_router
+
+    router = get_model_router()
+    recorders = {name: RecordingProvider(provider) for name, provider in router.providers.items()}
+    router.providers = recorders
+
+    def replay(run_index, case):
+        event = json.loads(json.dumps(case["event"]))
+        event["pull_request"]["number"] = 1000 * (run_index + 1) + event["pull_request"]["number"]
+        started = time.perf_counter()
+        response = lambda_handler({"body": json.dumps(event)}, None)
+        elapsed = time.perf_counter() - started
+        if response["statusCode"] != 200:
+            raise RuntimeError(f"{case['name']} failed: {response}")
+        return case["name"], elapsed
+
+    # The first review pays for lazy imports and client setup; keep it out of the numbers.
+    replay(-1, cases[0])
+
+    tracemalloc.start()
+    tokens_before = sum(r.prompt_tokens for r in recorders.values())
+    cached_before = sum(r.cached_tokens for r in recorders.values())
+    calls_before = sum(r.calls for r in recorders.values())
+    started = time.perf_counter()
+    latencies = {case["name"]: [] for case in cases}
+    jobs = [(run_index, case) for run_index in range(iterations) for case in cases]
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(lambda job: replay(*job), jobs))
+    else:
+        results = [replay(*job) for job in jobs]
+    wall_s = time.perf_counter() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    for name, elapsed in results:
+        latencies[name].append(elapsed)
+    all_latencies = [elapsed for _, elapsed in results]
+    return {
+        "cases": {
+            name: {"p50_s": percentile(values, 0.50), "p95_s": percentile(values, 0.95), "runs": len(values)}
+            for name, values in latencies.items()
+        },
+        "reviews": len(results),
+        "p50_s": percentile(all_latencies, 0.50),
+        "p95_s": percentile(all_latencies, 0.95),
+        "throughput_per_s": len(results) / wall_s if wall_s else 0.0,
+        "prompt_tokens": sum(r.prompt_tokens for r in recorders.values()) - tokens_before,
+        "cached_tokens": sum(r.cached_tokens for r in recorders.values()) - cached_before,
+        "model_calls": sum(r.calls for r in recorders.values()) - calls_before,
+        "peak_memory_mb": peak_bytes / (1024 * 1024),
+        "wall_s": wall_s,
+    }
+
+
+def format_report(results, cases):
+    lines = ["case        files   lines     p50 ms     p95 ms"]
+    for case in cases:
+        files = case["comparison"].get("files", [])
+        changed = sum(file.get("patch", "").count("\n") + 1 for file in files if file.get("patch"))
+        stats = results["cases"][case["name"]]
+        lines.append(
+            f"{case['name']:<10} {len(files):>6} {changed:>7} {stats['p50_s'] * 1000:>10.1f} {stats['p95_s'] * 1000:>10.1f}"
+        )
+    lines.extend([
+        "",
+        f"Reviews: {results['reviews']} in {results['wall_s']:.2f}s ({results['throughput_per_s']:.2f}/s)",
+        f"End-to-end latency: p50 {results['p50_s'] * 1000:.1f}ms, p95 {results['p95_s'] * 1000:.1f}ms",
+        f"Prompt tokens sent: {results['prompt_tokens']} over {results['model_calls']} model call(s)",
+        f"Prompt cache hits: {results['cached_tokens']} token(s) "
+        f"({results['cached_tokens'] / results['prompt_tokens'] if results['prompt_tokens'] else 0:.0%})",
+        f"Peak traced memory: {results['peak_memory_mb']:.1f} MiB",
+    ])
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a corpus of PRs through the review pipeline offline.")
+    parser.add_argument("--corpus", help="Directory of recorded cases; a synthetic corpus is used when omitted.")
+    parser.add_argument("--write-corpus", metavar="DIR", help="Write the synthetic corpus to DIR and exit.")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Stub model latency per call in seconds.")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0)
+    parser.add_argument("--github-latency", type=float, default=0.0, help="Stub GitHub latency per request in seconds.")
+    parser.add_argument("--cache-url", default="", help="Review cache URL, e.g. memory://")
+    parser.add_argument("--stream", action="store_true", help="Stream progressive comment updates.")
+    parser.add_argument("--async-review", action="store_true", help="Run the stages on the async path.")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own output.")
+    parser.add_argument("--output", help="Also write the report to this file.")
+    args = parser.parse_args(argv)
+
+    if args.write_corpus:
+        write_corpus(synthetic_corpus(), args.write_corpus)
+        return 0
+
+    cases = load_corpus(args.corpus) if args.corpus else synthetic_corpus()
+    with StubGitHubServer(cases, args.github_latency) as server:
+        configure(server.url, args)
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                results = run_benchmark(cases, args.iterations, args.concurrency)
+    report = json.dumps(results, indent=2) if args.json else format_report(results, cases)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
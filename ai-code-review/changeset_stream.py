@@ -0,0 +1,150 @@
+from typing import Dict, Iterator
+from github_http import get_github_client
+from utils import construct_pull_request_url
+
+# The PR files endpoint lists at most this many files.
+MAX_PULL_REQUEST_FILES = 3000
+# Patches fetched from the diff are cut off after this many characters.
+MAX_FETCHED_PATCH_CHARS = 1_000_000
+
+
+def _iter_json_array(response) -> Iterator[dict]:
+    """
+    Yields the items of a JSON array response one at a time.
+
+    With ijson installed the body is parsed as it streams in, so a page of huge patches
+    is never held in memory at once; otherwise the page is decoded whole.
+    """
+    try:
+        import ijson
+    except ImportError:
+        yield from response.json()
+        return
+    response.raw.decode_content = True
+    yield from ijson.items(response.raw, "item", use_float=True)
+
+
+def _iter_pages(url, token, per_page=100) -> Iterator[dict]:
+    """Yields the items of a paginated list endpoint, following the `Link` header."""
+    params = {'per_page': per_page}
+    while url:
+        with get_github_client().get(url, token=token, params=params, stream=True) as response:
+            response.raise_for_status()
+            yield from _iter_json_array(response)
+            url = response.links.get('next', {}).get('url')
+        # The next link already carries the query string.
+        params = None
+
+
+def _file_record(file: dict) -> dict:
+    return {
+        'filename': file.get('filename', 'Unknown file'),
+        'status': file.get('status', 'modified'),
+        'patch': file.get('patch', ''),
+        'previous_filename': file.get('previous_filename'),
+    }
+
+
+def iter_pull_request_files(repository_full_name, pr_number, github_token) -> Iterator[dict]:
+    """
+    Yields the raw file objects of a PR from the paginated PR files endpoint.
+
+    Unlike the compare API, which stops at 300 files, this lists up to 3000.
+    """
+    url = f"{construct_pull_request_url(repository_full_name, pr_number)}/files"
+    count = 0
+    for file in _iter_pages(url, github_token):
+        count += 1
+        yield file
+    if count >= MAX_PULL_REQUEST_FILES:
+        print(f"PR lists {count} files, the most GitHub returns; later files are not reviewed.")
+
+
+def iter_diff_patches(repository_full_name, pr_number, github_token, wanted: Dict[str, str]) -> Iterator[tuple]:
+    """
+    Streams the PR diff and yields (filename, patch) for the wanted files only.
+
+    Args:
+        repository_full_name (str): Full name of the repository.
+        pr_number (int): Pull request number.
+        github_token (str): GitHub access token.
+        wanted (dict): Maps the `diff --git` header of each wanted file to its filename.
+
+    Yields:
+        tuple: The filename and its hunks, without the git headers.
+    """
+    response = get_github_client().request(
+        'GET',
+        construct_pull_request_url(repository_full_name, pr_number),
+        token=github_token,
+        headers={'Accept': 'application/vnd.github.v3.diff'},
+        stream=True,
+    )
+    with response:
+        response.raise_for_status()
+        current = None
+        lines = []
+        size = 0
+        for line in response.iter_lines(chunk_size=65536, decode_unicode=True):
+            if line.startswith("diff --git "):
+                if current and lines:
+                    yield current, "\n".join(lines)
+                current = wanted.get(line)
+                lines = []
+                size = 0
+            elif current and size <= MAX_FETCHED_PATCH_CHARS and (lines or line.startswith("@@")):
+                size += len(line) + 1
+                lines.append(line if size <= MAX_FETCHED_PATCH_CHARS else "(patch truncated)")
+        if current and lines:
+            yield current, "\n".join(lines)
+
+
+def iter_changeset_files(repository_full_name, pr_number, github_token) -> Iterator[dict]:
+    """
+    Yields the file records of a PR one at a time, in the format of parse_comparison.
+
+    Files are read page by page from the PR files endpoint. GitHub leaves out the patch of
+    files whose diff is too large; those are filled in from the PR's diff after the listed
+    files, streaming it once and keeping only the missing files' hunks. Binary files keep
+    an empty patch.
+
+    Args:
+        repository_full_name (str): Full name of the repository.
+        pr_number (int): Pull request number.
+        github_token (str): GitHub access token.
+
+    Yields:
+        dict: File records with filename, status, patch and previous_filename.
+    """
+    missing: Dict[str, dict] = {}
+    for file in iter_pull_request_files(repository_full_name, pr_number, github_token):
+        record = _file_record(file)
+        if 'patch' not in file and (file.get('additions') or file.get('deletions')):
+            old_name = record['previous_filename'] or record['filename']
+            missing[f"diff --git a/{old_name} b/{record['filename']}"] = record
+            continue
+        yield record
+
+    if not missing:
+        return
+    print(f"Fetching {len(missing)} patch(es) GitHub omitted from the file list.")
+    wanted = {header: record['filename'] for header, record in missing.items()}
+    records = {record['filename']: record for record in missing.values()}
+    try:
+        for filename, patch in iter_diff_patches(repository_full_name, pr_number, github_token, wanted):
+            yield dict(records.pop(filename), patch=patch)
+    except Exception as e:
+        # GitHub refuses diffs past its own size limit; review what we have.
+        print(f"Failed to fetch the PR diff: {e}")
+    for record in records.values():
+        yield dict(record, patch="(patch not available from GitHub)")
+
+
+def fetch_pull_request_commit_messages(repository_full_name, pr_number, github_token) -> str:
+    """
+    Returns the newline separated commit messages of a PR.
+    """
+    url = f"{construct_pull_request_url(repository_full_name, pr_number)}/commits"
+    return "\n".join(
+        commit.get('commit', {}).get('message', '') for commit in _iter_pages(url, github_token)
+    )
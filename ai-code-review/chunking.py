@@ -0,0 +1,119 @@
+from typing import List
+from tokenizer import CHARS_PER_TOKEN, count_tokens
+
+
+def split_patch_into_hunks(patch: str) -> List[str]:
+    """
+    Splits a unified diff patch into its hunks, each starting with an `@@` header.
+
+    Args:
+        patch (str): The patch of a single file.
+
+    Returns:
+        list: The hunks, in order. Text before the first header is kept with the first hunk.
+    """
+    hunks: List[List[str]] = []
+    for line in patch.splitlines():
+        if line.startswith("@@") or not hunks:
+            hunks.append([])
+        hunks[-1].append(line)
+    return ["\n".join(hunk) for hunk in hunks]
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text[:max_chars].rsplit("\n", 1)[0] + "\n... (hunk truncated)"
+
+
+def _split_file(file: dict, max_tokens: int) -> List[dict]:
+    """Splits a file record whose patch exceeds the budget into hunk-aligned parts."""
+    parts: List[List[str]] = [[]]
+    used = 0
+    for hunk in split_patch_into_hunks(file["patch"]):
+        hunk = _truncate_to_tokens(hunk, max_tokens)
+        hunk_tokens = count_tokens(hunk)
+        if parts[-1] and used + hunk_tokens > max_tokens:
+            parts.append([])
+            used = 0
+        parts[-1].append(hunk)
+        used += hunk_tokens
+    if len(parts) == 1:
+        return [dict(file, patch="\n".join(parts[0]))]
+    return [
+        dict(file, filename=f"{file['filename']} (part {index}/{len(parts)})", patch="\n".join(hunks))
+        for index, hunks in enumerate(parts, start=1)
+    ]
+
+
+def split_changeset(files: List[dict], max_tokens: int) -> List[dict]:
+    """
+    Splits file records into the parts chunks are packed from.
+
+    Files are kept whole when they fit and are otherwise split on hunk boundaries. A part
+    depends only on its own file, so unchanged files give the same parts on every push.
+    """
+    return [part for file in files for part in _split_file(file, max_tokens)]
+
+
+def pack_parts(parts: List[dict], max_tokens: int) -> List[List[dict]]:
+    """Packs parts greedily, in order, into chunks of at most max_tokens."""
+    chunks: List[List[dict]] = []
+    used = 0
+    for part in parts:
+        part_tokens = count_tokens(part["filename"]) + count_tokens(part["patch"])
+        if not chunks or used + part_tokens > max_tokens:
+            chunks.append([])
+            used = 0
+        chunks[-1].append(part)
+        used += part_tokens
+    return chunks
+
+
+def chunk_changeset(files: List[dict], max_tokens: int) -> List[List[dict]]:
+    """
+    Packs file records into token-budgeted chunks.
+
+    Chunks are filled greedily in changeset order, so where a chunk starts depends on
+    every file before it. The review cache therefore remembers which parts each chunk was
+    made of (see openai_client._plan_chunks) rather than relying on the packing to repeat.
+
+    Args:
+        files (list): File records from get_changeset_files.
+        max_tokens (int): Token budget for the code changes of a single chunk.
+
+    Returns:
+        list: Chunks, each a list of file records.
+    """
+    return pack_parts(split_changeset(files, max_tokens), max_tokens)
+
+
+def summary_context(files: List[dict], max_tokens: int) -> str:
+    """
+    Builds a budgeted view of the changeset for the PR summary.
+
+    As many patches as fit in the budget come first, formatted exactly like a review chunk
+    so the summary prompt shares its cached prefix with the first chunk's feedback prompt,
+    followed by the list of every changed filename.
+
+    Args:
+        files (list): File records from get_changeset_files.
+        max_tokens (int): Token budget for the returned text.
+
+    Returns:
+        str: The summary context.
+    """
+    file_list = "\n".join(f"- {file['filename']} ({file.get('status', 'modified')})" for file in files)
+    file_list = f"\nChanged files:\n{file_list}\n"
+    sections = []
+    used = count_tokens(file_list)
+    for file in files:
+        section = f"File: {file['filename']}\nChanges:\n{file['patch']}\n"
+        section_tokens = count_tokens(section)
+        if used + section_tokens > max_tokens:
+            sections.append("... (remaining patches omitted)\n")
+            break
+        sections.append(section)
+        used += section_tokens
+    return "\n".join(sections) + file_list
@@ -0,0 +1,484 @@
+import ast
+import fnmatch
+import os
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+from config import config
+from chunking import split_patch_into_hunks
+from compaction import omitted_line_count
+from tokenizer import count_tokens
+
+# Bump when the schema or the symbol extraction changes; older indexes are rebuilt.
+SCHEMA_VERSION = "1"
+
+SOURCE_EXTENSIONS = {
+    ".py", ".js", ".jsx", ".mjs", ".ts", ".tsx", ".go", ".java", ".kt", ".rb", ".rs", ".c", ".h",
+    ".cc", ".cpp", ".hpp", ".cs", ".php", ".swift", ".scala",
+}
+# Larger files are usually generated or data and are left out of the index.
+MAX_INDEXED_FILE_BYTES = 512 * 1024
+# Symbol bodies are kept up to this size; regex-found symbols end at the next one or after MAX_SYMBOL_LINES.
+MAX_SYMBOL_CHARS = 8000
+MAX_SYMBOL_LINES = 200
+MAX_REF_TEXT_CHARS = 200
+# Results per lookup that go into the related code context
+MAX_CALL_SITES = 5
+MAX_DEFINITIONS = 2
+MAX_SEARCH_RESULTS = 5
+MAX_SEARCH_TERMS = 20
+# Fetched files are committed to the index in batches of this many, so an update cut
+# short by a timeout or a failed fetch keeps the files it already indexed.
+INDEX_BATCH_FILES = 200
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@")
+_IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CALL = re.compile(r"([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+_DEFINITIONS = (
+    re.compile(
+        r"^(\s*)(?:export\s+)?(?:(?:public|private|protected|internal|static|async|final|abstract|override|"
+        r"default|pub(?:\([a-z]+\))?)\s+)*(def|function|func|fn|class|struct|interface|trait|enum|module)\s+"
+        r"(?:\([^)]*\)\s*)?([A-Za-z_][A-Za-z0-9_]*)"
+    ),
+    re.compile(r"^(\s*)(?:export\s+)?(const|let|var)\s+([A-Za-z_][A-Za-z0-9_]*)\s*=\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>|[A-Za-z_]\w*\s*=>)"),
+)
+# Identifiers that say nothing about which code is related: keywords and ubiquitous builtins.
+STOP_IDENTIFIERS = frozenset("""
+    if else elif for while return def class function func fn let var const new this self cls
+    import from as in is not and or true false True False None null nil undefined try except catch
+    finally raise throw with await async yield pass break continue switch case default public
+    private protected static void int str len print range list dict set type object string bool
+    super lambda go defer struct interface package use mut pub impl match
+""".split())
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, blob_sha TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS symbols ("
+    " id INTEGER PRIMARY KEY, path TEXT NOT NULL, name TEXT NOT NULL, kind TEXT NOT NULL,"
+    " start_line INTEGER NOT NULL, end_line INTEGER NOT NULL, body TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS symbols_path ON symbols (path, start_line)",
+    "CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name)",
+    "CREATE TABLE IF NOT EXISTS refs (name TEXT NOT NULL, path TEXT NOT NULL, line INTEGER NOT NULL, text TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS refs_name ON refs (name)",
+    "CREATE INDEX IF NOT EXISTS refs_path ON refs (path)",
+    # BM25 ranked search over symbol names and bodies, kept in step with `symbols` by triggers.
+    "CREATE VIRTUAL TABLE IF NOT EXISTS symbol_search USING fts5("
+    " name, body, content='symbols', content_rowid='id', tokenize=\"unicode61 tokenchars '_'\")",
+    "CREATE TRIGGER IF NOT EXISTS symbols_ai AFTER INSERT ON symbols BEGIN"
+    " INSERT INTO symbol_search (rowid, name, body) VALUES (new.id, new.name, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS symbols_ad AFTER DELETE ON symbols BEGIN"
+    " INSERT INTO symbol_search (symbol_search, rowid, name, body) VALUES ('delete', old.id, old.name, old.body); END",
+)
+
+
+def is_indexable(path: str, size: int = 0) -> bool:
+    """Whether a repository file is source code worth indexing."""
+    if size > MAX_INDEXED_FILE_BYTES or os.path.splitext(path)[1].lower() not in SOURCE_EXTENSIONS:
+        return False
+    basename = path.rsplit("/", 1)[-1]
+    return not any(
+        fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(basename, pattern)
+        for pattern in config.COMPACT_EXCLUDE_GLOBS
+    )
+
+
+def _python_symbols(source: str, lines: List[str]):
+    tree = ast.parse(source)
+    symbols = []
+    refs = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            start = min([node.lineno] + [decorator.lineno for decorator in node.decorator_list])
+            kind = "class" if isinstance(node, ast.ClassDef) else "function"
+            symbols.append((node.name, kind, start, node.end_lineno))
+        elif isinstance(node, ast.Call):
+            func = node.func
+            name = func.id if isinstance(func, ast.Name) else getattr(func, "attr", None)
+            if name and name not in STOP_IDENTIFIERS:
+                refs.append((name, node.lineno, lines[node.lineno - 1].strip()))
+    return symbols, refs
+
+
+def _regex_symbols(lines: List[str]):
+    definitions = []
+    refs = []
+    for number, line in enumerate(lines, start=1):
+        for pattern in _DEFINITIONS:
+            match = pattern.match(line)
+            if match:
+                indent, keyword, name = match.groups()
+                kind = "class" if keyword in ("class", "struct", "interface", "trait", "enum", "module") else "function"
+                definitions.append((name, kind, number, len(indent.expandtabs())))
+                break
+        else:
+            for name in _CALL.findall(line):
+                if name not in STOP_IDENTIFIERS:
+                    refs.append((name, number, line.strip()))
+    # Without a parser, a definition runs until the next one at the same or a lower indentation.
+    symbols = []
+    for index, (name, kind, start, indent) in enumerate(definitions):
+        end = min(len(lines), start + MAX_SYMBOL_LINES - 1)
+        for _, _, next_start, next_indent in definitions[index + 1:]:
+            if next_indent <= indent:
+                end = min(end, next_start - 1)
+                break
+        symbols.append((name, kind, start, end))
+    return symbols, refs
+
+
+def extract_symbols(path: str, source: str) -> Tuple[List[tuple], List[tuple]]:
+    """
+    Finds the definitions and call sites in a source file.
+
+    Python is parsed with ast; other languages (and Python that does not parse) use
+    line-based patterns, which are approximate but cheap.
+
+    Returns:
+        tuple: Symbols as (name, kind, start_line, end_line) and call sites as (name, line, text).
+    """
+    lines = source.splitlines()
+    if path.endswith(".py"):
+        try:
+            return _python_symbols(source, lines)
+        except (SyntaxError, ValueError):
+            pass
+    return _regex_symbols(lines)
+
+
+def _changed_lines(patch: str) -> Tuple[List[int], List[str]]:
+    """Returns the new-file line numbers of the added lines of a patch, and their text."""
+    numbers = []
+    added = []
+    for hunk in split_patch_into_hunks(patch):
+        lines = hunk.splitlines()
+        header = _HUNK_HEADER.match(lines[0]) if lines else None
+        if header is None:
+            continue
+        number = int(header.group(1))
+        for line in lines[1:]:
+            if line.startswith("+"):
+                numbers.append(number)
+                added.append(line[1:])
+                number += 1
+            elif not line.startswith(("-", "\\")):
+                number += omitted_line_count(line) or 1
+    return numbers, added
+
+
+def _fts_query(terms: Iterable[str]) -> str:
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+class CodeIndex:
+    """
+    On-disk symbol table and BM25 index of one repository at one commit.
+
+    The index is a SQLite file read through a memory map, so lookups on a warm container
+    cost page-cache reads rather than queries against a rebuilt in-memory structure.
+    Updating to a new commit re-indexes only the files whose blob changed.
+    """
+
+    def __init__(self, path: str, mmap_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA mmap_size={int(mmap_bytes)}")
+        self._create_schema()
+
+    def _create_schema(self):
+        version = None
+        try:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            version = row[0] if row else None
+        except sqlite3.OperationalError:
+            pass
+        if version not in (None, SCHEMA_VERSION):
+            for table in ("symbol_search", "symbols", "refs", "files", "meta"):
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('schema', ?)", (SCHEMA_VERSION,))
+
+    @property
+    def indexed_commit(self) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'commit'").fetchone()
+        return row[0] if row else None
+
+    def indexed_blobs(self) -> Dict[str, str]:
+        return dict(self._conn.execute("SELECT path, blob_sha FROM files"))
+
+    def _remove_file(self, path: str) -> None:
+        self._conn.execute("DELETE FROM symbols WHERE path = ?", (path,))
+        self._conn.execute("DELETE FROM refs WHERE path = ?", (path,))
+        self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def _index_file(self, path: str, blob_sha: str, source: str) -> None:
+        self._remove_file(path)
+        symbols, refs = extract_symbols(path, source)
+        lines = source.splitlines()
+        self._conn.executemany(
+            "INSERT INTO symbols (path, name, kind, start_line, end_line, body) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (path, name, kind, start, end, "\n".join(lines[start - 1:end])[:MAX_SYMBOL_CHARS])
+                for name, kind, start, end in symbols
+            ],
+        )
+        self._conn.executemany(
+            "INSERT INTO refs (name, path, line, text) VALUES (?, ?, ?, ?)",
+            [(name, path, line, text[:MAX_REF_TEXT_CHARS]) for name, line, text in refs],
+        )
+        self._conn.execute("INSERT INTO files (path, blob_sha) VALUES (?, ?)", (path, blob_sha))
+
+    def apply(self, commit: Optional[str], changed: Iterable[Tuple[str, str, str]], removed: Iterable[str]) -> None:
+        """
+        Records the index as being at commit after applying file changes, in one transaction.
+
+        Args:
+            commit (str): The commit the index describes afterwards, or None to apply a batch
+                of an update that is not complete yet.
+            changed (iterable): (path, blob_sha, source) of files added or modified since the indexed commit.
+            removed (iterable): Paths of files that no longer exist or are no longer indexed.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                for path in removed:
+                    self._remove_file(path)
+                for path, blob_sha, source in changed:
+                    self._index_file(path, blob_sha, source)
+                if commit is not None:
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('commit', ?)", (commit,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def enclosing_symbol(self, path: str, line: int) -> Optional[tuple]:
+        """The innermost symbol of path spanning line, as (id, name, kind, path, start_line, end_line, body)."""
+        return self._conn.execute(
+            "SELECT id, name, kind, path, start_line, end_line, body FROM symbols"
+            " WHERE path = ? AND start_line <= ? AND end_line >= ? ORDER BY end_line - start_line LIMIT 1",
+            (path, line, line),
+        ).fetchone()
+
+    def definitions(self, name: str, limit: int = MAX_DEFINITIONS) -> List[tuple]:
+        return self._conn.execute(
+            "SELECT id, name, kind, path, start_line, end_line, body FROM symbols WHERE name = ? LIMIT ?",
+            (name, limit),
+        ).fetchall()
+
+    def call_sites(self, name: str, limit: int = MAX_CALL_SITES) -> List[tuple]:
+        return self._conn.execute(
+            "SELECT path, line, text FROM refs WHERE name = ? ORDER BY path, line LIMIT ?", (name, limit)
+        ).fetchall()
+
+    def search(self, terms: List[str], limit: int = MAX_SEARCH_RESULTS) -> List[tuple]:
+        """Symbols best matching any of terms, ranked by BM25."""
+        if not terms:
+            return []
+        return self._conn.execute(
+            "SELECT s.id, s.name, s.kind, s.path, s.start_line, s.end_line, s.body"
+            " FROM symbol_search JOIN symbols s ON s.id = symbol_search.rowid"
+            " WHERE symbol_search MATCH ? ORDER BY bm25(symbol_search) LIMIT ?",
+            (_fts_query(terms), limit),
+        ).fetchall()
+
+    def related_context(self, files: List[dict], max_tokens: int) -> str:
+        """
+        Collects indexed code related to a changeset, most relevant first, within max_tokens.
+
+        In order: the functions enclosing each change as they read at the indexed commit,
+        the call sites of those functions, the definitions of functions the added lines call,
+        and the best BM25 matches for the identifiers in the added lines.
+
+        Args:
+            files (list): File records of the changeset.
+            max_tokens (int): Token budget of the returned context.
+
+        Returns:
+            str: Markdown sections of related code, or an empty string.
+        """
+        enclosing = {}
+        called = {}
+        identifiers = {}
+        for file in files:
+            if file.get("status") == "removed" or not file.get("patch"):
+                continue
+            numbers, added = _changed_lines(file["patch"])
+            for number in numbers:
+                symbol = self.enclosing_symbol(file["filename"], number)
+                if symbol is not None:
+                    enclosing.setdefault(symbol[0], symbol)
+            for line in added:
+                for name in _CALL.findall(line):
+                    if name not in STOP_IDENTIFIERS:
+                        called[name] = None
+                for name in _IDENTIFIER.findall(line):
+                    if len(name) > 2 and name not in STOP_IDENTIFIERS:
+                        identifiers[name] = identifiers.get(name, 0) + 1
+
+        sections = []
+        seen = set(enclosing)
+        # A changed function says more than the whole class around a changed docstring or attribute.
+        for symbol in sorted(enclosing.values(), key=lambda symbol: symbol[2] != "function"):
+            sections.append(_format_symbol("Changed code in", symbol))
+        for symbol in enclosing.values():
+            if symbol[2] != "function":
+                continue
+            sites = [site for site in self.call_sites(symbol[1]) if not (site[0] == symbol[3] and symbol[4] <= site[1] <= symbol[5])]
+            if sites:
+                sections.append(f"#### Call sites of `{symbol[1]}`\n" + "\n".join(f"{path}:{line}: {text}" for path, line, text in sites))
+        for name in called:
+            for symbol in self.definitions(name):
+                if symbol[0] not in seen:
+                    seen.add(symbol[0])
+                    sections.append(_format_symbol("Definition of", symbol))
+        terms = sorted(identifiers, key=identifiers.get, reverse=True)[:MAX_SEARCH_TERMS]
+        for symbol in self.search(terms):
+            if symbol[0] not in seen:
+                seen.add(symbol[0])
+                sections.append(_format_symbol("Related", symbol))
+
+        context = []
+        remaining = max_tokens
+        for section in sections:
+            tokens = count_tokens(section)
+            if tokens <= remaining:
+                context.append(section)
+                remaining -= tokens
+        return "\n\n".join(context)
+
+
+def _format_symbol(label: str, symbol: tuple) -> str:
+    _, name, kind, path, start, end, body = symbol
+    return f"#### {label} {kind} `{name}` ({path}:{start}-{end})\n```\n{body}\n```"
+
+
+def _fetch_tree(repository_full_name: str, commit: str, github_token: Optional[str]) -> Dict[str, str]:
+    """Lists the indexable files of a commit as {path: blob_sha} with one recursive tree call."""
+    from github_http import get_github_client
+
+    url = f"{config.GITHUB_API_URL}/repos/{repository_full_name}/git/trees/{commit}"
+    response = get_github_client().get(url, token=github_token, params={'recursive': '1'})
+    response.raise_for_status()
+    tree = response.json()
+    if tree.get('truncated'):
+        print(f"The tree of {repository_full_name} is too large to list at once; indexing the part GitHub returned.")
+    blobs = {
+        entry['path']: entry['sha']
+        for entry in tree.get('tree', [])
+        if entry.get('type') == 'blob' and is_indexable(entry['path'], entry.get('size') or 0)
+    }
+    if len(blobs) > config.CODE_INDEX_MAX_FILES:
+        print(f"Indexing the first {config.CODE_INDEX_MAX_FILES} of {len(blobs)} source files of {repository_full_name}.")
+        blobs = dict(sorted(blobs.items())[:config.CODE_INDEX_MAX_FILES])
+    return blobs
+
+
+def _fetch_blob(repository_full_name: str, blob_sha: str, github_token: Optional[str]) -> str:
+    from github_http import get_github_client
+
+    url = f"{config.GITHUB_API_URL}/repos/{repository_full_name}/git/blobs/{blob_sha}"
+    # Streamed so the client's ETag cache does not hold on to every file of the repository.
+    response = get_github_client().get(
+        url, token=github_token, headers={'Accept': 'application/vnd.github.raw'}, stream=True
+    )
+    response.raise_for_status()
+    return response.content.decode("utf-8", errors="replace")
+
+
+def update_code_index(index: CodeIndex, repository_full_name: str, commit: str, github_token: Optional[str] = None) -> int:
+    """
+    Brings index up to commit, fetching only the files whose blob changed.
+
+    Files are committed in batches of INDEX_BATCH_FILES as they arrive, so a first build
+    that runs out of time resumes where it stopped on the next review. Files that fail to
+    fetch are skipped; the index is only marked as being at commit once every file made it
+    in, so the next update retries just those.
+
+    Returns:
+        int: The number of files (re)indexed.
+    """
+    if index.indexed_commit == commit:
+        return 0
+    wanted = _fetch_tree(repository_full_name, commit, github_token)
+    indexed = index.indexed_blobs()
+    removed = [path for path in indexed if path not in wanted]
+    stale = {path: sha for path, sha in wanted.items() if indexed.get(path) != sha}
+    index.apply(None, [], removed)
+
+    indexed_count = 0
+    failed = []
+    batch = []
+    with ThreadPoolExecutor(max_workers=max(1, config.CODE_INDEX_FETCH_CONCURRENCY)) as executor:
+        futures = {
+            executor.submit(_fetch_blob, repository_full_name, sha, github_token): (path, sha)
+            for path, sha in stale.items()
+        }
+        try:
+            for future in as_completed(futures):
+                path, sha = futures[future]
+                try:
+                    batch.append((path, sha, future.result()))
+                except Exception as e:
+                    failed.append(path)
+                    print(f"Failed to fetch {path} for the code index: {e}")
+                    continue
+                if len(batch) >= INDEX_BATCH_FILES:
+                    index.apply(None, batch, [])
+                    indexed_count += len(batch)
+                    batch = []
+        finally:
+            # Stop fetching if indexing fails or the caller is interrupted.
+            for future in futures:
+                future.cancel()
+    index.apply(None if failed else commit, batch, [])
+    indexed_count += len(batch)
+    print(
+        f"Code index of {repository_full_name} at {commit[:7]}: {indexed_count} file(s) indexed, "
+        f"{len(removed)} removed, {len(failed)} failed."
+    )
+    return indexed_count
+
+
+@lru_cache(maxsize=32)
+def get_code_index(repository_full_name: str) -> CodeIndex:
+    """Returns the code index of a repository, kept open across warm invocations."""
+    filename = repository_full_name.replace("/", "__") + ".db"
+    return CodeIndex(os.path.join(config.CODE_INDEX_DIR, filename), config.CODE_INDEX_MMAP_BYTES)
+
+
+def related_code_for_changeset(repository_full_name: str, commit: str, files: List[dict], github_token: Optional[str] = None) -> str:
+    """
+    Updates the repository's code index to commit and returns the code related to files.
+
+    Retrieval only adds context, so failures are logged and yield an empty string.
+
+    Args:
+        repository_full_name (str): The full name of the repository (e.g., owner/repo).
+        commit (str): The head commit of the PR.
+        files (list): File records of the changeset.
+        github_token (str, optional): GitHub access token.
+
+    Returns:
+        str: Related code within CODE_CONTEXT_MAX_TOKENS, or an empty string.
+    """
+    from metrics import timed
+
+    try:
+        index = get_code_index(repository_full_name)
+        with timed("code_index.update"):
+            update_code_index(index, repository_full_name, commit, github_token)
+        with timed("code_index.lookup"):
+            return index.related_context(files, config.CODE_CONTEXT_MAX_TOKENS)
+    except Exception as e:
+        print(f"Failed to retrieve related code for {repository_full_name}: {e}")
+        return ""
@@ -0,0 +1,194 @@
+import fnmatch
+import heapq
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Tuple
+from chunking import split_patch_into_hunks
+from tokenizer import count_tokens
+from triage import WHITESPACE_INSENSITIVE, file_extension
+
+GENERATED_MARKERS = ("@generated", "DO NOT EDIT", "auto-generated", "autogenerated")
+# Added lines longer than this are treated as minified or bundled output.
+MINIFIED_LINE_LENGTH = 500
+# Stands in for the unchanged lines _shrink_context removes from a hunk.
+_OMITTED_LINES = re.compile(r"^ \.\.\. \((\d+) unchanged lines\)$")
+
+
+@dataclass
+class CompactionReport:
+    original_tokens: int = 0
+    compacted_tokens: int = 0
+    summarized_files: List[str] = field(default_factory=list)
+    dropped_hunks: int = 0
+
+    @property
+    def saved_tokens(self) -> int:
+        return self.original_tokens - self.compacted_tokens
+
+
+def _file_tokens(file: dict) -> int:
+    return count_tokens(file["filename"]) + count_tokens(file["patch"])
+
+
+def _line_stats(patch: str) -> Tuple[int, int]:
+    lines = patch.splitlines()
+    added = sum(1 for line in lines if line.startswith("+"))
+    removed = sum(1 for line in lines if line.startswith("-"))
+    return added, removed
+
+
+def _summarize(file: dict, reason: str, line_stats: Tuple[int, int] = None) -> dict:
+    added, removed = line_stats or _line_stats(file["patch"])
+    return dict(file, patch=f"({reason}: +{added} -{removed} lines, patch omitted)")
+
+
+def _low_value_reason(file: dict, exclude_globs: List[str]):
+    filename = file["filename"]
+    basename = filename.rsplit("/", 1)[-1]
+    for pattern in exclude_globs:
+        if fnmatch.fnmatch(filename, pattern) or fnmatch.fnmatch(basename, pattern):
+            return f"matches `{pattern}`"
+    head = file["patch"][:1000]
+    if any(marker in head for marker in GENERATED_MARKERS):
+        return "generated code"
+    if any(len(line) > MINIFIED_LINE_LENGTH for line in file["patch"].splitlines() if line.startswith("+")):
+        return "minified or bundled content"
+    return None
+
+
+def omitted_line_count(line: str) -> Optional[int]:
+    """
+    Returns how many unchanged lines a compacted patch line stands in for, or None for diff lines.
+
+    Needed to keep new-file line numbers right when walking a compacted hunk.
+    """
+    match = _OMITTED_LINES.match(line)
+    return int(match.group(1)) if match else None
+
+
+def _is_whitespace_only(hunk: str) -> bool:
+    lines = hunk.splitlines()[1:]
+    removed = "".join("".join(line[1:].split()) for line in lines if line.startswith("-"))
+    added = "".join("".join(line[1:].split()) for line in lines if line.startswith("+"))
+    return removed == added
+
+
+def _shrink_context(hunk: str, context_lines: int) -> str:
+    """Collapses runs of unchanged lines longer than 2 * context_lines inside a hunk."""
+    lines = hunk.splitlines()
+    header, body = lines[:1], lines[1:]
+    result = list(header)
+    run: List[str] = []
+
+    def flush(is_edge_start: bool, is_edge_end: bool):
+        keep_head = 0 if is_edge_start else context_lines
+        keep_tail = 0 if is_edge_end else context_lines
+        if len(run) > keep_head + keep_tail + 1:
+            result.extend(run[:keep_head])
+            result.append(f" ... ({len(run) - keep_head - keep_tail} unchanged lines)")
+            result.extend(run[len(run) - keep_tail:] if keep_tail else [])
+        else:
+            result.extend(run)
+
+    seen_change = False
+    for line in body:
+        if line.startswith(("+", "-")):
+            flush(not seen_change, False)
+            run = []
+            seen_change = True
+            result.append(line)
+        else:
+            run.append(line)
+    flush(not seen_change, True)
+    return "\n".join(result)
+
+
+def compact_patch(patch: str, context_lines: int, filename: str = "") -> Tuple[str, int]:
+    """
+    Drops whitespace-only hunks and shrinks long unchanged regions of a patch.
+
+    Whitespace-only hunks are only dropped in languages where indentation carries no
+    meaning; in Python, YAML or a Makefile a re-indented line can change behaviour.
+
+    Args:
+        patch (str): The patch of a single file.
+        context_lines (int): Unchanged lines to keep on each side of a change.
+        filename (str): The file's path, which decides whether whitespace matters.
+
+    Returns:
+        tuple: The compacted patch and the number of hunks dropped.
+    """
+    drop_whitespace = file_extension(filename) in WHITESPACE_INSENSITIVE
+    kept = []
+    dropped = 0
+    for hunk in split_patch_into_hunks(patch):
+        if drop_whitespace and hunk.startswith("@@") and _is_whitespace_only(hunk):
+            dropped += 1
+            continue
+        kept.append(_shrink_context(hunk, context_lines))
+    return "\n".join(kept), dropped
+
+
+def compact_changeset(files: Iterable[dict], exclude_globs: List[str], context_lines: int, token_budget: int) -> Tuple[List[dict], CompactionReport]:
+    """
+    Removes low-value content from a changeset before it is sent to the model.
+
+    Lockfiles, vendored paths, generated and minified files are reduced to a one-line
+    summary, whitespace-only hunks of whitespace-insensitive languages are dropped and
+    long context regions are shrunk. Whenever the running total goes over the token
+    budget, the largest files kept so far are summarized until it fits, so a streamed
+    changeset never holds much more than the budget in memory.
+
+    Args:
+        files (iterable): File records, e.g. from get_changeset_files or iter_changeset_files.
+        exclude_globs (list): Glob patterns of files to summarize instead of review.
+        context_lines (int): Unchanged lines to keep on each side of a change.
+        token_budget (int): Maximum total tokens of the compacted changeset; 0 disables the cap.
+
+    Returns:
+        tuple: The compacted file records and a CompactionReport.
+    """
+    report = CompactionReport()
+    compacted = []
+    file_tokens = []
+    # Line counts of the original patches, kept for budget summaries instead of the patches
+    line_stats = []
+    # Max-heap of (-tokens, index) over files that still carry a patch
+    largest = []
+    total = 0
+    for file in files:
+        report.original_tokens += _file_tokens(file)
+        reason = _low_value_reason(file, exclude_globs)
+        if reason:
+            compacted.append(_summarize(file, reason))
+            report.summarized_files.append(file["filename"])
+        else:
+            patch, dropped = compact_patch(file["patch"], context_lines, file["filename"])
+            report.dropped_hunks += dropped
+            if not patch and dropped:
+                compacted.append(dict(file, patch="(whitespace-only changes, patch omitted)"))
+            else:
+                compacted.append(dict(file, patch=patch))
+                heapq.heappush(largest, (-_file_tokens(compacted[-1]), len(compacted) - 1))
+        file_tokens.append(_file_tokens(compacted[-1]))
+        line_stats.append(_line_stats(file["patch"]))
+        total += file_tokens[-1]
+
+        while token_budget and total > token_budget and largest:
+            _, index = heapq.heappop(largest)
+            kept = compacted[index]
+            summary = _summarize(kept, "over the review token budget", line_stats[index])
+            if _file_tokens(summary) >= file_tokens[index]:
+                continue
+            total += _file_tokens(summary) - file_tokens[index]
+            file_tokens[index] = _file_tokens(summary)
+            compacted[index] = summary
+            report.summarized_files.append(kept["filename"])
+
+    report.compacted_tokens = total
+    print(
+        f"Compacted changeset from {report.original_tokens} to {report.compacted_tokens} tokens "
+        f"(saved {report.saved_tokens}); summarized {len(report.summarized_files)} file(s), "
+        f"dropped {report.dropped_hunks} whitespace-only hunk(s)."
+    )
+    return compacted, report
@@ -2,10 +2,139 @@ import os
 
 # Configuration and constants
 class Config:
-    def __init__(self):
+    """
+    Settings read from the environment on first access rather than at import time, so
+    modules can be imported (and cheap code paths run) before the environment is complete.
+    """
+
+    def __getattr__(self, name):
+        # Only reached for attributes that are not set yet.
+        if name.startswith("__") or self.__dict__.get("_loaded"):
+            raise AttributeError(name)
+        self._load()
+        return getattr(self, name)
+
+    def _load(self):
+        self._loaded = True
+        # Values assigned before the first read (e.g. config.TEST_MODE = True) win over the environment.
+        overrides = dict(self.__dict__)
         self.GITHUB_ACCESS_TOKEN = os.getenv("GITHUB_ACCESS_TOKEN")
         self.OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
         self.TEST_MODE = os.getenv("TEST_MODE", "False") == "True"
+        # GitHub API endpoint and HTTP behaviour of the shared GitHub client
+        self.GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+        self.GITHUB_CONNECT_TIMEOUT_SECONDS = float(os.getenv("GITHUB_CONNECT_TIMEOUT_SECONDS", "3.05"))
+        self.GITHUB_READ_TIMEOUT_SECONDS = float(os.getenv("GITHUB_READ_TIMEOUT_SECONDS", "10"))
+        self.GITHUB_MAX_RETRIES = int(os.getenv("GITHUB_MAX_RETRIES", "3"))
+        self.GITHUB_MAX_BACKOFF_SECONDS = float(os.getenv("GITHUB_MAX_BACKOFF_SECONDS", "30"))
+        # GitHub App credentials; when set, reviews use installation tokens minted per installation
+        # instead of GITHUB_ACCESS_TOKEN, refreshed this many seconds before they expire
+        self.GITHUB_APP_ID = os.getenv("GITHUB_APP_ID", "")
+        self.GITHUB_APP_PRIVATE_KEY = os.getenv("GITHUB_APP_PRIVATE_KEY", "")
+        self.GITHUB_TOKEN_REFRESH_SECONDS = float(os.getenv("GITHUB_TOKEN_REFRESH_SECONDS", "300"))
+        # Repository access check results kept in memory and, when set, in a shared store
+        # (e.g. sqlite:///tmp/ai-code-review/access.db or dynamodb://repo-access); denials expire sooner
+        self.REPO_ACCESS_CACHE_URL = os.getenv("REPO_ACCESS_CACHE_URL", "")
+        self.REPO_ACCESS_TTL_SECONDS = float(os.getenv("REPO_ACCESS_TTL_SECONDS", "3600"))
+        self.REPO_ACCESS_NEGATIVE_TTL_SECONDS = float(os.getenv("REPO_ACCESS_NEGATIVE_TTL_SECONDS", "300"))
+        # Requests in flight at once per host (0 is unlimited)
+        self.GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", "0"))
+        # Model calls in flight at once per model, the ceiling of the rate limiter's adaptive limit (0 is 64)
+        self.LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+        # Requests and tokens per minute per model ("o1-mini=500:200000;gpt-4o-mini=5000:2000000").
+        # Budgets are also learned from the rate limit headers, so these only matter for the first calls.
+        self.LLM_RATE_LIMITS = {
+            model.strip(): tuple(float(limit) for limit in limits.split(":"))
+            for model, _, limits in (
+                entry.partition("=") for entry in os.getenv("LLM_RATE_LIMITS", "").split(";") if entry.strip()
+            )
+        }
+        self.LLM_RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+        # (repository, PR) -> bot comment ID index; empty disables it
+        self.COMMENT_INDEX_URL = os.getenv("COMMENT_INDEX_URL", "sqlite:///tmp/ai-code-review/comment-index.db")
+        # Queue for background review workers (an SQS queue URL or sqlite:///path); empty reviews inline
+        self.REVIEW_QUEUE_URL = os.getenv("REVIEW_QUEUE_URL", "")
+        # Latest head SHA per PR, used to coalesce bursts of pushes; empty disables coalescing. With
+        # an SQS queue it must be shared by the webhook and worker Lambdas (dynamodb://table-name).
+        # The debounce is a free queue delay when queued, but a sleep in every inline review.
+        self.EVENT_STORE_URL = os.getenv("EVENT_STORE_URL", "sqlite:///tmp/ai-code-review/events.db")
+        self.DEBOUNCE_SECONDS = float(os.getenv("DEBOUNCE_SECONDS", "5" if self.REVIEW_QUEUE_URL else "0"))
+        # Webhook server (server.py): the secret deliveries are signed with, reviews run at once,
+        # and reviews waiting for a slot before deliveries are turned away with 503
+        self.WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+        self.SERVER_MAX_CONCURRENT_REVIEWS = int(os.getenv("SERVER_MAX_CONCURRENT_REVIEWS", "8"))
+        self.SERVER_MAX_PENDING_REVIEWS = int(os.getenv("SERVER_MAX_PENDING_REVIEWS", "100"))
+        # Review only the commits pushed since the head recorded in the bot comment
+        self.INCREMENTAL_REVIEW = os.getenv("INCREMENTAL_REVIEW", "True") == "True"
+        # Post a placeholder comment and update it while the review streams in
+        self.STREAM_REVIEW = os.getenv("STREAM_REVIEW", "False") == "True"
+        self.STREAM_UPDATE_INTERVAL_SECONDS = float(os.getenv("STREAM_UPDATE_INTERVAL_SECONDS", "3"))
+        # Run the review stages concurrently on the async OpenAI client
+        self.ASYNC_REVIEW = os.getenv("ASYNC_REVIEW", "False") == "True"
+        # Add the detailed review and code suggestion stages (async mode only)
+        self.DETAILED_REVIEW = os.getenv("DETAILED_REVIEW", "False") == "True"
+        # Post code suggestions as one PR review with inline suggestion blocks
+        self.INLINE_SUGGESTIONS = os.getenv("INLINE_SUGGESTIONS", "True") == "True"
+        # Per-file review cache, e.g. sqlite:///tmp/review-cache.db or dynamodb://review-cache
+        self.REVIEW_CACHE_URL = os.getenv("REVIEW_CACHE_URL", "")
+        self.REVIEW_CACHE_TTL_SECONDS = float(os.getenv("REVIEW_CACHE_TTL_SECONDS", str(14 * 24 * 3600)))
+        self.REVIEW_CACHE_MAX_ENTRIES = int(os.getenv("REVIEW_CACHE_MAX_ENTRIES", "10000"))
+        # Token budget per review chunk and how many chunks are reviewed at once
+        self.CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "12000"))
+        self.CHUNK_CONCURRENCY = int(os.getenv("CHUNK_CONCURRENCY", "4"))
+        # Merged chunk feedback above this size is condensed with one more model call
+        self.MERGED_FEEDBACK_MAX_TOKENS = int(os.getenv("MERGED_FEEDBACK_MAX_TOKENS", "4000"))
+        # Leave formatting, comment, docstring, import order and version bump changes and pure
+        # renames out of the review, listing them in the comment instead
+        self.TRIAGE_TRIVIAL_CHANGES = os.getenv("TRIAGE_TRIVIAL_CHANGES", "True") == "True"
+        # Diff compaction: files summarized instead of reviewed, context kept around changes
+        # and the total token budget of a review (0 disables the cap)
+        self.COMPACT_EXCLUDE_GLOBS = [
+            pattern.strip()
+            for pattern in os.getenv(
+                "COMPACT_EXCLUDE_GLOBS",
+                "*.lock,package-lock.json,pnpm-lock.yaml,go.sum,*.min.js,*.min.css,*.map,"
+                "vendor/*,third_party/*,node_modules/*,dist/*,*_pb2.py,*.pb.go,*.snap",
+            ).split(",")
+            if pattern.strip()
+        ]
+        self.COMPACT_CONTEXT_LINES = int(os.getenv("COMPACT_CONTEXT_LINES", "3"))
+        self.REVIEW_TOKEN_BUDGET = int(os.getenv("REVIEW_TOKEN_BUDGET", "100000"))
+        # Local git mirror: bare blobless clones under GIT_MIRROR_DIR replace the GitHub API as
+        # the changeset source (empty disables it); {repository} is the repository's full name
+        self.GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR", "")
+        self.GIT_MIRROR_REMOTE_URL = os.getenv("GIT_MIRROR_REMOTE_URL", "https://github.com/{repository}.git")
+        self.GIT_MIRROR_TIMEOUT_SECONDS = float(os.getenv("GIT_MIRROR_TIMEOUT_SECONDS", "300"))
+        self.GIT_DIFF_CONTEXT_LINES = int(os.getenv("GIT_DIFF_CONTEXT_LINES", "3"))
+        # Code index giving code suggestions the functions around each change, their call sites
+        # and related definitions; empty disables it. Only used with DETAILED_REVIEW.
+        self.CODE_INDEX_DIR = os.getenv("CODE_INDEX_DIR", "")
+        self.CODE_INDEX_MAX_FILES = int(os.getenv("CODE_INDEX_MAX_FILES", "1500"))
+        self.CODE_INDEX_FETCH_CONCURRENCY = int(os.getenv("CODE_INDEX_FETCH_CONCURRENCY", "8"))
+        self.CODE_INDEX_MMAP_BYTES = int(os.getenv("CODE_INDEX_MMAP_BYTES", str(256 * 1024 * 1024)))
+        self.CODE_CONTEXT_MAX_TOKENS = int(os.getenv("CODE_CONTEXT_MAX_TOKENS", "4000"))
+        # Model routing: "openai" or the offline "stub" provider, per-stage candidate models
+        # ("feedback=gpt-4o-mini,o1-mini;summary=gpt-4o-mini"), and the latency SLO, cost
+        # budget (USD) per call and hard timeout used to choose between them (0 disables)
+        self.LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")
+        self.STAGE_MODELS = {
+            stage.strip(): [model.strip() for model in models.split(",") if model.strip()]
+            for stage, _, models in (
+                entry.partition("=") for entry in os.getenv("STAGE_MODELS", "").split(";") if entry.strip()
+            )
+        }
+        self.LLM_LATENCY_SLO_SECONDS = float(os.getenv("LLM_LATENCY_SLO_SECONDS", "60"))
+        self.LLM_MAX_COST_PER_CALL = float(os.getenv("LLM_MAX_COST_PER_CALL", "0"))
+        self.LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "300")) or None
+        self.STUB_LLM_LATENCY_SECONDS = float(os.getenv("STUB_LLM_LATENCY_SECONDS", "0"))
+        self.STUB_LLM_FAILURE_RATE = float(os.getenv("STUB_LLM_FAILURE_RATE", "0"))
+        # Per-invocation timing, token and cost metrics printed as CloudWatch EMF, and an
+        # optional cProfile run of each invocation (printed, or dumped to PROFILE_OUTPUT_DIR)
+        self.METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+        self.METRICS_NAMESPACE = os.getenv("METRICS_NAMESPACE", "AICodeReview")
+        self.PROFILE_INVOCATIONS = os.getenv("PROFILE_INVOCATIONS", "False") == "True"
+        self.PROFILE_OUTPUT_DIR = os.getenv("PROFILE_OUTPUT_DIR", "")
+        self.__dict__.update(overrides)
 
 # Singleton instance
 config = Config()
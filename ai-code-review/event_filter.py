@@ -0,0 +1,124 @@
+import json
+import time
+from functools import lru_cache
+from config import config
+from storage import KeyValueStore, create_store
+
+# Pull request actions that change the code under review.
+REVIEWABLE_ACTIONS = {"opened", "reopened", "synchronize", "ready_for_review"}
+
+
+def should_review_event(body):
+    """
+    Decides whether a webhook payload warrants a review.
+
+    Args:
+        body (dict): Parsed webhook body.
+
+    Returns:
+        tuple: (bool, str) whether to review and the reason when not.
+    """
+    action = body.get('action')
+    if action not in REVIEWABLE_ACTIONS:
+        return False, f"action '{action}' does not change the code"
+    pr_details = body.get('pull_request') or {}
+    if pr_details.get('state', 'open') != 'open':
+        return False, "pull request is not open"
+    return True, ""
+
+
+class ReviewCoalescer:
+    """
+    Coalesces bursts of webhook events for the same PR so only the newest head commit is reviewed.
+
+    The store holds the latest head SHA seen per (repository, PR), plus a claim per head
+    SHA that only the first delivery of a push can take. A review registers its head SHA, waits for the debounce window to pass, and is dropped if a newer push arrived
+    in the meantime or arrives before its comment is posted.
+    """
+
+    def __init__(self, store: KeyValueStore, debounce_seconds: float = 0, ttl: float = 24 * 3600):
+        self.store = store
+        self.debounce_seconds = debounce_seconds
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(repository_full_name, pr_number):
+        return f"head:{repository_full_name}#{pr_number}"
+
+    @staticmethod
+    def _claim_key(repository_full_name, pr_number, head_sha):
+        return f"claim:{repository_full_name}#{pr_number}@{head_sha}"
+
+    def _state(self, repository_full_name, pr_number):
+        value = self.store.get(self._key(repository_full_name, pr_number))
+        return json.loads(value) if value else None
+
+    def _set_state(self, repository_full_name, pr_number, head_sha, status):
+        self.store.set(
+            self._key(repository_full_name, pr_number),
+            json.dumps({"head_sha": head_sha, "status": status, "updated_at": time.time()}),
+            self.ttl,
+        )
+
+    def register(self, repository_full_name, pr_number, head_sha):
+        """
+        Records a new head SHA for the PR.
+
+        Returns:
+            bool: False if this head SHA is already being reviewed or was reviewed.
+        """
+        # Claimed atomically, so of two deliveries of the same push only one gets past here.
+        if not self.store.add(self._claim_key(repository_full_name, pr_number, head_sha), "1", self.ttl):
+            return False
+        self._set_state(repository_full_name, pr_number, head_sha, "pending")
+        return True
+
+    def is_latest(self, repository_full_name, pr_number, head_sha):
+        state = self._state(repository_full_name, pr_number)
+        return state is None or state["head_sha"] == head_sha
+
+    def wait_until_settled(self, repository_full_name, pr_number, head_sha):
+        """
+        Waits out the debounce window.
+
+        Returns:
+            bool: True if head_sha is still the newest push once the window has passed.
+        """
+        if self.debounce_seconds > 0:
+            time.sleep(self.debounce_seconds)
+        return self.is_latest(repository_full_name, pr_number, head_sha)
+
+    async def wait_until_settled_async(self, repository_full_name, pr_number, head_sha):
+        """Like wait_until_settled, but waits on the event loop instead of holding a thread."""
+        # asyncio is only loaded once a review runs, keeping cold starts of ignored events cheap.
+        import asyncio
+
+        if self.debounce_seconds > 0:
+            await asyncio.sleep(self.debounce_seconds)
+        return await asyncio.to_thread(self.is_latest, repository_full_name, pr_number, head_sha)
+
+    def mark_reviewed(self, repository_full_name, pr_number, head_sha):
+        if self.is_latest(repository_full_name, pr_number, head_sha):
+            self._set_state(repository_full_name, pr_number, head_sha, "reviewed")
+
+    def release(self, repository_full_name, pr_number, head_sha):
+        """Forgets a head SHA whose review failed so a redelivery can retry it."""
+        if self.is_latest(repository_full_name, pr_number, head_sha):
+            self.store.delete(self._key(repository_full_name, pr_number))
+            self.store.delete(self._claim_key(repository_full_name, pr_number, head_sha))
+
+
+@lru_cache(maxsize=1)
+def get_review_coalescer():
+    """
+    Returns the process-wide coalescer, or None when EVENT_STORE_URL is unset.
+    """
+    if not config.EVENT_STORE_URL:
+        return None
+    if config.REVIEW_QUEUE_URL.startswith("https://") and not config.EVENT_STORE_URL.startswith("dynamodb://"):
+        # Each Lambda has its own /tmp, so the worker would never see the webhook's records.
+        print(
+            f"EVENT_STORE_URL ({config.EVENT_STORE_URL}) is local to this Lambda, but reviews are queued "
+            "to other Lambdas; set it to a dynamodb:// table so pushes are coalesced across them."
+        )
+    return ReviewCoalescer(create_store(config.EVENT_STORE_URL), config.DEBOUNCE_SECONDS)
@@ -0,0 +1,226 @@
+import base64
+import os
+import subprocess
+import threading
+from functools import lru_cache
+from typing import Iterator, List, Optional, Tuple
+from config import config
+from changeset_stream import MAX_FETCHED_PATCH_CHARS
+from metrics import timed
+
+
+class GitMirrorError(Exception):
+    """A git command on a mirror failed."""
+
+
+def _path_from_header(line: str) -> str:
+    # "diff --git a/<path> b/<path>": both paths are equal unless the file was renamed,
+    # which the rename lines then correct, so split in the middle rather than at " b/".
+    paths = line[len("diff --git "):]
+    return paths[2:2 + (len(paths) - 5) // 2]
+
+
+def parse_diff(lines) -> Iterator[dict]:
+    """
+    Parses `git diff` output into file records in the format of parse_comparison.
+
+    Like the GitHub API, a patch starts at its first hunk header, binary files and pure
+    renames have an empty patch, and patches are cut off after MAX_FETCHED_PATCH_CHARS.
+
+    Args:
+        lines (iterable): Lines of `git diff` output, with or without line endings.
+
+    Yields:
+        dict: File records with filename, status, patch and previous_filename.
+    """
+    record = None
+    patch: List[str] = []
+    size = 0
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith("diff --git "):
+            if record is not None:
+                yield dict(record, patch="\n".join(patch))
+            record = {'filename': _path_from_header(line), 'status': 'modified', 'patch': '', 'previous_filename': None}
+            patch = []
+            size = 0
+        elif record is None:
+            continue
+        elif patch or line.startswith("@@"):
+            if size <= MAX_FETCHED_PATCH_CHARS:
+                size += len(line) + 1
+                patch.append(line if size <= MAX_FETCHED_PATCH_CHARS else "(patch truncated)")
+        elif line.startswith("new file mode"):
+            record['status'] = 'added'
+        elif line.startswith("deleted file mode"):
+            record['status'] = 'removed'
+        elif line.startswith("rename from "):
+            record['status'] = 'renamed'
+            record['previous_filename'] = line[len("rename from "):]
+        elif line.startswith("rename to "):
+            record['filename'] = line[len("rename to "):]
+    if record is not None:
+        yield dict(record, patch="\n".join(patch))
+
+
+class GitMirror:
+    """
+    Bare, blobless partial clone of one repository, kept on disk across reviews.
+
+    Fetches bring in only the commits and trees that are new since the last one; blobs
+    are downloaded on demand when a diff needs them, so a review fetches the contents of
+    the changed files only. One mirror serves every credential: the token of each call is
+    passed to git through the environment, never written to the mirror's config or shown
+    on a command line.
+    """
+
+    def __init__(self, path: str, remote_url: str, timeout: float = 300):
+        self.path = path
+        self.remote_url = remote_url
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def _env(self, github_token: Optional[str]) -> dict:
+        env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+        if github_token and self.remote_url.startswith("http"):
+            credentials = base64.b64encode(f"x-access-token:{github_token}".encode()).decode()
+            env.update(
+                GIT_CONFIG_COUNT="1",
+                GIT_CONFIG_KEY_0="http.extraHeader",
+                GIT_CONFIG_VALUE_0=f"Authorization: Basic {credentials}",
+            )
+        return env
+
+    def _git(self, *args, github_token: Optional[str] = None, check: bool = True) -> subprocess.CompletedProcess:
+        result = subprocess.run(
+            ["git", "-C", self.path, *args],
+            env=self._env(github_token), capture_output=True, text=True, timeout=self.timeout,
+        )
+        if check and result.returncode != 0:
+            raise GitMirrorError(f"git {args[0]} failed: {result.stderr.strip()}")
+        return result
+
+    def _ensure(self) -> None:
+        if os.path.exists(os.path.join(self.path, "HEAD")):
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self._git("init", "--bare", "--quiet")
+        self._git("remote", "add", "origin", self.remote_url)
+        # Mark the remote as a promisor so missing blobs are fetched lazily from it.
+        self._git("config", "remote.origin.promisor", "true")
+        self._git("config", "remote.origin.partialclonefilter", "blob:none")
+        self._git("config", "core.quotePath", "false")
+
+    def fetch(self, refspecs: List[str], github_token: Optional[str] = None) -> None:
+        """Fetches the refspecs (branches or commit SHAs) without blobs, creating the mirror if needed."""
+        with self._lock:
+            self._ensure()
+            self._git("fetch", "--quiet", "--no-tags", "--filter=blob:none", "origin", *refspecs, github_token=github_token)
+
+    def has_commit(self, sha: str, github_token: Optional[str] = None) -> bool:
+        # A missing object may be looked up on the promisor remote, which needs the token.
+        return self._git("cat-file", "-e", f"{sha}^{{commit}}", github_token=github_token, check=False).returncode == 0
+
+    def is_ancestor(self, ancestor: str, descendant: str) -> bool:
+        return self._git("merge-base", "--is-ancestor", ancestor, descendant, check=False).returncode == 0
+
+    def iter_diff_files(self, revisions: str, context_lines: int, github_token: Optional[str] = None) -> Iterator[dict]:
+        """
+        Yields the file records of a diff, streamed from `git diff`.
+
+        The diff downloads the blobs it needs from the remote, so it is given the token, and
+        is killed after the mirror's timeout like every other git command.
+
+        Args:
+            revisions (str): `base..head`, or `base...head` to diff from their merge base
+                like the compare API.
+            context_lines (int): Unchanged lines around each change.
+            github_token (str, optional): GitHub access token for the blob downloads.
+
+        Raises:
+            GitMirrorError: If git fails or times out, once the output read so far is yielded.
+        """
+        command = [
+            "git", "-C", self.path, "diff", "--no-color", "--no-ext-diff", "--find-renames",
+            f"-U{context_lines}", revisions, "--",
+        ]
+        with subprocess.Popen(
+            command, env=self._env(github_token), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            text=True, encoding="utf-8", errors="replace",
+        ) as process:
+            timed_out = threading.Event()
+            timer = threading.Timer(self.timeout, lambda: (timed_out.set(), process.kill()))
+            timer.start()
+            try:
+                yield from parse_diff(process.stdout)
+                stderr = process.stderr.read()
+            finally:
+                timer.cancel()
+        if timed_out.is_set():
+            raise GitMirrorError(f"git diff timed out after {self.timeout:.0f}s")
+        if process.returncode != 0:
+            raise GitMirrorError(f"git diff failed: {stderr.strip()}")
+
+    def commit_messages(self, base: str, head: str) -> str:
+        """Messages of the commits in head but not in base, oldest first."""
+        output = self._git("log", "--reverse", "--format=%B%x00", f"{base}..{head}").stdout
+        return "\n".join(message.strip() for message in output.split("\0") if message.strip())
+
+
+@lru_cache(maxsize=64)
+def get_git_mirror(repository_full_name: str) -> GitMirror:
+    """
+    Returns the mirror of a repository under GIT_MIRROR_DIR, shared by every review in the process.
+
+    Keyed by repository only, so rotating installation tokens share one mirror and its lock.
+    """
+    return GitMirror(
+        os.path.join(config.GIT_MIRROR_DIR, f"{repository_full_name}.git"),
+        config.GIT_MIRROR_REMOTE_URL.format(repository=repository_full_name),
+        config.GIT_MIRROR_TIMEOUT_SECONDS,
+    )
+
+
+def get_mirror_changeset(repository_full_name, base_branch, head_sha, github_token, since_sha=None) -> Tuple[List[dict], str, Optional[str]]:
+    """
+    Computes a PR's changes from the local mirror instead of the compare API.
+
+    One fetch brings the mirror up to date with the base branch and the head commit. The
+    diff is not truncated like the API's and uses GIT_DIFF_CONTEXT_LINES of context. It is
+    read in full here, so a failing git command surfaces to the caller as a GitMirrorError
+    rather than halfway through the review.
+
+    Args:
+        repository_full_name (str): Full name of the repository.
+        base_branch (str): The PR's base branch.
+        head_sha (str): The PR's head commit.
+        github_token (str): GitHub access token.
+        since_sha (str, optional): The last reviewed head; only the commits after it are
+            diffed when the head still builds on it.
+
+    Returns:
+        tuple: The file records in the format of parse_comparison, the newline
+            separated commit messages, and since_sha if the diff is incremental (else None).
+    """
+    mirror = get_git_mirror(repository_full_name)
+    base_ref = f"refs/remotes/origin/{base_branch}"
+    with timed("git_mirror.fetch"):
+        mirror.fetch([f"+refs/heads/{base_branch}:{base_ref}", head_sha], github_token)
+    if since_sha and not mirror.has_commit(since_sha, github_token):
+        try:
+            mirror.fetch([since_sha], github_token)
+        except GitMirrorError as e:
+            # The last reviewed commit may be gone after a force push.
+            print(f"Failed to fetch {since_sha[:7]}: {e}")
+    if since_sha and mirror.has_commit(since_sha, github_token) and mirror.is_ancestor(since_sha, head_sha):
+        print(f"Reviewing only the commits since {since_sha[:7]}.")
+        base = since_sha
+    else:
+        if since_sha:
+            print(f"Head {head_sha[:7]} does not build on {since_sha[:7]}; reviewing the full PR.")
+        since_sha = None
+        base = base_ref
+    revisions = f"{base}{'..' if since_sha else '...'}{head_sha}"
+    with timed("git_mirror.diff"):
+        files = list(mirror.iter_diff_files(revisions, config.GIT_DIFF_CONTEXT_LINES, github_token))
+    return files, mirror.commit_messages(base, head_sha), since_sha
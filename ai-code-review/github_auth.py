@@ -0,0 +1,206 @@
+import hashlib
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+from config import config
+from storage import KeyValueStore, MemoryStore, create_store
+
+# App JWTs may live 10 minutes; iat is backdated to allow for clock drift.
+JWT_LIFETIME_SECONDS = 540
+JWT_CLOCK_DRIFT_SECONDS = 60
+
+
+class GitHubAuthError(Exception):
+    """No GitHub token could be obtained for a repository."""
+
+
+def _parse_timestamp(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class InstallationTokenProvider:
+    """
+    Mints GitHub App installation tokens and keeps them until shortly before they expire.
+
+    Each installation has its own token and its own rate limit, instead of every review
+    sharing one user token's quota. Tokens (valid for an hour) are cached per installation
+    and replaced refresh_seconds ahead of expiry, so a review never starts with a token
+    that runs out halfway. Concurrent reviews of the same installation wait for one mint
+    instead of each minting their own. Tokens are only held in memory.
+    """
+
+    def __init__(self, app_id: str, private_key: str, refresh_seconds: float = 300):
+        self.app_id = app_id
+        self.private_key = private_key
+        self.refresh_seconds = refresh_seconds
+        self._tokens: Dict[int, Tuple[str, float]] = {}
+        self._installations: Dict[str, int] = {}
+        self._installation_by_token: Dict[str, int] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._jwt: Optional[Tuple[str, float]] = None
+
+    def app_jwt(self) -> str:
+        """The JWT authenticating as the App itself, reused until a minute before it expires."""
+        now = time.time()
+        with self._lock:
+            if self._jwt and self._jwt[1] - now > 60:
+                return self._jwt[0]
+        try:
+            import jwt
+        except ImportError:
+            raise GitHubAuthError("GitHub App authentication needs PyJWT: install the `github-app` extra.")
+        expires_at = now + JWT_LIFETIME_SECONDS
+        token = jwt.encode(
+            {"iat": int(now - JWT_CLOCK_DRIFT_SECONDS), "exp": int(expires_at), "iss": str(self.app_id)},
+            self.private_key,
+            algorithm="RS256",
+        )
+        with self._lock:
+            self._jwt = (token, expires_at)
+        return token
+
+    def _app_request(self, method: str, path: str):
+        from github_http import get_github_client
+
+        response = get_github_client().request(
+            method, f"{config.GITHUB_API_URL}{path}",
+            headers={'Authorization': f'Bearer {self.app_jwt()}'},
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def installation_id(self, repository_full_name: str) -> int:
+        """Looks up, once per process, the installation of the App on a repository."""
+        with self._lock:
+            installation_id = self._installations.get(repository_full_name)
+        if installation_id is None:
+            installation_id = self._app_request('GET', f"/repos/{repository_full_name}/installation")['id']
+            with self._lock:
+                self._installations[repository_full_name] = installation_id
+        return installation_id
+
+    def token(self, installation_id: int) -> str:
+        """Returns a token of the installation with more than refresh_seconds left."""
+        with self._lock:
+            lock = self._locks.setdefault(installation_id, threading.Lock())
+        with lock:
+            cached = self._tokens.get(installation_id)
+            if cached and cached[1] - time.time() > self.refresh_seconds:
+                return cached[0]
+            minted = self._app_request('POST', f"/app/installations/{installation_id}/access_tokens")
+            token, expires_at = minted['token'], _parse_timestamp(minted['expires_at'])
+            with self._lock:
+                if cached:
+                    self._installation_by_token.pop(cached[0], None)
+                self._tokens[installation_id] = (token, expires_at)
+                self._installation_by_token[token] = installation_id
+            print(f"Minted a token for installation {installation_id}, valid until {minted['expires_at']}.")
+            return token
+
+    def installation_for_token(self, token: str) -> Optional[int]:
+        with self._lock:
+            return self._installation_by_token.get(token)
+
+
+@lru_cache(maxsize=1)
+def get_installation_token_provider() -> Optional[InstallationTokenProvider]:
+    """
+    Returns the process-wide installation token provider, or None without GITHUB_APP_ID.
+    """
+    if not config.GITHUB_APP_ID:
+        return None
+    # Keys passed through the environment often have their newlines escaped.
+    private_key = config.GITHUB_APP_PRIVATE_KEY.replace("\\n", "\n")
+    return InstallationTokenProvider(config.GITHUB_APP_ID, private_key, config.GITHUB_TOKEN_REFRESH_SECONDS)
+
+
+def get_github_token(repository_full_name: str, installation_id: Optional[int] = None) -> Optional[str]:
+    """
+    Returns the token to act on a repository with.
+
+    With a GitHub App configured this is an installation token, for the installation named
+    in the webhook or else the one installed on the repository; otherwise it is
+    GITHUB_ACCESS_TOKEN.
+
+    Raises:
+        GitHubAuthError: If the App is configured but no token could be minted.
+    """
+    provider = get_installation_token_provider()
+    if provider is None:
+        return config.GITHUB_ACCESS_TOKEN
+    import requests
+
+    try:
+        return provider.token(installation_id or provider.installation_id(repository_full_name))
+    except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+        raise GitHubAuthError(f"Failed to get an installation token for {repository_full_name}: {e}") from e
+
+
+def credential_key(github_token: Optional[str]) -> str:
+    """
+    Names the credential behind a token without revealing it.
+
+    Installation tokens are named by their installation, so cached results outlive the
+    hourly token rotation; other tokens by a hash, so a new token starts a new cache.
+    """
+    provider = get_installation_token_provider()
+    installation_id = provider.installation_for_token(github_token) if provider and github_token else None
+    if installation_id is not None:
+        return f"installation:{installation_id}"
+    return "token:" + hashlib.sha256((github_token or "").encode()).hexdigest()[:16]
+
+
+class RepoAccessCache:
+    """
+    Remembers whether a credential can access a repository, so the check is not repeated
+    on every review.
+
+    Results are kept in memory for the life of the process and, with a persistent store,
+    shared by every container. Denials are kept for a shorter time than grants, so a
+    newly installed App or granted token is picked up quickly.
+    """
+
+    def __init__(self, store: Optional[KeyValueStore], ttl: float, negative_ttl: float):
+        self.memory = MemoryStore(max_entries=4096)
+        self.store = store
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    @staticmethod
+    def _key(repository_full_name: str, github_token: Optional[str]) -> str:
+        return f"access:{credential_key(github_token)}:{repository_full_name}"
+
+    def get(self, repository_full_name: str, github_token: Optional[str]) -> Optional[bool]:
+        key = self._key(repository_full_name, github_token)
+        value = self.memory.get(key)
+        if value is None and self.store is not None:
+            try:
+                value = self.store.get(key)
+            except Exception as e:
+                print(f"Repository access cache lookup failed: {e}")
+            if value is not None:
+                # The store's entry may be close to expiry; keep the local copy briefly.
+                self.memory.set(key, value, self.negative_ttl)
+        return None if value is None else value == "1"
+
+    def set(self, repository_full_name: str, github_token: Optional[str], has_access: bool) -> None:
+        key = self._key(repository_full_name, github_token)
+        value, ttl = ("1", self.ttl) if has_access else ("0", self.negative_ttl)
+        self.memory.set(key, value, ttl)
+        if self.store is not None:
+            try:
+                self.store.set(key, value, ttl)
+            except Exception as e:
+                print(f"Failed to update the repository access cache: {e}")
+
+
+@lru_cache(maxsize=1)
+def get_repo_access_cache() -> RepoAccessCache:
+    """
+    Returns the process-wide repository access cache, backed by REPO_ACCESS_CACHE_URL when set.
+    """
+    store = create_store(config.REPO_ACCESS_CACHE_URL) if config.REPO_ACCESS_CACHE_URL else None
+    return RepoAccessCache(store, config.REPO_ACCESS_TTL_SECONDS, config.REPO_ACCESS_NEGATIVE_TTL_SECONDS)
@@ -1,14 +1,83 @@
 import requests
 import json
+import threading
+import time
+from functools import lru_cache
 from config import config
-from utils import construct_compare_url, construct_comments_url, construct_comment_url
+from github_http import get_github_client
+from storage import create_store
+from utils import construct_comments_url, construct_comment_url, construct_reviews_url
 
-def verify_repo_access(repository):
+BOT_COMMENT_MARKER = 'Automated Code Review'
+
+
+@lru_cache(maxsize=1)
+def get_comment_index():
+    """
+    Returns the store mapping (repository, PR) to the bot's comment ID, or None when disabled.
+    """
+    if not config.COMMENT_INDEX_URL:
+        return None
+    return create_store(config.COMMENT_INDEX_URL)
+
+def _comment_index_key(repository_full_name, pr_number):
+    return f"comment:{repository_full_name}#{pr_number}"
+
+def remember_bot_comment_id(repository_full_name, pr_number, comment_id):
+    """
+    Records the bot comment ID of a PR in the comment index.
+
+    Args:
+        repository_full_name (str): The full name of the repository (e.g., owner/repo).
+        pr_number (int): The number of the pull request.
+        comment_id (int or None): The comment ID, or None to forget the PR.
+    """
+    index = get_comment_index()
+    if index is None:
+        return
+    try:
+        if comment_id is None:
+            index.delete(_comment_index_key(repository_full_name, pr_number))
+        else:
+            index.set(_comment_index_key(repository_full_name, pr_number), str(comment_id))
+    except Exception as e:
+        print(f"Failed to update the comment index: {e}")
+
+def iter_issue_comments(repository_full_name, pr_number, github_token=None):
+    """
+    Yields the comments of a PR page by page, following the `Link` header.
+
+    Pages are only fetched as the caller consumes them, so stopping early skips the rest.
+
+    Args:
+        repository_full_name (str): The full name of the repository (e.g., owner/repo).
+        pr_number (int): The number of the pull request.
+        github_token (str, optional): GitHub access token; the client's default when omitted.
+
+    Yields:
+        dict: Comment objects in creation order.
+    """
+    url = construct_comments_url(repository_full_name, pr_number)
+    params = {'per_page': 100}
+    while url:
+        response = get_github_client().get(url, token=github_token, params=params)
+        response.raise_for_status()
+        yield from response.json()
+        url = response.links.get('next', {}).get('url')
+        # The next link already carries the query string.
+        params = None
+
+def verify_repo_access(repository, github_token=None):
     """
     Verifies if the GitHub token has access to the specified repository.
 
+    Results are cached per token and repository (see github_auth.RepoAccessCache), so
+    warm invocations skip the API call. Only definite answers are cached: a failure
+    that may be transient, like a rate limit or a timeout, is retried next time.
+
     Args:
         repository (str): The full name of the repository (e.g., owner/repo).
+        github_token (str, optional): GitHub access token; the client's default when omitted.
 
     Returns:
         bool: True if access is verified, False otherwise.
@@ -16,27 +85,37 @@ def verify_repo_access(repository):
     if config.TEST_MODE:
         print(f"TEST_MODE: Skipping repository access verification for '{repository}'.")
         return True
-    repo_url = f"https://api.github.com/repos/{repository}"
-    headers = {
-        'Accept': 'application/vnd.github.v3+json',
-        'Authorization': f'token {config.GITHUB_ACCESS_TOKEN}'
-    }
+    from github_auth import get_repo_access_cache
+
+    cache = get_repo_access_cache()
+    cached = cache.get(repository, github_token)
+    if cached is not None:
+        print(f"Access to repository '{repository}' is {'verified' if cached else 'denied'} (cached).")
+        return cached
+    repo_url = f"{config.GITHUB_API_URL}/repos/{repository}"
     try:
-        response = requests.get(repo_url, headers=headers)
+        response = get_github_client().get(repo_url, token=github_token)
         response.raise_for_status()
         print(f"Access to repository '{repository}' is verified.")
+        cache.set(repository, github_token, True)
         return True
     except requests.exceptions.RequestException as e:
         print(f"Failed to access repository '{repository}': {e}")
+        response = getattr(e, 'response', None)
+        if response is not None and response.status_code in (401, 403, 404) and not (
+            response.headers.get('X-RateLimit-Remaining') == '0' or 'Retry-After' in response.headers
+        ):
+            cache.set(repository, github_token, False)
         return False
 
-def get_bot_comment_id(pr_number, repository_full_name):
+def get_bot_comment_id(pr_number, repository_full_name, github_token=None):
     """
     Retrieves the comment ID if the bot has already commented on the PR.
 
     Args:
         pr_number (int): The number of the pull request.
         repository_full_name (str): The full name of the repository (e.g., owner/repo).
+        github_token (str, optional): GitHub access token; the client's default when omitted.
 
     Returns:
         int or None: The comment ID if the bot has commented, otherwise None.
@@ -45,28 +124,50 @@ def get_bot_comment_id(pr_number, repository_full_name):
         print("TEST_MODE: Skipping retrieval of bot comment ID.")
         return None
 
-    comments_url = construct_comments_url(repository_full_name, pr_number)
-    headers = {
-        'Accept': 'application/vnd.github.v3+json',
-        'Authorization': f'token {config.GITHUB_ACCESS_TOKEN}'
-    }
+    index = get_comment_index()
+    if index is not None:
+        try:
+            indexed_id = index.get(_comment_index_key(repository_full_name, pr_number))
+        except Exception as e:
+            print(f"Comment index lookup failed: {e}")
+            indexed_id = None
+        if indexed_id is not None:
+            print("Found the bot comment in the comment index.")
+            return int(indexed_id)
 
     try:
-        response = requests.get(comments_url, headers=headers)
-        response.raise_for_status()
-        comments = response.json()
-        
         print("Checking comments to see if the bot has already commented.")
-        for comment in comments:
-            comment_body = comment.get('body', '')
-            if 'Automated Code Review' in comment_body:
+        for comment in iter_issue_comments(repository_full_name, pr_number, github_token):
+            comment_body = comment.get('body') or ''
+            if BOT_COMMENT_MARKER in comment_body:
                 print("Bot has already commented on this PR.")
+                remember_bot_comment_id(repository_full_name, pr_number, comment.get('id'))
                 return comment.get('id')
         return None
     except requests.exceptions.RequestException as e:
         print(f"Failed to retrieve comments: {e}")
         return None
 
+def get_comment_body(repository_full_name, comment_id, github_token=None):
+    """
+    Retrieves the body of an issue comment.
+
+    Args:
+        repository_full_name (str): The full name of the repository (e.g., owner/repo).
+        comment_id (int): The comment ID.
+        github_token (str, optional): GitHub access token; the client's default when omitted.
+
+    Returns:
+        str or None: The comment body, or None if it could not be retrieved.
+    """
+    try:
+        response = get_github_client().get(construct_comment_url(repository_full_name, comment_id), token=github_token)
+        response.raise_for_status()
+        return response.json().get('body') or ''
+    except requests.exceptions.RequestException as e:
+        print(f"Failed to retrieve comment {comment_id}: {e}")
+        return None
+
 def post_or_update_comment(repository_full_name, pr_number, review_content, comment_id, github_token, test_mode):
     """
     Posts a new comment or updates an existing comment on the PR.
@@ -80,17 +181,12 @@ def post_or_update_comment(repository_full_name, pr_number, review_content, comm
         test_mode (bool): Flag to indicate if it is in test mode.
 
     Returns:
-        None
+        int or None: The ID of the posted or updated comment, or None if nothing was written.
     """
-    headers = {
-        'Accept': 'application/vnd.github.v3+json',
-        'Authorization': f'token {github_token}'
-    }
-
     if test_mode:
         print("TEST_MODE: Skipping posting comments to GitHub.")
         print(f"Review content:\n{review_content}")
-        return
+        return None
 
     if comment_id:
         # Update the existing comment
@@ -99,11 +195,18 @@ def post_or_update_comment(repository_full_name, pr_number, review_content, comm
             "body": f"**EXPERIMENTAL: Automated Code Review (Updated)**\n\n{review_content}"
         }
         try:
-            update_response = requests.patch(comment_url, headers=headers, data=json.dumps(comment_body))
+            update_response = get_github_client().patch(comment_url, token=github_token, data=json.dumps(comment_body))
+            if update_response.status_code == 404:
+                # The indexed comment was deleted; forget it and post a fresh one.
+                print(f"Comment {comment_id} no longer exists; posting a new comment.")
+                remember_bot_comment_id(repository_full_name, pr_number, None)
+                return post_or_update_comment(repository_full_name, pr_number, review_content, None, github_token, test_mode)
             update_response.raise_for_status()
             print(f"Updated comment on PR #{pr_number}")
+            return comment_id
         except requests.exceptions.RequestException as e:
             print(f"Failed to update comment: {e}")
+            return None
     else:
         # Post a new comment
         comments_url = construct_comments_url(repository_full_name, pr_number)
@@ -111,8 +214,102 @@ def post_or_update_comment(repository_full_name, pr_number, review_content, comm
             "body": f"**EXPERIMENTAL: Automated Code Review**\n\n{review_content}"
         }
         try:
-            comment_response = requests.post(comments_url, headers=headers, data=json.dumps(comment_body))
+            comment_response = get_github_client().post(comments_url, token=github_token, data=json.dumps(comment_body))
             comment_response.raise_for_status()
+            new_comment_id = comment_response.json().get('id')
+            remember_bot_comment_id(repository_full_name, pr_number, new_comment_id)
             print(f"Comment posted successfully to PR #{pr_number}")
+            return new_comment_id
         except requests.exceptions.RequestException as e:
             print(f"Failed to post comment: {e}")
+            return None
+
+def post_pull_request_review(repository_full_name, pr_number, head_sha, body, comments, github_token, test_mode):
+    """
+    Posts a PR review with its inline comments in a single request.
+
+    Args:
+        repository_full_name (str): The full name of the repository (e.g., owner/repo).
+        pr_number (int): The number of the pull request.
+        head_sha (str): The commit the comment lines refer to.
+        body (str): The review summary.
+        comments (list): Inline comments with path, line, side and body (and start_line and
+            start_side for multi-line comments).
+        github_token (str): GitHub access token.
+        test_mode (bool): Flag to indicate if it is in test mode.
+
+    Returns:
+        int or None: The ID of the review, or None if nothing was posted.
+    """
+    if test_mode:
+        print("TEST_MODE: Skipping posting the review to GitHub.")
+        print(f"Review body:\n{body}\nInline comments:\n{json.dumps(comments, indent=2)}")
+        return None
+
+    review = {"commit_id": head_sha, "event": "COMMENT", "body": body, "comments": comments}
+    try:
+        response = get_github_client().post(
+            construct_reviews_url(repository_full_name, pr_number), token=github_token, data=json.dumps(review)
+        )
+        response.raise_for_status()
+        print(f"Posted a review with {len(comments)} inline comment(s) to PR #{pr_number}")
+        return response.json().get('id')
+    except requests.exceptions.RequestException as e:
+        response = getattr(e, 'response', None)
+        if response is not None and response.status_code == 422 and comments:
+            # A line GitHub does not consider part of the diff fails the whole review.
+            print(f"GitHub rejected the inline comments ({response.text[:200]}); posting them in the review body.")
+            inline = "\n\n".join(f"**{comment['path']}:{comment['line']}**\n{comment['body']}" for comment in comments)
+            return post_pull_request_review(
+                repository_full_name, pr_number, head_sha, f"{body}\n\n{inline}", [], github_token, test_mode
+            )
+        print(f"Failed to post review: {e}")
+        return None
+
+
+class ProgressiveComment:
+    """
+    Keeps a PR comment updated while a review is generated.
+
+    A placeholder is posted right away and then edited through post_or_update_comment as
+    the review grows. Edits are limited to one per `min_interval` seconds and only cover
+    completed paragraphs, so readers never see half a sentence and GitHub is not flooded.
+    """
+
+    def __init__(self, repository_full_name, pr_number, comment_id, github_token, min_interval=3.0):
+        self.repository_full_name = repository_full_name
+        self.pr_number = pr_number
+        self.comment_id = comment_id
+        self.github_token = github_token
+        self.min_interval = min_interval
+        self._last_update = 0.0
+        self._last_content = None
+        self._lock = threading.Lock()
+
+    def _write(self, content):
+        self.comment_id = post_or_update_comment(
+            self.repository_full_name, self.pr_number, content, self.comment_id, self.github_token, False
+        ) or self.comment_id
+        self._last_content = content
+        self._last_update = time.monotonic()
+
+    def start(self, placeholder):
+        with self._lock:
+            self._write(placeholder)
+
+    def update(self, content):
+        """
+        Publishes the completed paragraphs of content if the update interval has passed.
+        """
+        with self._lock:
+            if time.monotonic() - self._last_update < self.min_interval:
+                return
+            completed = content.rsplit("\n\n", 1)[0] if "\n\n" in content else ""
+            if not completed or completed == self._last_content:
+                return
+            self._write(completed)
+
+    def finish(self, content):
+        with self._lock:
+            if content != self._last_content:
+                self._write(content)
@@ -0,0 +1,193 @@
+import random
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+import requests
+from requests.adapters import HTTPAdapter
+from config import config
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# Methods that are safe to resend after a connection error, timeout or server error. Other
+# methods (POST) are only resent when GitHub explicitly rate limited them, since a 5xx or
+# a lost response may come after a comment or review was already created.
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+
+class GitHubClient:
+    """
+    Shared GitHub REST client.
+
+    Keeps one pooled requests.Session for the lifetime of the process, so warm Lambda
+    invocations reuse open TLS connections. Every request gets a timeout and is retried
+    with exponential backoff on transient failures and rate limits, honouring the
+    `Retry-After` and `X-RateLimit-Reset` headers; POSTs, which are not idempotent, only
+    on explicit rate limits. GET responses are cached by ETag and
+    revalidated with `If-None-Match`; GitHub does not charge 304 responses to the rate limit.
+    """
+
+    def __init__(
+        self,
+        token=None,
+        timeout=(3.05, 10),
+        max_retries=3,
+        backoff_factor=0.5,
+        max_backoff=30,
+        pool_size=10,
+        etag_cache_size=256,
+        max_concurrency=0,
+    ):
+        self.token = token
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.etag_cache_size = etag_cache_size
+        self._etag_cache = OrderedDict()
+        self._etag_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        # Core rate limit budget from the last response, for callers pacing bulk work
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+
+        self.session = requests.Session()
+        self.session.headers.update({'Accept': 'application/vnd.github.v3+json'})
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _headers(self, token, headers):
+        merged = {}
+        token = token or self.token
+        if token:
+            merged['Authorization'] = f'token {token}'
+        merged.update(headers or {})
+        return merged
+
+    def _retry_delay(self, response, attempt, method="GET"):
+        """
+        Returns how long to wait before retrying a response, or None if it should not be retried.
+        """
+        status = response.status_code
+        retry_after = response.headers.get('Retry-After')
+        explicitly_rate_limited = status == 429 or (
+            status == 403
+            and (response.headers.get('X-RateLimit-Remaining') == '0' or retry_after is not None)
+        )
+        if method not in IDEMPOTENT_METHODS:
+            # GitHub rejects rate limited requests before acting on them; anything else may have been applied.
+            if not explicitly_rate_limited:
+                return None
+        elif not (explicitly_rate_limited or status in RETRYABLE_STATUS_CODES
+                  or (status == 403 and 'rate limit' in response.text.lower())):
+            return None
+
+        if retry_after is not None:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                delay = self._backoff(attempt)
+        elif response.headers.get('X-RateLimit-Remaining') == '0' and response.headers.get('X-RateLimit-Reset'):
+            delay = max(0.0, float(response.headers['X-RateLimit-Reset']) - time.time()) + 1
+        else:
+            delay = self._backoff(attempt)
+
+        # Waiting out a long primary rate limit window would only burn Lambda time.
+        if delay > self.max_backoff:
+            print(f"GitHub asked to wait {delay:.0f}s, which exceeds the {self.max_backoff}s backoff cap.")
+            return None
+        return delay
+
+    def _backoff(self, attempt):
+        delay = self.backoff_factor * (2 ** attempt)
+        return min(self.max_backoff, delay + random.uniform(0, delay))
+
+    def request(self, method, url, token=None, headers=None, **kwargs):
+        """
+        Sends a request with timeouts and retries.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute GitHub API URL.
+            token (str, optional): Overrides the client's default token.
+            headers (dict, optional): Extra request headers.
+            **kwargs: Passed through to requests.Session.request.
+
+        Returns:
+            requests.Response: The final response. Callers still call raise_for_status().
+        """
+        method = method.upper()
+        kwargs.setdefault('timeout', self.timeout)
+        request_headers = self._headers(token, headers)
+        attempt = 0
+        while True:
+            try:
+                if self._slots is not None:
+                    with self._slots:
+                        response = self.session.request(method, url, headers=request_headers, **kwargs)
+                else:
+                    response = self.session.request(method, url, headers=request_headers, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if method not in IDEMPOTENT_METHODS or attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                print(f"GitHub {method} {url} failed ({e}); retrying in {delay:.1f}s.")
+            else:
+                if response.headers.get('X-RateLimit-Remaining') is not None:
+                    self.rate_limit_remaining = int(response.headers['X-RateLimit-Remaining'])
+                    self.rate_limit_reset = float(response.headers.get('X-RateLimit-Reset') or 0)
+                if attempt >= self.max_retries:
+                    return response
+                delay = self._retry_delay(response, attempt, method)
+                if delay is None:
+                    return response
+                print(f"GitHub {method} {url} returned {response.status_code}; retrying in {delay:.1f}s.")
+            time.sleep(delay)
+            attempt += 1
+
+    def get(self, url, token=None, headers=None, params=None, **kwargs):
+        """
+        Sends a conditional GET, serving the cached response when GitHub answers 304.
+        """
+        cache_key = (token or self.token, url, tuple(sorted((params or {}).items())),
+                     tuple(sorted((headers or {}).items())))
+        with self._etag_lock:
+            cached = self._etag_cache.get(cache_key)
+        request_headers = dict(headers or {})
+        if cached is not None:
+            request_headers['If-None-Match'] = cached.headers['ETag']
+
+        response = self.request('GET', url, token=token, headers=request_headers, params=params, **kwargs)
+
+        if response.status_code == 304 and cached is not None:
+            with self._etag_lock:
+                self._etag_cache.move_to_end(cache_key)
+            return cached
+        if response.ok and response.headers.get('ETag') and not kwargs.get('stream'):
+            with self._etag_lock:
+                self._etag_cache[cache_key] = response
+                self._etag_cache.move_to_end(cache_key)
+                while len(self._etag_cache) > self.etag_cache_size:
+                    self._etag_cache.popitem(last=False)
+        return response
+
+    def post(self, url, token=None, **kwargs):
+        return self.request('POST', url, token=token, **kwargs)
+
+    def patch(self, url, token=None, **kwargs):
+        return self.request('PATCH', url, token=token, **kwargs)
+
+
+@lru_cache(maxsize=1)
+def get_github_client():
+    """
+    Returns the process-wide GitHub client, created on first use and kept across warm invocations.
+    """
+    return GitHubClient(
+        token=config.GITHUB_ACCESS_TOKEN,
+        timeout=(config.GITHUB_CONNECT_TIMEOUT_SECONDS, config.GITHUB_READ_TIMEOUT_SECONDS),
+        max_retries=config.GITHUB_MAX_RETRIES,
+        max_backoff=config.GITHUB_MAX_BACKOFF_SECONDS,
+        pool_size=max(10, config.GITHUB_MAX_CONCURRENCY),
+        max_concurrency=config.GITHUB_MAX_CONCURRENCY,
+    )
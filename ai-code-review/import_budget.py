@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+# Modules that must not be loaded just by importing the Lambda entry point.
+DEFERRED_MODULES = ("openai", "pydantic", "tiktoken", "boto3")
+
+
+def measure_import(module="lambda_handler"):
+    """
+    Imports a module in a fresh interpreter and measures it with `-X importtime`.
+
+    Args:
+        module (str): The module to import.
+
+    Returns:
+        tuple: The module's cumulative import time in milliseconds, the ten slowest
+            (ms, module) pairs it pulled in, and the deferred modules imported anyway.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    check = f"import sys, {module}; print(','.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", check],
+        cwd=here, capture_output=True, text=True, check=True,
+    )
+    # Lines read "import time: self [us] | cumulative | imported package", children first,
+    # with nesting shown by indentation. Collect everything up to the module's own line.
+    nested = []
+    total_ms = 0.0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        ms = int(cumulative) / 1000
+        if name.strip() == module and not name[1:].startswith(" "):
+            total_ms = ms
+            break
+        if name[1:].startswith(" "):
+            nested.append((ms, name.strip()))
+        else:
+            # A top-level import that finished before ours, e.g. interpreter startup.
+            nested = []
+    slowest = sorted(nested, reverse=True)[:10]
+    leaked = [name for name in result.stdout.strip().split(",") if name]
+    return total_ms, slowest, leaked
+
+
+if __name__ == "__main__":
+    budget_ms = float(os.getenv("IMPORT_BUDGET_MS", "50"))
+    total_ms, slowest, leaked = measure_import()
+    print(f"Importing lambda_handler took {total_ms:.1f}ms (budget {budget_ms:.0f}ms).")
+    for ms, name in slowest:
+        print(f"  {ms:8.1f}ms  {name}")
+    if leaked:
+        print(f"Heavy modules imported eagerly: {', '.join(leaked)}")
+    if leaked or total_ms > budget_ms:
+        sys.exit(1)
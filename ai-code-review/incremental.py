@@ -0,0 +1,85 @@
+import re
+from github_client import BOT_COMMENT_MARKER
+
+# Hidden marker recording the head commit a comment was last updated for.
+REVIEWED_SHA_PATTERN = re.compile(r"<!-- ai-code-review:head_sha=([0-9a-f]{7,40}) -->")
+INCREMENTAL_SECTION_HEADER = "\n\n---\n### Changes since "
+# GitHub rejects comment bodies over 65536 characters; leave room for the header.
+MAX_COMMENT_LENGTH = 60000
+
+
+def format_reviewed_marker(head_sha):
+    return f"\n\n<!-- ai-code-review:head_sha={head_sha} -->"
+
+
+def parse_reviewed_sha(comment_body):
+    """
+    Extracts the last reviewed head SHA from a bot comment.
+
+    Args:
+        comment_body (str or None): The comment body.
+
+    Returns:
+        str or None: The head SHA, or None if the comment has no marker.
+    """
+    if not comment_body:
+        return None
+    matches = REVIEWED_SHA_PATTERN.findall(comment_body)
+    return matches[-1] if matches else None
+
+
+def _strip_comment_chrome(comment_body):
+    """Removes the bot header line and the reviewed SHA marker from a comment body."""
+    lines = comment_body.split("\n")
+    if lines and BOT_COMMENT_MARKER in lines[0]:
+        lines = lines[1:]
+    return REVIEWED_SHA_PATTERN.sub("", "\n".join(lines)).strip()
+
+
+def format_progress(previous_body, partial_review):
+    """
+    Renders the comment content shown while a review is still being generated.
+
+    The previous review and its reviewed SHA marker are kept as they are, so a worker
+    that dies mid-review does not mark the new head as reviewed.
+
+    Args:
+        previous_body (str or None): The current body of the bot comment, if any.
+        partial_review (str): The review text produced so far.
+
+    Returns:
+        str: The in-progress comment content.
+    """
+    progress = f"_Review in progress..._\n\n{partial_review}".rstrip()
+    if not previous_body:
+        return progress
+    lines = previous_body.split("\n")
+    if lines and BOT_COMMENT_MARKER in lines[0]:
+        lines = lines[1:]
+    return "\n".join(lines).strip() + "\n\n---\n" + progress
+
+
+def merge_incremental_review(previous_body, incremental_review, last_sha, head_sha):
+    """
+    Appends the review of a push to the existing review content.
+
+    The oldest incremental sections are dropped first if the comment would grow past the
+    GitHub size limit; the original full review is always kept.
+
+    Args:
+        previous_body (str): The current body of the bot comment.
+        incremental_review (str): The review of the last_sha...head_sha delta.
+        last_sha (str): The previously reviewed head SHA.
+        head_sha (str): The newly reviewed head SHA.
+
+    Returns:
+        str: The merged review content, ending with the new reviewed SHA marker.
+    """
+    previous = _strip_comment_chrome(previous_body)
+    section = f"{INCREMENTAL_SECTION_HEADER}`{last_sha[:7]}` (`{last_sha[:7]}...{head_sha[:7]}`)\n\n{incremental_review}"
+
+    base, *older_sections = previous.split(INCREMENTAL_SECTION_HEADER)
+    older_sections = [INCREMENTAL_SECTION_HEADER + older for older in older_sections]
+    while older_sections and len(base) + sum(map(len, older_sections)) + len(section) > MAX_COMMENT_LENGTH:
+        older_sections.pop(0)
+    return base + "".join(older_sections) + section + format_reviewed_marker(head_sha)
@@ -0,0 +1,145 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import List, Tuple
+from config import config
+
+
+class JobQueue:
+    """
+    At-least-once queue of review jobs.
+
+    Received jobs stay invisible for the visibility timeout and are redelivered unless
+    acknowledged, so a worker that crashes mid-review does not lose the job.
+    """
+
+    def enqueue(self, job: dict, delay_seconds: float = 0) -> None:
+        raise NotImplementedError
+
+    def receive(self, max_jobs: int = 1, wait_seconds: float = 0) -> List[Tuple[str, dict]]:
+        """Returns up to max_jobs (receipt, job) pairs."""
+        raise NotImplementedError
+
+    def ack(self, receipt: str) -> None:
+        raise NotImplementedError
+
+
+class SQLiteJobQueue(JobQueue):
+    """Local queue for tests and single-host deployments."""
+
+    def __init__(self, path: str, visibility_timeout: float = 900):
+        self.visibility_timeout = visibility_timeout
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL, visible_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+
+    def enqueue(self, job, delay_seconds=0):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (body, visible_at) VALUES (?, ?)",
+                (json.dumps(job), time.time() + delay_seconds),
+            )
+
+    def receive(self, max_jobs=1, wait_seconds=0):
+        deadline = time.time() + wait_seconds
+        while True:
+            jobs = self._lease(max_jobs)
+            if jobs or time.time() >= deadline:
+                return jobs
+            time.sleep(min(0.5, max(0.0, deadline - time.time())))
+
+    def _lease(self, max_jobs):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT id, body FROM jobs WHERE visible_at <= ? ORDER BY visible_at LIMIT ?",
+                    (now, max_jobs),
+                ).fetchall()
+                for job_id, _ in rows:
+                    self._conn.execute(
+                        "UPDATE jobs SET visible_at = ?, attempts = attempts + 1 WHERE id = ?",
+                        (now + self.visibility_timeout, job_id),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [(str(job_id), json.loads(body)) for job_id, body in rows]
+
+    def ack(self, receipt):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE id = ?", (int(receipt),))
+
+
+class SQSJobQueue(JobQueue):
+    """Amazon SQS queue for production."""
+
+    def __init__(self, queue_url: str):
+        import boto3
+
+        self.queue_url = queue_url
+        self.sqs = boto3.client("sqs")
+
+    def enqueue(self, job, delay_seconds=0):
+        # SQS caps message delays at 15 minutes.
+        self.sqs.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(job),
+            DelaySeconds=min(900, int(delay_seconds)),
+        )
+
+    def receive(self, max_jobs=1, wait_seconds=0):
+        response = self.sqs.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(10, max_jobs),
+            WaitTimeSeconds=min(20, int(wait_seconds)),
+        )
+        return [
+            (message["ReceiptHandle"], json.loads(message["Body"]))
+            for message in response.get("Messages", [])
+        ]
+
+    def ack(self, receipt):
+        self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=receipt)
+
+
+def create_queue(url: str) -> JobQueue:
+    """
+    Builds a job queue from a URL-like setting.
+
+    Args:
+        url (str): An SQS queue URL (`https://sqs.<region>.amazonaws.com/...`) or
+            `sqlite:///path/to/queue.db`.
+
+    Returns:
+        JobQueue: The configured queue.
+    """
+    if url.startswith("https://sqs.") or url.startswith("https://queue.amazonaws.com"):
+        return SQSJobQueue(url)
+    scheme, _, location = url.partition("://")
+    if scheme == "sqlite":
+        return SQLiteJobQueue(location)
+    raise ValueError(f"Unsupported queue URL: {url}")
+
+
+@lru_cache(maxsize=1)
+def get_job_queue():
+    """
+    Returns the process-wide review queue, or None when REVIEW_QUEUE_URL is unset.
+    """
+    if not config.REVIEW_QUEUE_URL:
+        return None
+    return create_queue(config.REVIEW_QUEUE_URL)
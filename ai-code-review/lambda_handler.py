@@ -1,17 +1,17 @@
 import json
 from config import config
-from openai_client import ReviewResponse, review_code_with_openai
-from github_client import (
-    verify_repo_access,
-    get_bot_comment_id,
-    post_or_update_comment
-)
-from utils import get_changeset, parse_event_body
+from event_filter import get_review_coalescer, should_review_event
+from job_queue import get_job_queue
+from metrics import invocation, timed
+from utils import build_review_job, parse_event_body
 
 def lambda_handler(event, context):
     """
     AWS Lambda handler for processing GitHub pull request events.
 
+    When REVIEW_QUEUE_URL is set the event is validated, queued for worker.py and
+    acknowledged immediately; otherwise the review runs inline.
+
     Args:
         event (dict): The event payload.
         context (LambdaContext): The runtime information.
@@ -19,67 +19,119 @@ def lambda_handler(event, context):
     Returns:
         dict: The response dictionary.
     """
+    return handle_event(event, context, "lambda_handler")
+
+
+def handle_event(event, context, function):
+    """
+    Handles one webhook event, recording its metrics under the given handler name.
+
+    The webhook server (server.py) runs handle_event_async on its event loop instead.
+    """
+    with invocation(function) as metrics:
+        response, job, coalescer = _admit_event(event, metrics)
+        if response is None:
+            if coalescer and not coalescer.wait_until_settled(job['repository_full_name'], job['pr_number'], job['head_sha']):
+                response = _superseded(job['head_sha'])
+            else:
+                # Deferred so ignored and queued events never import the review stack.
+                from worker import run_review_job
+
+                response = run_review_job(job, _test_full_context(context))
+        metrics.set_property("StatusCode", response['statusCode'])
+        return response
+
+
+async def handle_event_async(event, context, function):
+    """
+    Async counterpart of handle_event: the debounce wait and the review run on the caller's
+    event loop, and only blocking calls take a worker thread.
+    """
+    # Already loaded by the running event loop; kept out of the module for cold starts.
+    import asyncio
+
+    with invocation(function) as metrics:
+        response, job, coalescer = await asyncio.to_thread(_admit_event, event, metrics)
+        if response is None:
+            if coalescer and not await coalescer.wait_until_settled_async(job['repository_full_name'], job['pr_number'], job['head_sha']):
+                response = _superseded(job['head_sha'])
+            else:
+                from worker import run_review_job_async
+
+                response = await run_review_job_async(job, _test_full_context(context))
+        metrics.set_property("StatusCode", response['statusCode'])
+        return response
+
+
+def _admit_event(event, metrics):
+    """
+    Parses, filters and coalesces an event, and queues it when REVIEW_QUEUE_URL is set.
+
+    Returns:
+        tuple: The response, or None if the review is to run in this process, the review
+            job, and the coalescer (None when pushes are not coalesced).
+    """
     # Parse the body of the event
-    body = parse_event_body(event)
-
-    pr_event = body.get('action', 'Unknown')
-    pr_details = body.get('pull_request', {})
-    pr_title = pr_details.get('title', 'No Title')
-    pr_number = pr_details.get('number', 'Unknown')
-    pr_description = pr_details.get('body', 'No Description')
-    repository_info = body.get('repository', {})
-    repository_full_name = repository_info.get('full_name', 'Unknown')
-    base_branch = pr_details.get('base', {}).get('ref', 'Unknown')
-    head_branch = pr_details.get('head', {}).get('ref', 'Unknown')
-
-    print(f"Pull Request #{pr_number} - {pr_title} - Action: {pr_event}")
+    with timed("parse_event"):
+        body = parse_event_body(event)
+        job = build_review_job(body)
+    metrics.set_property("Repository", job['repository_full_name'])
+    metrics.set_property("PullRequest", job['pr_number'])
+
+    pr_event = job['action']
+    pr_number = job['pr_number']
+    repository_full_name = job['repository_full_name']
+    head_sha = job['head_sha']
+
+    print(f"Pull Request #{pr_number} - {job['pr_title']} - Action: {pr_event}")
     print(f"Repository: {repository_full_name}")
-    print(f"Base branch: {base_branch}, Head branch: {head_branch}")
+    print(f"Base branch: {job['base_branch']}, Head branch: {job['head_branch']}")
 
-    # Verify repository access
-    if not config.TEST_MODE and not verify_repo_access(repository_full_name):
+    should_review, skip_reason = should_review_event(body)
+    if not should_review:
+        print(f"Skipping review: {skip_reason}")
         return {
-            'statusCode': 403,
-            'body': json.dumps(f"API key does not have access to the repository: {repository_full_name}")
-        }
-    
-    if config.TEST_MODE:
-        comment_id = None
-    else:
-        comment_id = get_bot_comment_id(pr_number, repository_full_name)
-
-    if config.TEST_MODE:
-        # Use full_context from context if available
-        if hasattr(context, 'full_context'):
-            full_context = context.full_context
-            print("Using provided full_context from test_main.py.")
-        else:
-            full_context = "Stubbed changeset for testing."
-            print("Using default stubbed changeset for testing.")
-
-    try:
-        # Get the changeset
-        full_context = full_context or get_changeset(repository_full_name, base_branch, head_branch, config.GITHUB_ACCESS_TOKEN)
-        openai_review: ReviewResponse = review_code_with_openai(full_context, pr_title, pr_description)
-
-        if openai_review is not None:            
-            post_or_update_comment(
-                repository_full_name,
-                pr_number,
-                openai_review.pull_request_description +"\n" +openai_review.feedback,
-                comment_id,
-                config.GITHUB_ACCESS_TOKEN,
-                config.TEST_MODE
-            )
-              
-    except Exception as e:
-        print(f"An error occurred: {e}")
+            'statusCode': 200,
+            'body': json.dumps(f"GitHub PR webhook ignored: {skip_reason}")
+        }, job, None
+
+    # Coalesce bursts of pushes so only the newest head commit is reviewed
+    coalescer = get_review_coalescer() if head_sha and not config.TEST_MODE else None
+    if coalescer and not coalescer.register(repository_full_name, pr_number, head_sha):
+        print(f"Head {head_sha} is already reviewed or in flight.")
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f"GitHub PR webhook ignored: {head_sha} already reviewed")
+        }, job, coalescer
+
+    queue = get_job_queue()
+    if queue is not None:
+        # The debounce window becomes the queue delay instead of a sleep in this handler.
+        with timed("enqueue"):
+            queue.enqueue(job, delay_seconds=config.DEBOUNCE_SECONDS if coalescer else 0)
+        print(f"Queued review of {repository_full_name}#{pr_number}.")
         return {
-            'statusCode': 500,
-            'body': json.dumps(f"An error occurred: {e}")
-        }
+            'statusCode': 202,
+            'body': json.dumps(f"GitHub PR webhook queued: {pr_event}")
+        }, job, coalescer
+
+    return None, job, coalescer
 
+
+def _superseded(head_sha):
+    print(f"Head {head_sha} was superseded by a newer push.")
     return {
         'statusCode': 200,
-        'body': json.dumps(f'GitHub PR webhook processed: {pr_event}')
+        'body': json.dumps(f"GitHub PR webhook ignored: {head_sha} superseded")
     }
+
+
+def _test_full_context(context):
+    if not config.TEST_MODE:
+        return None
+    # Use full_context from context if available
+    if hasattr(context, 'full_context'):
+        print("Using provided full_context from test_main.py.")
+        return context.full_context
+    print("Using default stubbed changeset for testing.")
+    return "Stubbed changeset for testing."
@@ -0,0 +1,204 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Optional
+from config import config
+
+# OpenAI bills cached prompt tokens at half the input price.
+CACHED_INPUT_DISCOUNT = 0.5
+
+
+def model_call_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """
+    Prices a model call in USD from the model catalog, or 0 for unknown models.
+    """
+    from model_router import MODEL_CATALOG
+
+    spec = MODEL_CATALOG.get(model)
+    if spec is None:
+        return 0.0
+    billed_prompt = prompt_tokens - cached_tokens * CACHED_INPUT_DISCOUNT
+    return spec.estimate_cost(billed_prompt, completion_tokens)
+
+
+class InvocationMetrics:
+    """
+    Timings, token counts and cost collected over one handler invocation.
+
+    Stages that run several times (e.g. one model call per chunk) add up, and their
+    call count is kept alongside.
+    """
+
+    def __init__(self, function: str):
+        self.function = function
+        self.started = time.perf_counter()
+        self.stage_ms: Dict[str, float] = defaultdict(float)
+        self.stage_calls: Dict[str, int] = defaultdict(int)
+        self.model_calls = []
+        self.properties: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage: str, duration_s: float) -> None:
+        with self._lock:
+            self.stage_ms[stage] += duration_s * 1000
+            self.stage_calls[stage] += 1
+
+    def add_model_call(self, stage: str, model: str, usage, duration_s: float) -> None:
+        cost = model_call_cost(model, usage.prompt_tokens, usage.completion_tokens, usage.cached_tokens)
+        self.add_stage(f"model.{stage}", duration_s)
+        with self._lock:
+            self.model_calls.append({
+                "stage": stage,
+                "model": model,
+                "duration_ms": round(duration_s * 1000, 1),
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "cached_tokens": usage.cached_tokens,
+                "cost_usd": round(cost, 6),
+            })
+
+    def set_property(self, name: str, value) -> None:
+        with self._lock:
+            self.properties[name] = value
+
+    def totals(self) -> Dict[str, float]:
+        with self._lock:
+            calls = list(self.model_calls)
+        prompt_tokens = sum(call["prompt_tokens"] for call in calls)
+        cached_tokens = sum(call["cached_tokens"] for call in calls)
+        return {
+            "PromptTokens": prompt_tokens,
+            "CompletionTokens": sum(call["completion_tokens"] for call in calls),
+            "CachedTokens": cached_tokens,
+            # Share of prompt tokens served from the provider's prompt cache
+            "PromptCacheHitRate": round(cached_tokens / prompt_tokens, 4) if prompt_tokens else 0.0,
+            "CostUSD": round(sum(call["cost_usd"] for call in calls), 6),
+            "ModelCalls": len(calls),
+        }
+
+    def to_emf(self) -> dict:
+        """
+        Renders the invocation as a CloudWatch Embedded Metric Format record.
+
+        Only the function name is a dimension; the repository and PR are plain properties
+        so they can be searched in Logs Insights without creating a metric per PR.
+        """
+        values = {"Duration": round((time.perf_counter() - self.started) * 1000, 1)}
+        units = {"Duration": "Milliseconds"}
+        with self._lock:
+            for stage, ms in self.stage_ms.items():
+                values[f"{stage}.duration"] = round(ms, 1)
+                units[f"{stage}.duration"] = "Milliseconds"
+            stage_calls = dict(self.stage_calls)
+            properties = dict(self.properties)
+            model_calls = list(self.model_calls)
+        for name, value in self.totals().items():
+            values[name] = value
+            units[name] = "Count" if name.endswith(("Tokens", "Calls")) else "None"
+        values["MaxRSS"] = _max_rss_mb()
+        units["MaxRSS"] = "Megabytes"
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": config.METRICS_NAMESPACE,
+                    "Dimensions": [["Function"]],
+                    "Metrics": [{"Name": name, "Unit": units[name]} for name in values],
+                }],
+            },
+            "Function": self.function,
+            **properties,
+            **values,
+            "stage_calls": stage_calls,
+            "model_calls": model_calls,
+        }
+
+
+def _max_rss_mb() -> float:
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return round(max_rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+_current: "contextvars.ContextVar[Optional[InvocationMetrics]]" = contextvars.ContextVar("metrics", default=None)
+
+
+def current_metrics() -> Optional[InvocationMetrics]:
+    return _current.get()
+
+
+@contextmanager
+def invocation(function: str):
+    """
+    Collects metrics for one handler invocation and prints them as one EMF JSON line.
+
+    Threads started with concurrent.futures do not inherit the context; submit work with
+    contextvars.copy_context().run to keep recording into this invocation. With
+    PROFILE_INVOCATIONS set, the invocation also runs under cProfile.
+
+    Args:
+        function (str): Name of the handler, used as the metric dimension.
+
+    Yields:
+        InvocationMetrics: The metrics of this invocation.
+    """
+    metrics = InvocationMetrics(function)
+    token = _current.set(metrics)
+    profiler = None
+    if config.PROFILE_INVOCATIONS:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield metrics
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _report_profile(profiler, function)
+        _current.reset(token)
+        if config.METRICS_ENABLED:
+            print(json.dumps(metrics.to_emf(), default=str))
+
+
+def _report_profile(profiler, function: str) -> None:
+    import pstats
+
+    if config.PROFILE_OUTPUT_DIR:
+        os.makedirs(config.PROFILE_OUTPUT_DIR, exist_ok=True)
+        path = os.path.join(config.PROFILE_OUTPUT_DIR, f"{function}-{int(time.time() * 1000)}.prof")
+        profiler.dump_stats(path)
+        print(f"Profile written to {path}")
+    else:
+        pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(25)
+
+
+@contextmanager
+def timed(stage: str):
+    """Times a block as a stage of the current invocation; a no-op outside of one."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def record_stage(stage: str, duration_s: float) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_stage(stage, duration_s)
+
+
+def record_model_call(stage: str, model: str, usage, duration_s: float) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.add_model_call(stage, model, usage, duration_s)
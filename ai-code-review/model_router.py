@@ -0,0 +1,503 @@
+import asyncio
+import os
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional
+from config import config
+from metrics import record_model_call, record_stage
+from rate_limiter import RateLimiter
+from tokenizer import count_tokens
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    """Static facts about a model used to pick one for a request."""
+
+    name: str
+    provider: str
+    context_window: int
+    # USD per million tokens
+    input_cost_per_mtok: float
+    output_cost_per_mtok: float
+    # Time to first token, and generation speed once it starts
+    base_latency_s: float
+    output_tokens_per_s: float
+    prefill_tokens_per_s: float = 10_000
+    structured_output: bool = True
+
+    def estimate_cost(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (
+            prompt_tokens * self.input_cost_per_mtok + completion_tokens * self.output_cost_per_mtok
+        ) / 1_000_000
+
+    def estimate_latency(self, prompt_tokens: int, completion_tokens: int) -> float:
+        return (
+            self.base_latency_s
+            + prompt_tokens / self.prefill_tokens_per_s
+            + completion_tokens / self.output_tokens_per_s
+        )
+
+
+MODEL_CATALOG: Dict[str, ModelSpec] = {
+    spec.name: spec
+    for spec in [
+        ModelSpec("gpt-4o-mini", "openai", 128_000, 0.15, 0.60, 0.5, 90),
+        ModelSpec("gpt-4o-2024-08-06", "openai", 128_000, 2.50, 10.00, 0.8, 60),
+        ModelSpec("o1-mini", "openai", 128_000, 3.00, 12.00, 4.0, 70, structured_output=False),
+        ModelSpec("gpt-4.1", "openai", 1_047_576, 2.00, 8.00, 0.8, 60),
+    ]
+}
+
+# Candidate models per review stage in order of preference. The first model that fits the
+# prompt within the latency SLO and cost budget is used; the rest are failovers.
+DEFAULT_STAGE_MODELS: Dict[str, List[str]] = {
+    "summary": ["gpt-4o-2024-08-06", "gpt-4.1"],
+    "feedback": ["o1-mini", "gpt-4.1"],
+    "merge": ["o1-mini", "gpt-4.1"],
+    "detailed_review": ["o1-mini", "gpt-4.1"],
+    "code_suggestions": ["gpt-4o-2024-08-06", "gpt-4.1"],
+}
+
+
+@dataclass
+class Usage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+
+
+@dataclass
+class Completion:
+    """Provider-neutral result of a model call."""
+
+    model: str
+    text: Optional[str] = None
+    parsed: object = None
+    usage: Usage = field(default_factory=Usage)
+
+
+class ModelRouterError(Exception):
+    """Raised when no candidate model could serve a request."""
+
+
+class Provider:
+    """
+    A model API. Implementations raise on any failure so the router can fail over.
+    """
+
+    def complete(self, model, messages, max_completion_tokens, response_format=None, timeout=None) -> Completion:
+        raise NotImplementedError
+
+    async def acomplete(self, model, messages, max_completion_tokens, response_format=None, timeout=None) -> Completion:
+        raise NotImplementedError
+
+    def stream(self, model, messages, max_completion_tokens, timeout=None) -> Iterator[str]:
+        """Yields the completion text in pieces as it is generated."""
+        raise NotImplementedError
+
+
+def _openai_usage(usage) -> Usage:
+    if usage is None:
+        return Usage()
+    details = getattr(usage, "prompt_tokens_details", None)
+    return Usage(
+        prompt_tokens=usage.prompt_tokens or 0,
+        completion_tokens=usage.completion_tokens or 0,
+        cached_tokens=(getattr(details, "cached_tokens", 0) or 0) if details else 0,
+    )
+
+
+def _openai_completion(model, response, structured) -> Completion:
+    message = response.choices[0].message if response.choices else None
+    return Completion(
+        model=model,
+        text=message.content if message else None,
+        parsed=message.parsed if message and structured else None,
+        usage=_openai_usage(response.usage),
+    )
+
+
+def _estimate_tokens(messages, max_completion_tokens) -> int:
+    # OpenAI charges the completion limit against the tokens-per-minute budget up front.
+    return sum(count_tokens(message["content"]) for message in messages) + max_completion_tokens
+
+
+class OpenAIProvider(Provider):
+    """
+    OpenAI chat completions, with structured output through the parse helper.
+
+    Calls are scheduled by a RateLimiter that learns each model's budgets from the
+    `x-ratelimit-*` headers and retries 429s itself, so the SDK's own retries are off.
+    """
+
+    def __init__(self, api_key: Optional[str], rate_limiter: Optional[RateLimiter] = None):
+        self.api_key = api_key
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    def client(self):
+        with self._client_lock:
+            if self._client is None:
+                import openai
+
+                # Rate limits are retried by the limiter; other failures fail over to another model.
+                self._client = openai.Client(api_key=self.api_key, max_retries=0)
+            return self._client
+
+    def async_client(self):
+        """
+        Async HTTP connections are bound to the loop that opened them, and every
+        asyncio.run() call starts a new loop, so one client is kept per loop.
+        """
+        import openai
+
+        loop = asyncio.get_running_loop()
+        async_client = self._async_clients.get(loop)
+        if async_client is None:
+            async_client = openai.AsyncClient(api_key=self.api_key, max_retries=0)
+            self._async_clients[loop] = async_client
+        return async_client
+
+    def complete(self, model, messages, max_completion_tokens, response_format=None, timeout=None):
+        def call():
+            if response_format is not None:
+                raw = self.client().beta.chat.completions.with_raw_response.parse(
+                    model=model, messages=messages, max_completion_tokens=max_completion_tokens,
+                    response_format=response_format, timeout=timeout,
+                )
+            else:
+                raw = self.client().chat.completions.with_raw_response.create(
+                    model=model, messages=messages, max_completion_tokens=max_completion_tokens, timeout=timeout,
+                )
+            return raw.parse(), raw.headers
+
+        response = self.rate_limiter.call(model, _estimate_tokens(messages, max_completion_tokens), call)
+        return _openai_completion(model, response, response_format is not None)
+
+    async def acomplete(self, model, messages, max_completion_tokens, response_format=None, timeout=None):
+        async def call():
+            if response_format is not None:
+                raw = await self.async_client().beta.chat.completions.with_raw_response.parse(
+                    model=model, messages=messages, max_completion_tokens=max_completion_tokens,
+                    response_format=response_format, timeout=timeout,
+                )
+            else:
+                raw = await self.async_client().chat.completions.with_raw_response.create(
+                    model=model, messages=messages, max_completion_tokens=max_completion_tokens, timeout=timeout,
+                )
+            return raw.parse(), raw.headers
+
+        response = await self.rate_limiter.acall(model, _estimate_tokens(messages, max_completion_tokens), call)
+        return _openai_completion(model, response, response_format is not None)
+
+    def stream(self, model, messages, max_completion_tokens, timeout=None):
+        def call():
+            raw = self.client().chat.completions.with_raw_response.create(
+                model=model, messages=messages, max_completion_tokens=max_completion_tokens,
+                stream=True, timeout=timeout,
+            )
+            return raw.parse(), raw.headers
+
+        # The limiter covers opening the stream; tokens then arrive without holding a slot.
+        stream = self.rate_limiter.call(model, _estimate_tokens(messages, max_completion_tokens), call)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+# Providers cache prompt prefixes from this many tokens on, in blocks of this size.
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK_TOKENS = 128
+# Prompts per model the stub remembers when simulating the prompt cache
+STUB_PROMPT_CACHE_ENTRIES = 8
+
+
+class StubProvider(Provider):
+    """
+    Offline provider returning canned reviews after a configurable delay.
+
+    Used for benchmarks and tests without network access or API keys. A failure rate
+    makes it raise on a share of calls to exercise failover. Prompt prefixes repeated
+    across calls are reported as cached tokens, the way the provider's prompt cache would.
+    """
+
+    def __init__(self, latency_s: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency_s = latency_s
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._recent_prompts: Dict[str, deque] = {}
+
+    def _should_fail(self):
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def _cached_tokens(self, model, prompt):
+        """Simulates provider prompt caching: the prefix shared with a recent prompt, in whole blocks."""
+        with self._lock:
+            recent = self._recent_prompts.setdefault(model, deque(maxlen=STUB_PROMPT_CACHE_ENTRIES))
+            shared = max((len(os.path.commonprefix([prompt, seen])) for seen in recent), default=0)
+            recent.append(prompt)
+        cached = count_tokens(prompt[:shared]) // PROMPT_CACHE_BLOCK_TOKENS * PROMPT_CACHE_BLOCK_TOKENS
+        return cached if cached >= PROMPT_CACHE_MIN_TOKENS else 0
+
+    def _reply(self, model, messages, response_format):
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        cached_tokens = self._cached_tokens(model, "".join(message["content"] for message in messages))
+        text = f"Stub review by `{model}` of a {prompt_tokens}-token prompt: no issues found."
+        parsed = None
+        if response_format is not None:
+            # Fill every required string field; optional fields keep their defaults.
+            parsed = response_format.model_validate({
+                name: text
+                for name, model_field in response_format.model_fields.items()
+                if model_field.annotation is str
+            })
+        return Completion(
+            model=model,
+            text=text,
+            parsed=parsed,
+            usage=Usage(prompt_tokens=prompt_tokens, completion_tokens=count_tokens(text), cached_tokens=cached_tokens),
+        )
+
+    def _check(self, model, timeout):
+        if timeout is not None and self.latency_s > timeout:
+            raise TimeoutError(f"Stub model {model} timed out after {timeout}s")
+        if self._should_fail():
+            raise RuntimeError(f"Stub model {model} failed")
+
+    def complete(self, model, messages, max_completion_tokens, response_format=None, timeout=None):
+        time.sleep(min(self.latency_s, timeout or self.latency_s))
+        self._check(model, timeout)
+        return self._reply(model, messages, response_format)
+
+    async def acomplete(self, model, messages, max_completion_tokens, response_format=None, timeout=None):
+        await asyncio.sleep(min(self.latency_s, timeout or self.latency_s))
+        self._check(model, timeout)
+        return self._reply(model, messages, response_format)
+
+    def stream(self, model, messages, max_completion_tokens, timeout=None):
+        time.sleep(min(self.latency_s, timeout or self.latency_s))
+        self._check(model, timeout)
+        for word in self._reply(model, messages, None).text.split(" "):
+            yield word + " "
+
+
+@dataclass
+class ModelHealth:
+    consecutive_failures: int = 0
+    open_until: float = 0.0
+    # Exponentially weighted average of observed call latency
+    latency_s: Optional[float] = None
+
+
+class ModelRouter:
+    """
+    Picks a model for each review stage and fails over between candidates.
+
+    Candidates that cannot fit the prompt, or whose circuit is open after repeated
+    failures, are skipped. Of the rest, models expected to answer within the latency SLO
+    and cost budget are tried in preference order, followed by the others, fastest first.
+    A failed or timed-out call moves on to the next candidate.
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, Provider],
+        stage_models: Dict[str, List[str]],
+        catalog: Dict[str, ModelSpec] = MODEL_CATALOG,
+        latency_slo_s: float = 0,
+        max_cost_per_call: float = 0,
+        timeout_s: Optional[float] = None,
+        failure_threshold: int = 3,
+        cooldown_s: float = 60,
+    ):
+        self.providers = providers
+        self.stage_models = stage_models
+        self.catalog = catalog
+        self.latency_slo_s = latency_slo_s
+        self.max_cost_per_call = max_cost_per_call
+        self.timeout_s = timeout_s
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self._health: Dict[str, ModelHealth] = {}
+        self._lock = threading.Lock()
+
+    def stage_key(self, stage: str) -> str:
+        """Identifies the models a stage may use, for cache keys."""
+        return ",".join(self.stage_models[stage])
+
+    def candidates(self, stage, prompt_tokens, max_completion_tokens, structured=False) -> List[ModelSpec]:
+        preferred, fallback = [], []
+        now = time.monotonic()
+        for name in self.stage_models[stage]:
+            spec = self.catalog[name]
+            if structured and not spec.structured_output:
+                continue
+            if prompt_tokens + max_completion_tokens > spec.context_window:
+                continue
+            with self._lock:
+                health = self._health.get(name) or ModelHealth()
+            if health.open_until > now:
+                continue
+            latency = max(spec.estimate_latency(prompt_tokens, max_completion_tokens), health.latency_s or 0)
+            cost = spec.estimate_cost(prompt_tokens, max_completion_tokens)
+            within_slo = not self.latency_slo_s or latency <= self.latency_slo_s
+            within_budget = not self.max_cost_per_call or cost <= self.max_cost_per_call
+            if within_slo and within_budget:
+                preferred.append(spec)
+            else:
+                fallback.append((latency, spec))
+        return preferred + [spec for _, spec in sorted(fallback, key=lambda item: item[0])]
+
+    def _record(self, name: str, latency: float, ok: bool) -> None:
+        with self._lock:
+            health = self._health.setdefault(name, ModelHealth())
+            if ok:
+                health.consecutive_failures = 0
+                health.latency_s = latency if health.latency_s is None else 0.7 * health.latency_s + 0.3 * latency
+            else:
+                health.consecutive_failures += 1
+                if health.consecutive_failures >= self.failure_threshold:
+                    health.open_until = time.monotonic() + self.cooldown_s
+
+    def _plan(self, stage, messages, max_completion_tokens, structured):
+        prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        candidates = self.candidates(stage, prompt_tokens, max_completion_tokens, structured)
+        if not candidates:
+            raise ModelRouterError(f"No available model fits the {stage} stage ({prompt_tokens} prompt tokens).")
+        return candidates
+
+    def complete(self, stage, messages, max_completion_tokens, response_format=None) -> Completion:
+        """
+        Runs a completion for a review stage on the best available model.
+
+        Args:
+            stage (str): The review stage, a key of the stage model table.
+            messages (list): Chat messages.
+            max_completion_tokens (int): Completion token limit.
+            response_format (type, optional): Pydantic model for structured output.
+
+        Returns:
+            Completion: The first successful completion.
+
+        Raises:
+            ModelRouterError: If every candidate model failed.
+        """
+        errors = []
+        for spec in self._plan(stage, messages, max_completion_tokens, response_format is not None):
+            started = time.monotonic()
+            try:
+                completion = self.providers[spec.provider].complete(
+                    spec.name, messages, max_completion_tokens, response_format, self.timeout_s
+                )
+            except Exception as e:
+                self._record(spec.name, time.monotonic() - started, ok=False)
+                record_stage(f"model.{stage}.failed", time.monotonic() - started)
+                print(f"Model {spec.name} failed for {stage}: {e}")
+                errors.append(f"{spec.name}: {e}")
+                continue
+            self._record(spec.name, time.monotonic() - started, ok=True)
+            record_model_call(stage, spec.name, completion.usage, time.monotonic() - started)
+            return completion
+        raise ModelRouterError(f"All models failed for {stage}: {'; '.join(errors)}")
+
+    async def acomplete(self, stage, messages, max_completion_tokens, response_format=None) -> Completion:
+        errors = []
+        for spec in self._plan(stage, messages, max_completion_tokens, response_format is not None):
+            started = time.monotonic()
+            try:
+                completion = await self.providers[spec.provider].acomplete(
+                    spec.name, messages, max_completion_tokens, response_format, self.timeout_s
+                )
+            except Exception as e:
+                self._record(spec.name, time.monotonic() - started, ok=False)
+                record_stage(f"model.{stage}.failed", time.monotonic() - started)
+                print(f"Model {spec.name} failed for {stage}: {e}")
+                errors.append(f"{spec.name}: {e}")
+                continue
+            self._record(spec.name, time.monotonic() - started, ok=True)
+            record_model_call(stage, spec.name, completion.usage, time.monotonic() - started)
+            return completion
+        raise ModelRouterError(f"All models failed for {stage}: {'; '.join(errors)}")
+
+    def stream(self, stage, messages, max_completion_tokens) -> Iterator[str]:
+        """
+        Streams a completion for a review stage. Fails over only until the first piece of
+        text arrives; after that an error is raised to the caller.
+        """
+        errors = []
+        for spec in self._plan(stage, messages, max_completion_tokens, False):
+            started = time.monotonic()
+            pieces = self.providers[spec.provider].stream(spec.name, messages, max_completion_tokens, self.timeout_s)
+            try:
+                first = next(pieces, None)
+            except Exception as e:
+                self._record(spec.name, time.monotonic() - started, ok=False)
+                record_stage(f"model.{stage}.failed", time.monotonic() - started)
+                print(f"Model {spec.name} failed for {stage}: {e}")
+                errors.append(f"{spec.name}: {e}")
+                continue
+            text = first or ""
+            if first is not None:
+                yield first
+            try:
+                for piece in pieces:
+                    text += piece
+                    yield piece
+            except Exception as e:
+                self._record(spec.name, time.monotonic() - started, ok=False)
+                raise ModelRouterError(f"Model {spec.name} failed mid-stream for {stage}: {e}") from e
+            self._record(spec.name, time.monotonic() - started, ok=True)
+            # Streamed chunks carry no usage, so count the tokens here.
+            usage = Usage(
+                prompt_tokens=sum(count_tokens(message["content"]) for message in messages),
+                completion_tokens=count_tokens(text),
+            )
+            record_model_call(stage, spec.name, usage, time.monotonic() - started)
+            return
+        raise ModelRouterError(f"All models failed for {stage}: {'; '.join(errors)}")
+
+
+def _stage_models_from_config() -> Dict[str, List[str]]:
+    stage_models = {stage: list(models) for stage, models in DEFAULT_STAGE_MODELS.items()}
+    for stage, models in config.STAGE_MODELS.items():
+        unknown = [name for name in models if name not in MODEL_CATALOG]
+        if unknown:
+            raise ValueError(f"Unknown model(s) for the {stage} stage: {', '.join(unknown)}")
+        stage_models[stage] = models
+    return stage_models
+
+
+@lru_cache(maxsize=1)
+def get_model_router() -> ModelRouter:
+    """
+    Returns the process-wide model router, built from config on first use.
+
+    With LLM_PROVIDER=stub every model is served by the offline StubProvider.
+    """
+    if config.LLM_PROVIDER == "stub":
+        stub = StubProvider(config.STUB_LLM_LATENCY_SECONDS, config.STUB_LLM_FAILURE_RATE)
+        providers = {name: stub for name in {spec.provider for spec in MODEL_CATALOG.values()}}
+    else:
+        # The limiter's adaptive concurrency is the only cap on model calls in flight.
+        rate_limiter = RateLimiter(
+            config.LLM_RATE_LIMITS,
+            max_concurrency=config.LLM_MAX_CONCURRENCY or 64,
+            max_retries=config.LLM_RATE_LIMIT_RETRIES,
+        )
+        providers = {"openai": OpenAIProvider(config.OPENAI_API_KEY, rate_limiter)}
+    return ModelRouter(
+        providers,
+        _stage_models_from_config(),
+        latency_slo_s=config.LLM_LATENCY_SLO_SECONDS,
+        max_cost_per_call=config.LLM_MAX_COST_PER_CALL,
+        timeout_s=config.LLM_TIMEOUT_SECONDS,
+    )
@@ -1,10 +1,22 @@
-import openai
+import asyncio
+import contextvars
 import json
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from pydantic import BaseModel
 from config import config
+from chunking import pack_parts, split_changeset, summary_context
+from model_router import Completion, ModelRouterError, get_model_router
+import prompts
+from prompts import PROMPT_VERSION
+from tokenizer import count_tokens
+from review_cache import get_review_cache, review_cache_key
+from utils import format_file_changes
 
-client = openai.Client(api_key=config.OPENAI_API_KEY)
+# Called with the feedback produced so far while a streamed review is in progress.
+ProgressCallback = Callable[[str], None]
+# Returns code related to the changeset (enclosing functions, call sites) for code suggestions.
+CodeContextProvider = Callable[[], str]
 
 
 class PullRquestDescriptionResponse(BaseModel):
@@ -24,152 +36,398 @@ class CodeSuggestions(BaseModel):
 class ReviewResponse(BaseModel):
     pull_request_description: str
     feedback: str
-    # code_suggestions: Optional[List[CodeSuggestion]] = None
+    detailed_feedback: Optional[str] = None
+    code_suggestions: Optional[List[CodeSuggestion]] = None
     refusal: Optional[str] = None
 
 
-def get_pr_summary(changeset: str) -> Optional[PullRquestDescriptionResponse]:
-    prompt = (
-        "Analyze the following git diff and provide a concise summary of the Pull Request.\n\n"
-        f"### Code Changes Begin:\n{changeset}\n### Code Changes Ends\n\n"
-        "The summary should briefly describe the purpose and scope of the changes."
-    )
+def _parse_pr_summary(completion: Completion) -> Optional[PullRquestDescriptionResponse]:
+    if completion.parsed is not None:
+        review_data = PullRquestDescriptionResponse.model_validate(completion.parsed)
+        return review_data
+    return None
 
+
+def get_pr_summary(changeset: str) -> Optional[PullRquestDescriptionResponse]:
     try:
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[{"role": "user", "content": prompt}],
+        completion = get_model_router().complete(
+            "summary",
+            prompts.summary_messages(changeset),
             max_completion_tokens=500,
             response_format=PullRquestDescriptionResponse,
         )
-        if response.choices:
-            summary_json = response.choices[0].message.parsed
-            review_data = PullRquestDescriptionResponse.model_validate(summary_json)
-            return review_data
+        return _parse_pr_summary(completion)
+    except ModelRouterError as e:
+        print(f"Failed to get PR summary from OpenAI: {e}")
         return None
-    except openai.OpenAIError as e:
+
+
+async def get_pr_summary_async(changeset: str) -> Optional[PullRquestDescriptionResponse]:
+    try:
+        completion = await get_model_router().acomplete(
+            "summary",
+            prompts.summary_messages(changeset),
+            max_completion_tokens=500,
+            response_format=PullRquestDescriptionResponse,
+        )
+        return _parse_pr_summary(completion)
+    except ModelRouterError as e:
         print(f"Failed to get PR summary from OpenAI: {e}")
         return None
 
 
-def get_feedback(changeset: str, pr_title: str, pr_description: str) -> Optional[str]:
-    prompt = (
-        "You are an experienced software engineer familiar with leading tech practices in security, observability, reliability, object-oriented design, functional programming, and performance.\n"
-        "Review the following git diff, focusing only on the new code added. "
-        "Provide concise feedback on logic errors or general mistakes to promote better code quality, consistent variable naming, strongly typed (when applicable), and RESTful design (when applicable)."
-        "Keep those explanations brief, assuming the reader prefers short text and optimal clarity, a list format in markdown."
-        "Offer code changes if needed but avoid commenting on acceptable code. "
-        "Avoid commenting about the following: Using a logging library, Deployment Configaration changes\n\n\n"
-        f"Pull Request Description:\n{pr_description}\n"
-        f"### Code Changes Begin:\n{changeset}\n### Code Changes Ends\n\n"
-        """Example Feedback 1 : Everything looks great! 🚀 Your implementation of user activity features is solid. Keep up the excellent work! \n\n"""
-        """Example Feedback 2: 🌟 **Awesome work fixing the expert instruction endpoint bug!** Your changes are clean and align well with best practices. Just a couple of minor suggestions to ensure everything runs smoothly:
-
-1. **Type Annotations**:
-   - Ensure that the new `command` parameter in `Agent` is strongly typed. For example:
-     ```python
-     def __init__(self, index: IndexType, response: ResponseType, command: CommandType):
-         ...
-     ```
-
-2. **Consistent Variable Naming**:
-   - In `local_handler.py`, consider renaming `command` to `command_data` for clarity, especially if it represents fetched data.
-
-3. **RESTful Endpoint Consistency**:
-   - You've updated the endpoint to `commands`, which is great for RESTful design. Just ensure all related API calls and documentation reflect this change to avoid discrepancies.
-
-Keep up the stellar work! 🚀 Debugging like a pro and making the codebase shine brighter than a freshly minted patch! 💪✨"""
-    )
+def _parse_feedback(completion: Completion) -> Optional[str]:
+    try:
+        review_data = completion.text
+        # review_data = ReviewResponse.model_validate(review_json)
+        print("Simple Review from OpenAI:\n", review_data)
+        return review_data
+    except json.JSONDecodeError as e:
+        print(f"Failed to parse OpenAI response as JSON: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected error during parsing: {e}")
+        return None
 
+
+def get_feedback(changeset: str, pr_title: str, pr_description: str) -> Optional[str]:
     try:
-        response = client.chat.completions.create(
-            model="o1-mini",
-            messages=[{"role": "user", "content": prompt}],
+        completion = get_model_router().complete(
+            "feedback",
+            prompts.feedback_messages(changeset, pr_description),
             max_completion_tokens=2500,
             # response_format={ "type": "json_object" }
         )
-        try:
-            review_data = response.choices[0].message.content
-            # review_data = ReviewResponse.model_validate(review_json)
-            print("Simple Review from OpenAI:\n", review_data)
-            return review_data
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse OpenAI response as JSON: {e}")
-            return None
-        except Exception as e:
-            print(f"Unexpected error during parsing: {e}")
-            return None
-    except openai.OpenAIError as e:
+        return _parse_feedback(completion)
+    except ModelRouterError as e:
+        print(f"Failed to get a response from OpenAI: {e}")
+        return None
+
+
+async def get_feedback_async(changeset: str, pr_title: str, pr_description: str) -> Optional[str]:
+    try:
+        completion = await get_model_router().acomplete(
+            "feedback",
+            prompts.feedback_messages(changeset, pr_description),
+            max_completion_tokens=2500,
+        )
+        return _parse_feedback(completion)
+    except ModelRouterError as e:
+        print(f"Failed to get a response from OpenAI: {e}")
+        return None
+
+
+def stream_feedback(
+    changeset: str, pr_title: str, pr_description: str, on_progress: ProgressCallback
+) -> Optional[str]:
+    """
+    Streams the feedback completion, reporting the accumulated text as tokens arrive.
+
+    Args:
+        changeset (str): The git diff of code changes.
+        pr_title (str): The title of the pull request.
+        pr_description (str): The description/body of the pull request.
+        on_progress (callable): Receives the feedback text produced so far.
+
+    Returns:
+        str or None: The complete feedback, or None if the request failed.
+    """
+    try:
+        stream = get_model_router().stream(
+            "feedback",
+            prompts.feedback_messages(changeset, pr_description),
+            max_completion_tokens=2500,
+        )
+        review_data = ""
+        for piece in stream:
+            review_data += piece
+            on_progress(review_data)
+        print("Simple Review from OpenAI:\n", review_data)
+        return review_data
+    except ModelRouterError as e:
         print(f"Failed to get a response from OpenAI: {e}")
         return None
 
 
+def _chunk_changes(chunk: List[dict]) -> str:
+    return "\n".join(format_file_changes(file) for file in chunk)
+
+
+def _chunk_key(chunk: List[dict], stage_key: str, pr_description: str) -> str:
+    # The feedback prompt carries the PR description, so feedback is only reused under the same one.
+    return review_cache_key(_chunk_changes(chunk), stage_key, PROMPT_VERSION, context=pr_description)
+
+
+def _part_key(part: dict, stage_key: str) -> str:
+    return review_cache_key(format_file_changes(part), stage_key, PROMPT_VERSION, kind="part")
+
+
+def _plan_chunks(files: List[dict], pr_description: str) -> Tuple[List[List[dict]], Dict[int, str], List[Tuple[int, str, str]]]:
+    """
+    Chunks the changeset, reusing cached feedback wherever a previously reviewed chunk recurs.
+
+    Greedy packing shifts every later chunk when one early file changes, so chunk keys
+    alone would miss on nearly every push. Instead the cache records, for every file part,
+    the chunk it was last reviewed in. Parts whose recorded chunk is complete again (all of
+    its parts are unchanged and present) reuse that chunk's feedback as it is; only the
+    remaining parts are packed into new chunks for the model.
+
+    Args:
+        files (list): File records of the changeset.
+        pr_description (str): The PR description the feedback prompt includes.
+
+    Returns:
+        tuple: The chunks in changeset order, feedback keyed by chunk index for cache
+            hits, and (index, chunk_changes, cache_key) for the chunks that need a model call.
+    """
+    parts = split_changeset(files, config.CHUNK_MAX_TOKENS)
+    cache = get_review_cache()
+    if cache is None:
+        chunks = pack_parts(parts, config.CHUNK_MAX_TOKENS)
+        return chunks, {}, [(index, _chunk_changes(chunk), None) for index, chunk in enumerate(chunks)]
+
+    stage_key = get_model_router().stage_key("feedback")
+    groups: Dict[str, List[int]] = {}
+    for position, part in enumerate(parts):
+        chunk_key = cache.get(_part_key(part, stage_key))
+        if chunk_key:
+            groups.setdefault(chunk_key, []).append(position)
+    # (first part position, chunk, cached feedback or None)
+    planned = []
+    reused = set()
+    for chunk_key, positions in groups.items():
+        chunk = [parts[position] for position in positions]
+        if _chunk_key(chunk, stage_key, pr_description) != chunk_key:
+            continue
+        feedback = cache.get(chunk_key)
+        if feedback is not None:
+            planned.append((positions[0], chunk, feedback))
+            reused.update(positions)
+    remaining = [position for position in range(len(parts)) if position not in reused]
+    offset = 0
+    for chunk in pack_parts([parts[position] for position in remaining], config.CHUNK_MAX_TOKENS):
+        # An exact repeat of a chunk (e.g. a rerun) is still a hit.
+        planned.append((remaining[offset], chunk, cache.get(_chunk_key(chunk, stage_key, pr_description))))
+        offset += len(chunk)
+    planned.sort(key=lambda entry: entry[0])
+
+    chunks = [chunk for _, chunk, _ in planned]
+    cached = {index: feedback for index, (_, _, feedback) in enumerate(planned) if feedback is not None}
+    misses = [
+        (index, _chunk_changes(chunk), _chunk_key(chunk, stage_key, pr_description))
+        for index, (_, chunk, feedback) in enumerate(planned) if feedback is None
+    ]
+    print(f"Review cache: {len(cached)} chunk(s) reused, {len(misses)} chunk(s) sent to the model.")
+    return chunks, cached, misses
+
+
+def _store_chunk_feedback(chunks: List[List[dict]], feedback_by_chunk: Dict[int, Optional[str]], misses, results) -> None:
+    cache = get_review_cache()
+    for (index, _, key), feedback in zip(misses, results):
+        if feedback and cache:
+            cache.put(key, feedback)
+            stage_key = get_model_router().stage_key("feedback")
+            # Part -> chunk links let later pushes find this chunk again wherever it lands.
+            for part in chunks[index]:
+                cache.put(_part_key(part, stage_key), key)
+        feedback_by_chunk[index] = feedback
+
+
+def _combine_chunk_feedback(chunks: List[List[dict]], feedback_by_chunk: Dict[int, Optional[str]]) -> str:
+    if len(chunks) == 1:
+        return feedback_by_chunk.get(0) or ""
+    sections = []
+    for index, chunk in enumerate(chunks):
+        feedback = feedback_by_chunk.get(index)
+        if feedback:
+            filenames = ", ".join(f"`{file['filename']}`" for file in chunk)
+            sections.append(f"#### {filenames}\n{feedback}")
+    return "\n\n".join(sections)
+
+
+def merge_feedback(combined_feedback: str) -> str:
+    """
+    Reduce step of the chunked review: condenses per-chunk feedback with one more model call
+    when it is too long for a single comment. Falls back to the concatenated feedback.
+    """
+    if count_tokens(combined_feedback) <= config.MERGED_FEEDBACK_MAX_TOKENS:
+        return combined_feedback
+    try:
+        completion = get_model_router().complete(
+            "merge",
+            prompts.merge_feedback_messages(combined_feedback),
+            max_completion_tokens=2500,
+        )
+        return _parse_feedback(completion) or combined_feedback
+    except ModelRouterError as e:
+        print(f"Failed to merge chunk feedback with OpenAI: {e}")
+        return combined_feedback
+
+
+async def merge_feedback_async(combined_feedback: str) -> str:
+    if count_tokens(combined_feedback) <= config.MERGED_FEEDBACK_MAX_TOKENS:
+        return combined_feedback
+    try:
+        completion = await get_model_router().acomplete(
+            "merge",
+            prompts.merge_feedback_messages(combined_feedback),
+            max_completion_tokens=2500,
+        )
+        return _parse_feedback(completion) or combined_feedback
+    except ModelRouterError as e:
+        print(f"Failed to merge chunk feedback with OpenAI: {e}")
+        return combined_feedback
+
+
+def get_feedback_for_files(
+    files: List[dict], pr_title: str, pr_description: str, on_progress: Optional[ProgressCallback] = None
+) -> str:
+    """
+    Map-reduce review of a changeset split into token-budgeted chunks.
+
+    Chunks are reviewed in parallel on a bounded thread pool, reusing cached feedback for
+    chunks that were already reviewed, and the results are merged into a single review.
+
+    Args:
+        files (list): File records from get_changeset_files.
+        pr_title (str): The title of the pull request.
+        pr_description (str): The description/body of the pull request.
+        on_progress (callable, optional): Receives the feedback produced so far. A single
+            chunk is streamed token by token; otherwise it is called as each chunk finishes.
+
+    Returns:
+        str: The merged feedback.
+    """
+    chunks, feedback_by_chunk, misses = _plan_chunks(files, pr_description)
+    print(f"Reviewing {len(files)} file(s) in {len(chunks)} chunk(s).")
+    if on_progress and len(chunks) == 1 and misses:
+        _, chunk_changes, _ = misses[0]
+        results = [stream_feedback(chunk_changes, pr_title, pr_description, on_progress)]
+        _store_chunk_feedback(chunks, feedback_by_chunk, misses, results)
+        return _combine_chunk_feedback(chunks, feedback_by_chunk)
+
+    with ThreadPoolExecutor(max_workers=config.CHUNK_CONCURRENCY) as executor:
+        futures = {
+            # Run each chunk in a copy of this context so its model calls reach the invocation's metrics.
+            executor.submit(contextvars.copy_context().run, get_feedback, miss[1], pr_title, pr_description): miss
+            for miss in misses
+        }
+        for future in as_completed(futures):
+            _store_chunk_feedback(chunks, feedback_by_chunk, [futures[future]], [future.result()])
+            if on_progress:
+                on_progress(_combine_chunk_feedback(chunks, feedback_by_chunk))
+    return merge_feedback(_combine_chunk_feedback(chunks, feedback_by_chunk))
+
+
+async def get_feedback_for_files_async(
+    files: List[dict], pr_title: str, pr_description: str, on_progress: Optional[ProgressCallback] = None
+) -> str:
+    chunks, feedback_by_chunk, misses = _plan_chunks(files, pr_description)
+    print(f"Reviewing {len(files)} file(s) in {len(chunks)} chunk(s).")
+    semaphore = asyncio.Semaphore(config.CHUNK_CONCURRENCY)
+
+    async def review_chunk(miss):
+        async with semaphore:
+            return miss, await get_feedback_async(miss[1], pr_title, pr_description)
+
+    for next_done in asyncio.as_completed([review_chunk(miss) for miss in misses]):
+        miss, feedback = await next_done
+        _store_chunk_feedback(chunks, feedback_by_chunk, [miss], [feedback])
+        if on_progress:
+            # Comment updates are blocking HTTP calls; keep them off the event loop.
+            await asyncio.to_thread(on_progress, _combine_chunk_feedback(chunks, feedback_by_chunk))
+    return await merge_feedback_async(_combine_chunk_feedback(chunks, feedback_by_chunk))
+
+
+def _parse_detailed_review(completion: Completion) -> Optional[str]:
+    try:
+        detailed_review_data = completion.text
+        # review_data = ReviewResponse.model_validate(review_json)
+        print("Detailed code review from OpenAI:\n", detailed_review_data)
+        return detailed_review_data
+    except json.JSONDecodeError as e:
+        print(f"Failed to parse OpenAI response as JSON: {e}")
+        return None
+    except Exception as e:
+        print(f"Unexpected error during parsing: {e}")
+        return None
+
+
 def get_detailed_review(
     changeset: str, pr_title: str, pr_description: str
 ) -> Optional[str]:
-    prompt = (
-        "You are an experienced software engineer familiar with leading tech practices in security, observability, reliability, object-oriented design, functional programming, and performance.\n"
-        "Review the following git diff, focusing only on the new code added. "
-        "Provide detailed feedback on logic errors or general mistakes to promote better code quality, consistent variable naming, strongly typed (when applicable), and RESTful design (when applicable)."
-        "Offer as many pragmatic code changes as needed but avoid commenting on acceptable code. "
-        "Avoid reccomending changes about the following: Using a logging library, Deployment Configaration changes.\n\n\n"
-        f"Pull Request Description:\n{pr_description}\n"
-        f"### Code Changes Begin:\n{changeset}\n### Code Changes Ends\n\n"
-        "Think about the code responding, and your final response must strictly adhere to the format as such:"
-        '{"detailed_feedback" : str}'
-    )
     try:
-        response = client.chat.completions.create(
-            model="o1-mini",
-            messages=[{"role": "user", "content": prompt}],
+        completion = get_model_router().complete(
+            "detailed_review",
+            prompts.detailed_review_messages(changeset, pr_description),
             max_completion_tokens=6000,
         )
-        try:
-            detailed_review_data = response.choices[0].message.content
-            # review_data = ReviewResponse.model_validate(review_json)
-            print("Detailed code review from OpenAI:\n", detailed_review_data)
-            return detailed_review_data
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse OpenAI response as JSON: {e}")
-            return None
-        except Exception as e:
-            print(f"Unexpected error during parsing: {e}")
-            return None
-    except openai.OpenAIError as e:
+        return _parse_detailed_review(completion)
+    except ModelRouterError as e:
         print(f"Failed to get a response from OpenAI: {e}")
         return None
 
 
-def suggest_code_changes(feedback: str, changeset: str) -> Optional[CodeSuggestions]:
-    prompt = (
-        "You are an experienced software engineer familiar with leading tech practices in security, observability, reliability, object-oriented design, functional programming, and performance.\n"
-        f"You are provided feedback on the following output of git diff:\n\n{feedback}\n\n"
-        "Based on this feedback, and only this feedback, suggest code changes as new_code to address the issues mentioned."
-        "The old_code should be the code you suggest changing, we will be doing a regex search to make sure it matches exactly as just the code, can be replaced via the new_code.\n "
-        f"Code Changes:\n{changeset}\n\n"
-    )
+async def get_detailed_review_async(
+    changeset: str, pr_title: str, pr_description: str
+) -> Optional[str]:
+    try:
+        completion = await get_model_router().acomplete(
+            "detailed_review",
+            prompts.detailed_review_messages(changeset, pr_description),
+            max_completion_tokens=6000,
+        )
+        return _parse_detailed_review(completion)
+    except ModelRouterError as e:
+        print(f"Failed to get a response from OpenAI: {e}")
+        return None
+
+
+def _parse_code_suggestions(completion: Completion) -> Optional[CodeSuggestions]:
+    suggestions = []
+    if completion.parsed is not None:
+        suggestions_text = completion.parsed
+        suggestions = CodeSuggestions.model_validate(suggestions_text)
+        # suggestions = [s.strip('- ').strip() for s in suggestions if s.strip()]
+        print("Code suggestions from OpenAI:\n", suggestions)
+    return suggestions
+
+
+def suggest_code_changes(feedback: str, changeset: str, related_code: str = "") -> Optional[CodeSuggestions]:
+    try:
+        completion = get_model_router().complete(
+            "code_suggestions",
+            prompts.code_suggestions_messages(feedback, changeset, related_code),
+            max_completion_tokens=4000,
+            response_format=CodeSuggestions,
+        )
+        return _parse_code_suggestions(completion)
+    except ModelRouterError as e:
+        print(f"Failed to get code suggestions from OpenAI: {e}")
+        return None
+
 
+async def suggest_code_changes_async(feedback: str, changeset: str, related_code: str = "") -> Optional[CodeSuggestions]:
     try:
-        response = client.beta.chat.completions.parse(
-            model="gpt-4o-2024-08-06",
-            messages=[{"role": "user", "content": prompt}],
+        completion = await get_model_router().acomplete(
+            "code_suggestions",
+            prompts.code_suggestions_messages(feedback, changeset, related_code),
             max_completion_tokens=4000,
             response_format=CodeSuggestions,
         )
-        suggestions = []
-        if response.choices:
-            suggestions_text = response.choices[0].message.parsed
-            suggestions = CodeSuggestions.model_validate(suggestions_text)
-            # suggestions = [s.strip('- ').strip() for s in suggestions if s.strip()]
-            print("Code suggestions from OpenAI:\n", suggestions)
-        return suggestions
-    except openai.OpenAIError as e:
+        return _parse_code_suggestions(completion)
+    except ModelRouterError as e:
         print(f"Failed to get code suggestions from OpenAI: {e}")
         return None
 
 
 def review_code_with_openai(
-    changeset: str, pr_title: str, pr_description: str
+    changeset: str,
+    pr_title: str,
+    pr_description: str,
+    files: Optional[List[dict]] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    code_context: Optional[CodeContextProvider] = None,
 ) -> Optional[ReviewResponse]:
     """
     Orchestrates the code review and suggestion process by making multiple OpenAI API calls.
@@ -183,14 +441,28 @@ def review_code_with_openai(
         changeset (str): The git diff of code changes.
         pr_title (str): The title of the pull request.
         pr_description (str): The description/body of the pull request.
+        files (list, optional): Per-file records of the changeset. When given, the changeset is
+            reviewed in token-budgeted chunks and unchanged chunks reuse cached feedback.
+        on_progress (callable, optional): Receives the partial feedback while it is generated.
+        code_context (callable, optional): Returns code related to the changeset for the code
+            suggestion stage (async mode with DETAILED_REVIEW only).
 
     Returns:
         ReviewResponse: A structured response containing the PR summary, pull request description, feedback, and code suggestions.
     """
-    
+    if config.ASYNC_REVIEW:
+        return asyncio.run(review_code_with_openai_async(changeset, pr_title, pr_description, files, on_progress, code_context))
+
     # TODO: if pr description exists- account for that.
-    pr_summary = get_pr_summary(changeset)
-    feedback = get_feedback(changeset, pr_title, pr_summary)
+    if files is not None:
+        pr_summary = get_pr_summary(summary_context(files, config.CHUNK_MAX_TOKENS))
+        feedback = get_feedback_for_files(files, pr_title, pr_summary, on_progress)
+    else:
+        pr_summary = get_pr_summary(changeset)
+        if on_progress:
+            feedback = stream_feedback(changeset, pr_title, pr_summary, on_progress)
+        else:
+            feedback = get_feedback(changeset, pr_title, pr_summary)
 
     # # TODO: the issue here is- detailed_review inference format has high variability. one idea is ask for response for each files and their issue. Then the next call would fix this
     # detailed_review = get_detailed_review(changeset, pr_title, pr_summary)
@@ -205,3 +477,115 @@ def review_code_with_openai(
         #   code_suggestions=suggestions,
         pull_request_description=pr_summary.pull_request_description,
     )
+
+
+# A stage is (names of the stages it depends on, coroutine function receiving their results).
+Stage = Tuple[Tuple[str, ...], Callable[[Dict[str, object]], Awaitable[object]]]
+
+
+async def run_stage_graph(stages: Dict[str, Stage]) -> Dict[str, object]:
+    """
+    Runs review stages as a dependency graph on the event loop.
+
+    Every stage is started immediately and only awaits the stages it depends on, so
+    independent model calls overlap and the total latency is that of the longest chain.
+
+    Args:
+        stages (dict): Maps a stage name to a (dependencies, coroutine function) tuple.
+
+    Returns:
+        dict: The result of every stage, keyed by stage name.
+    """
+    # Reject unknown dependencies and cycles up front; either would deadlock the graph.
+    resolved = set()
+    pending = dict(stages)
+    while pending:
+        ready = [name for name, (deps, _) in pending.items() if set(deps) <= resolved]
+        if not ready:
+            raise ValueError(f"Unresolvable stage dependencies: {sorted(pending)}")
+        for name in ready:
+            resolved.add(name)
+            del pending[name]
+
+    tasks: Dict[str, asyncio.Task] = {}
+
+    async def run_stage(name: str):
+        deps, stage_fn = stages[name]
+        dep_results = {dep: await tasks[dep] for dep in deps}
+        return await stage_fn(dep_results)
+
+    for name in stages:
+        tasks[name] = asyncio.create_task(run_stage(name))
+
+    results = await asyncio.gather(*tasks.values())
+    return dict(zip(tasks.keys(), results))
+
+
+async def review_code_with_openai_async(
+    changeset: str,
+    pr_title: str,
+    pr_description: str,
+    files: Optional[List[dict]] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    code_context: Optional[CodeContextProvider] = None,
+) -> Optional[ReviewResponse]:
+    """
+    Async counterpart of review_code_with_openai that runs the stages concurrently.
+
+    The summary and feedback no longer chain: feedback is given the author's PR description
+    instead of the generated summary, so both calls start at once. With DETAILED_REVIEW
+    enabled the detailed review runs alongside them and code suggestions follow it, together
+    with the related code retrieved by code_context on a worker thread in the meantime.
+
+    Args:
+        changeset (str): The git diff of code changes.
+        pr_title (str): The title of the pull request.
+        pr_description (str): The description/body of the pull request.
+        files (list, optional): Per-file records of the changeset, reviewed in chunks when given.
+        on_progress (callable, optional): Receives the merged feedback as each chunk finishes.
+        code_context (callable, optional): Returns code related to the changeset for code suggestions.
+
+    Returns:
+        ReviewResponse: A structured response containing the PR summary, feedback, and optional detailed review and code suggestions.
+    """
+    if files is not None:
+        summary_changeset = summary_context(files, config.CHUNK_MAX_TOKENS)
+        feedback_stage = lambda _: get_feedback_for_files_async(files, pr_title, pr_description, on_progress)
+    else:
+        summary_changeset = changeset
+        feedback_stage = lambda _: get_feedback_async(changeset, pr_title, pr_description)
+    stages: Dict[str, Stage] = {
+        "summary": ((), lambda _: get_pr_summary_async(summary_changeset)),
+        "feedback": ((), feedback_stage),
+    }
+    if config.DETAILED_REVIEW:
+        stages["detailed_review"] = ((), lambda _: get_detailed_review_async(changeset, pr_title, pr_description))
+        # Retrieval is blocking I/O and SQLite; it overlaps with the detailed review.
+        stages["code_context"] = ((), lambda _: asyncio.to_thread(code_context) if code_context else _no_context())
+        stages["code_suggestions"] = (
+            ("detailed_review", "code_context"),
+            lambda deps: _suggest_from_review_async(deps["detailed_review"], changeset, deps["code_context"]),
+        )
+
+    results = await run_stage_graph(stages)
+
+    pr_summary = results["summary"]
+    suggestions = results.get("code_suggestions")
+    return ReviewResponse(
+        feedback=results["feedback"] or "",
+        pull_request_description=pr_summary.pull_request_description if pr_summary else "",
+        detailed_feedback=results.get("detailed_review"),
+        code_suggestions=suggestions.code_suggestions if suggestions else None,
+    )
+
+
+async def _no_context() -> str:
+    return ""
+
+
+async def _suggest_from_review_async(
+    detailed_review: Optional[str], changeset: str, related_code: str = ""
+) -> Optional[CodeSuggestions]:
+    if not detailed_review:
+        return None
+    return await suggest_code_changes_async(detailed_review, changeset, related_code)
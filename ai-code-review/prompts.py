@@ -0,0 +1,114 @@
+"""
+Prompt templates for every review stage.
+
+Providers cache the longest prompt prefix they have recently seen, so every template is
+laid out from most to least stable:
+
+1. REVIEW_PREFIX: instructions and example feedback shared by all stages and all PRs.
+2. The diff, identical for every stage that reviews the same changes.
+3. Per-stage material: the PR description, related code or earlier feedback.
+4. The stage's own task, last and short.
+
+Caching starts at 1024 prompt tokens. The shared instructions alone do not reach that,
+but instructions plus diff do for all but the smallest PRs, so the summary, feedback and
+detailed review calls of one PR, and a re-review of an unchanged chunk, hit the cache for
+everything up to the end of the diff. Nothing that differs between stages may be moved
+before the diff, and the prefix must not be reworded without bumping PROMPT_VERSION.
+"""
+from typing import Dict, List
+
+# Bump whenever a prompt changes so cached reviews from the old prompt are not reused.
+PROMPT_VERSION = "4"
+
+Messages = List[Dict[str, str]]
+
+REVIEW_PREFIX = (
+    "You are an experienced software engineer familiar with leading tech practices in security, observability, reliability, object-oriented design, functional programming, and performance.\n"
+    "You review git diffs of Pull Requests, focusing only on the new code added. "
+    "Look for logic errors or general mistakes to promote better code quality, consistent variable naming, strongly typed (when applicable), and RESTful design (when applicable). "
+    "Avoid commenting on acceptable code, and avoid commenting about the following: Using a logging library, Deployment Configaration changes.\n\n"
+    "Review feedback is kept brief, assuming the reader prefers short text and optimal clarity, in a markdown list. For example:\n\n"
+    """Example Feedback 1 : Everything looks great! 🚀 Your implementation of user activity features is solid. Keep up the excellent work! \n\n"""
+    """Example Feedback 2: 🌟 **Awesome work fixing the expert instruction endpoint bug!** Your changes are clean and align well with best practices. Just a couple of minor suggestions to ensure everything runs smoothly:
+
+1. **Type Annotations**:
+   - Ensure that the new `command` parameter in `Agent` is strongly typed. For example:
+     ```python
+     def __init__(self, index: IndexType, response: ResponseType, command: CommandType):
+         ...
+     ```
+
+2. **Consistent Variable Naming**:
+   - In `local_handler.py`, consider renaming `command` to `command_data` for clarity, especially if it represents fetched data.
+
+3. **RESTful Endpoint Consistency**:
+   - You've updated the endpoint to `commands`, which is great for RESTful design. Just ensure all related API calls and documentation reflect this change to avoid discrepancies.
+
+Keep up the stellar work! 🚀 Debugging like a pro and making the codebase shine brighter than a freshly minted patch! 💪✨\n\n"""
+    "The Pull Request to work on follows, then its description. Your task is given at the very end.\n\n"
+)
+
+SUMMARY_TASK = (
+    "Task: provide a concise summary of the Pull Request. "
+    "The summary should briefly describe the purpose and scope of the changes."
+)
+
+FEEDBACK_TASK = (
+    "Task: provide concise review feedback on the code changes above, like the example feedback. "
+    "Offer code changes if needed."
+)
+
+DETAILED_REVIEW_TASK = (
+    "Task: provide detailed review feedback on the code changes above. "
+    "Offer as many pragmatic code changes as needed. "
+    "Think about the code responding, and your final response must strictly adhere to the format as such:"
+    '{"detailed_feedback" : str}'
+)
+
+CODE_SUGGESTIONS_TASK = (
+    "Task: based on this feedback, and only this feedback, suggest code changes as new_code to address the issues mentioned. "
+    "Use the related code, when given, to keep the suggestions consistent with how the changed functions are defined and called. "
+    "The old_code should be the code you suggest changing, we will be doing a regex search to make sure it matches exactly as just the code, can be replaced via the new_code."
+)
+
+MERGE_FEEDBACK_TASK = (
+    "Task: the feedback above was given for several parts of the same Pull Request. "
+    "Merge it into one concise review in a markdown list: remove duplicates and keep every file reference and code example."
+)
+
+
+def _pull_request(changeset: str) -> str:
+    return f"### Code Changes Begin:\n{changeset}\n### Code Changes Ends\n\n"
+
+
+def _description(pr_description: str) -> str:
+    return f"Pull Request Description:\n{pr_description}\n\n" if pr_description else ""
+
+
+def _user(content: str) -> Messages:
+    # A single user message: o1 models take no system role, and caching only sees the token prefix.
+    return [{"role": "user", "content": content}]
+
+
+def summary_messages(changeset: str) -> Messages:
+    return _user(REVIEW_PREFIX + _pull_request(changeset) + SUMMARY_TASK)
+
+
+def feedback_messages(changeset: str, pr_description: str) -> Messages:
+    return _user(REVIEW_PREFIX + _pull_request(changeset) + _description(pr_description) + FEEDBACK_TASK)
+
+
+def detailed_review_messages(changeset: str, pr_description: str) -> Messages:
+    return _user(REVIEW_PREFIX + _pull_request(changeset) + _description(pr_description) + DETAILED_REVIEW_TASK)
+
+
+def code_suggestions_messages(feedback: str, changeset: str, related_code: str = "") -> Messages:
+    related = f"### Related Code Begins:\n{related_code}\n### Related Code Ends\n\n" if related_code else ""
+    return _user(
+        REVIEW_PREFIX + _pull_request(changeset) + related
+        + f"Feedback on these changes:\n\n{feedback}\n\n" + CODE_SUGGESTIONS_TASK
+    )
+
+
+def merge_feedback_messages(combined_feedback: str) -> Messages:
+    return _user(REVIEW_PREFIX + f"### Feedback Begins:\n{combined_feedback}\n### Feedback Ends\n\n" + MERGE_FEEDBACK_TASK)
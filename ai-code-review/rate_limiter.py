@@ -0,0 +1,287 @@
+import asyncio
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# A call returns its result and the response headers carrying the rate limit state.
+RateLimitedCall = Callable[[], Tuple[object, Dict[str, str]]]
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_SECONDS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """Parses OpenAI reset durations such as `1s`, `6m0s` or `20ms` into seconds."""
+    if not value:
+        return None
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """
+    Refilling budget of requests or tokens per minute.
+
+    Reservations may overdraw the bucket; the caller then waits until the refill has
+    paid the debt, which spaces calls out evenly instead of bursting into a 429.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.refill_per_s = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.refill_per_s)
+        self.updated = now
+
+    def reserve(self, amount: float) -> float:
+        """Takes amount from the bucket and returns how long to wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level -= min(amount, self.capacity)
+            return 0.0 if self.level >= 0 else -self.level / self.refill_per_s
+
+    def sync(self, limit: float, remaining: float) -> None:
+        """Adopts the server's view of the budget from rate limit headers."""
+        with self._lock:
+            self._refill(time.monotonic())
+            if limit != self.capacity:
+                self.capacity = limit
+                self.refill_per_s = limit / 60
+            # Reservations made since the request left are not in `remaining` yet, so only lower.
+            self.level = min(self.level, remaining)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on calls in flight: grows by one after a window of successes and halves
+    on a rate limit, so concurrent reviews settle just under the provider's limit.
+
+    Threads block on a condition; coroutines wait on a future of their own event loop,
+    woken whenever a slot may have opened, so waiting ties up no thread and a cancelled
+    waiter holds no slot.
+    """
+
+    def __init__(self, initial: int, maximum: int):
+        self.maximum = maximum
+        self.limit = float(min(initial, maximum))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                waiter = loop.create_future()
+                self._async_waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self._condition:
+                    if (loop, waiter) in self._async_waiters:
+                        self._async_waiters.remove((loop, waiter))
+
+    def _wake_async_waiters(self) -> None:
+        # Called with the condition held. Every waiter retries, so a cancelled one loses no wakeup.
+        for loop, waiter in self._async_waiters:
+            try:
+                loop.call_soon_threadsafe(_resolve, waiter)
+            except RuntimeError:
+                # The waiter's event loop is closed.
+                pass
+        self._async_waiters.clear()
+
+    def release(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+            self._wake_async_waiters()
+
+    def on_success(self) -> None:
+        with self._condition:
+            self.limit = min(self.maximum, self.limit + 1 / max(1.0, self.limit))
+            self._condition.notify()
+            self._wake_async_waiters()
+
+    def on_rate_limited(self) -> None:
+        with self._condition:
+            self.limit = max(1.0, self.limit / 2)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def _resolve(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class ModelLimiter:
+    """Request and token budgets plus adaptive concurrency for one model."""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, max_concurrency: int = 64):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency, max_concurrency)
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        with self._lock:
+            request_wait = self.requests.reserve(1) if self.requests else 0.0
+            token_wait = self.tokens.reserve(tokens) if self.tokens else 0.0
+        return max(request_wait, token_wait)
+
+    def update_from_headers(self, headers) -> None:
+        """Learns the budgets from `x-ratelimit-*` response headers."""
+        if not headers:
+            return
+        for kind in ("requests", "tokens"):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            if limit is None or remaining is None:
+                continue
+            with self._lock:
+                bucket = getattr(self, kind)
+                if bucket is None:
+                    bucket = TokenBucket(float(limit))
+                    setattr(self, kind, bucket)
+                bucket.sync(float(limit), float(remaining))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    if getattr(error, "status_code", None) != 429:
+        return False
+    # An exhausted quota will not recover by waiting.
+    return getattr(error, "code", None) != "insufficient_quota"
+
+
+def _error_headers(error: Exception) -> Dict[str, str]:
+    response = getattr(error, "response", None)
+    return getattr(response, "headers", None) or {}
+
+
+def _retry_delay(headers, attempt: int, base_s: float, max_s: float) -> float:
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        return min(max_s, float(retry_after_ms) / 1000)
+    retry_after = parse_reset_duration(headers.get("retry-after"))
+    if retry_after is not None:
+        return min(max_s, retry_after)
+    # Full jitter keeps concurrent callers from retrying in lockstep.
+    return random.uniform(0, min(max_s, base_s * 2 ** attempt))
+
+
+class RateLimiter:
+    """
+    Schedules model calls against per-model request and token budgets.
+
+    Budgets come from configured limits and are kept in step with the provider's
+    rate limit headers. Calls wait for their reservation, run within the model's adaptive
+    concurrency limit, and are retried with jittered backoff on 429 responses.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        max_concurrency: int = 64,
+        max_retries: int = 3,
+        backoff_s: float = 1.0,
+        max_backoff_s: float = 30.0,
+    ):
+        self.limits = limits or {}
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self._models: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str) -> ModelLimiter:
+        with self._lock:
+            limiter = self._models.get(model)
+            if limiter is None:
+                rpm, tpm = self.limits.get(model, (0, 0))
+                limiter = ModelLimiter(rpm, tpm, self.max_concurrency)
+                self._models[model] = limiter
+            return limiter
+
+    def call(self, model: str, tokens: int, fn: RateLimitedCall):
+        """
+        Runs fn within the model's budgets.
+
+        Args:
+            model (str): The model the call is billed to.
+            tokens (int): Estimated tokens, prompt plus completion limit.
+            fn (callable): Makes the call and returns (result, response headers).
+
+        Returns:
+            The result of fn.
+        """
+        limiter = self.for_model(model)
+        for attempt in range(self.max_retries + 1):
+            time.sleep(limiter.reserve(tokens))
+            try:
+                with limiter.concurrency:
+                    result, headers = fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = self._on_rate_limited(limiter, model, e, attempt)
+                time.sleep(delay)
+                continue
+            limiter.update_from_headers(headers)
+            limiter.concurrency.on_success()
+            return result
+
+    async def acall(self, model: str, tokens: int, fn):
+        """Async counterpart of call; fn is a coroutine function."""
+        limiter = self.for_model(model)
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(limiter.reserve(tokens))
+            # Waits on the event loop, so other stages keep running and cancellation takes no slot.
+            await limiter.concurrency.acquire_async()
+            try:
+                result, headers = await fn()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                delay = self._on_rate_limited(limiter, model, e, attempt)
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                limiter.concurrency.release()
+            limiter.update_from_headers(headers)
+            limiter.concurrency.on_success()
+            return result
+
+    def _on_rate_limited(self, limiter: ModelLimiter, model: str, error: Exception, attempt: int) -> float:
+        headers = _error_headers(error)
+        limiter.update_from_headers(headers)
+        limiter.concurrency.on_rate_limited()
+        delay = _retry_delay(headers, attempt, self.backoff_s, self.max_backoff_s)
+        print(f"Rate limited on {model}; retrying in {delay:.1f}s with concurrency {int(limiter.concurrency.limit)}.")
+        return delay
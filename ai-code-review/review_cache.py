@@ -0,0 +1,59 @@
+import hashlib
+from functools import lru_cache
+from typing import Optional
+from config import config
+from storage import KeyValueStore, create_store
+
+
+def review_cache_key(content: str, model: str, prompt_version: str, kind: str = "feedback", context: str = "") -> str:
+    """
+    Builds a content-addressed cache key.
+
+    Args:
+        content (str): The patch text the review was produced from.
+        model (str): The model that produced the review.
+        prompt_version (str): Version of the prompt template used.
+        kind (str): Which review stage the entry belongs to.
+        context (str): Any other prompt input the review depends on, such as the PR description.
+
+    Returns:
+        str: The cache key.
+    """
+    digest = hashlib.sha256()
+    for part in (kind, model, prompt_version, context, content):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return f"review:{kind}:{digest.hexdigest()}"
+
+
+class ReviewCache:
+    """Stores model output keyed on the exact content it was produced from."""
+
+    def __init__(self, store: KeyValueStore, ttl: Optional[float] = None):
+        self.store = store
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            return self.store.get(key)
+        except Exception as e:
+            # A broken cache must never fail the review itself.
+            print(f"Review cache lookup failed: {e}")
+            return None
+
+    def put(self, key: str, review: str) -> None:
+        try:
+            self.store.set(key, review, self.ttl)
+        except Exception as e:
+            print(f"Review cache write failed: {e}")
+
+
+@lru_cache(maxsize=1)
+def get_review_cache() -> Optional[ReviewCache]:
+    """
+    Returns the process-wide review cache, or None when REVIEW_CACHE_URL is unset.
+    """
+    if not config.REVIEW_CACHE_URL:
+        return None
+    store = create_store(config.REVIEW_CACHE_URL, config.REVIEW_CACHE_MAX_ENTRIES)
+    return ReviewCache(store, config.REVIEW_CACHE_TTL_SECONDS)
@@ -0,0 +1,186 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from chunking import split_patch_into_hunks
+from compaction import omitted_line_count
+
+# Suggestions beyond this many are listed in the review body instead of inline.
+MAX_INLINE_COMMENTS = 50
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@")
+
+
+@dataclass
+class DiffLine:
+    """A line on the right side of a diff, which is where review comments can go."""
+
+    line: int
+    text: str
+    added: bool
+    hunk: int
+
+
+def _leading_whitespace(text: str) -> str:
+    return text[: len(text) - len(text.lstrip())]
+
+
+def _code_lines(code: str) -> List[str]:
+    lines = code.splitlines()
+    while lines and not lines[0].strip():
+        lines.pop(0)
+    while lines and not lines[-1].strip():
+        lines.pop()
+    return lines
+
+
+class FileLineIndex:
+    """
+    The commentable lines of one file's patch, indexed by their stripped text.
+
+    Built once per file, so locating a suggestion's old_code only compares the few lines
+    that start like it rather than rescanning the patch for every suggestion.
+    """
+
+    def __init__(self, patch: str):
+        self.lines: List[DiffLine] = []
+        self._by_text: Dict[str, List[int]] = defaultdict(list)
+        for hunk_index, hunk in enumerate(split_patch_into_hunks(patch)):
+            hunk_lines = hunk.splitlines()
+            header = _HUNK_HEADER.match(hunk_lines[0]) if hunk_lines else None
+            if header is None:
+                continue
+            number = int(header.group(1))
+            for text in hunk_lines[1:]:
+                if text.startswith(("-", "\\")):
+                    continue
+                omitted = omitted_line_count(text)
+                if omitted is not None:
+                    number += omitted
+                    continue
+                self._by_text[text[1:].strip()].append(len(self.lines))
+                self.lines.append(DiffLine(number, text[1:], text.startswith("+"), hunk_index))
+                number += 1
+
+    def _matches(self, start: int, code: List[str]) -> bool:
+        end = start + len(code)
+        if end > len(self.lines) or self.lines[end - 1].hunk != self.lines[start].hunk:
+            return False
+        return all(
+            self.lines[start + offset].text.strip() == code_line.strip() for offset, code_line in enumerate(code)
+        )
+
+    def find(self, code: str) -> Optional[Tuple[DiffLine, DiffLine]]:
+        """
+        Locates code among the right-side lines of one hunk, ignoring indentation.
+
+        Ranges that include added lines win over ranges of unchanged context.
+
+        Returns:
+            tuple: The first and last matching lines, or None when code is not in the diff.
+        """
+        code_lines = _code_lines(code)
+        if not code_lines:
+            return None
+        matches = [start for start in self._by_text.get(code_lines[0].strip(), []) if self._matches(start, code_lines)]
+        if not matches:
+            return None
+        start = next(
+            (start for start in matches if any(line.added for line in self.lines[start:start + len(code_lines)])),
+            matches[0],
+        )
+        return self.lines[start], self.lines[start + len(code_lines) - 1]
+
+
+def build_line_indexes(files: List[dict]) -> Dict[str, FileLineIndex]:
+    return {
+        file['filename']: FileLineIndex(file['patch'])
+        for file in files
+        if file.get('patch') and file.get('status') != 'removed'
+    }
+
+
+def _resolve_filename(filename: str, indexes: Dict[str, FileLineIndex]) -> Optional[str]:
+    if filename in indexes:
+        return filename
+    # Models sometimes drop the directory or add a leading `./` or `/`.
+    filename = filename.removeprefix("./").lstrip("/")
+    candidates = [path for path in indexes if path == filename or path.endswith("/" + filename)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def _reindent(new_code: str, code_indent: str, file_indent: str) -> str:
+    if code_indent == file_indent:
+        return new_code
+    return "\n".join(
+        file_indent + line[len(code_indent):] if line.startswith(code_indent) and line.strip() else line
+        for line in new_code.splitlines()
+    )
+
+
+def suggestion_comment(path: str, first: DiffLine, last: DiffLine, old_code: str, new_code: str) -> dict:
+    """Builds an inline review comment replacing lines first..last with new_code."""
+    code_indent = _leading_whitespace(_code_lines(old_code)[0])
+    replacement = _reindent("\n".join(_code_lines(new_code)), code_indent, _leading_whitespace(first.text))
+    comment = {
+        'path': path,
+        'line': last.line,
+        'side': 'RIGHT',
+        'body': f"```suggestion\n{replacement}\n```",
+    }
+    if first.line != last.line:
+        comment['start_line'] = first.line
+        comment['start_side'] = 'RIGHT'
+    return comment
+
+
+def map_suggestions(suggestions, files: List[dict]) -> Tuple[List[dict], list]:
+    """
+    Resolves code suggestions to inline review comments on the lines they replace.
+
+    Args:
+        suggestions (list): CodeSuggestion objects with filename, old_code and new_code.
+        files (list): File records of the reviewed changeset; patches may be compacted.
+
+    Returns:
+        tuple: Review comments for the suggestions found in the diff, and the suggestions
+            that could not be placed (their code is not in the diff, or too many of them).
+    """
+    indexes = build_line_indexes(files)
+    comments = []
+    unplaced = []
+    placed_lines = set()
+    for suggestion in suggestions:
+        path = _resolve_filename(suggestion.filename, indexes)
+        found = indexes[path].find(suggestion.old_code) if path else None
+        if found is None or len(comments) >= MAX_INLINE_COMMENTS or (path, found[1].line) in placed_lines:
+            unplaced.append(suggestion)
+            continue
+        placed_lines.add((path, found[1].line))
+        comments.append(suggestion_comment(path, found[0], found[1], suggestion.old_code, suggestion.new_code))
+    return comments, unplaced
+
+
+def format_unplaced_suggestions(suggestions) -> str:
+    return "\n\n".join(
+        f"**{suggestion.filename}**\n```\n{suggestion.new_code.strip()}\n```" for suggestion in suggestions
+    )
+
+
+def post_code_suggestions(repository_full_name, pr_number, head_sha, suggestions, files, github_token, test_mode):
+    """
+    Posts code suggestions as one PR review with a `suggestion` block on each changed line range.
+
+    Suggestions whose old_code is not found in the diff are listed in the review body, so a
+    review costs a single API write however many suggestions it carries.
+
+    Returns:
+        int or None: The ID of the review, or None if nothing was posted.
+    """
+    from github_client import post_pull_request_review
+
+    comments, unplaced = map_suggestions(suggestions, files)
+    body = f"**EXPERIMENTAL: Automated Code Review** suggested {len(comments) + len(unplaced)} change(s)."
+    if unplaced:
+        body += "\n\nThese could not be placed on a changed line:\n\n" + format_unplaced_suggestions(unplaced)
+    return post_pull_request_review(repository_full_name, pr_number, head_sha, body, comments, github_token, test_mode)
@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import sys
+import time
+from config import config
+from event_filter import should_review_event
+
+# GitHub caps webhook payloads at 25 MB.
+MAX_BODY_BYTES = 25 * 1024 * 1024
+# How long shutdown waits for reviews in flight before cancelling them.
+SHUTDOWN_GRACE_SECONDS = 30
+
+
+def verify_signature(secret: str, body: bytes, signature: str) -> bool:
+    """
+    Checks the X-Hub-Signature-256 header GitHub sends with every webhook delivery.
+
+    Args:
+        secret (str): The webhook secret configured on GitHub.
+        body (bytes): The raw request body, before any decoding.
+        signature (str): The header value, "sha256=<hex digest>".
+
+    Returns:
+        bool: Whether the body was signed with the secret.
+    """
+    if not secret or not signature:
+        return False
+    expected = "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+class ServerStats:
+    """Counters exposed on /metrics, updated only from the event loop."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.webhooks = {}
+        self.reviews = {}
+        self.in_flight = 0
+        self.pending = 0
+        self.review_seconds = 0.0
+
+    def count(self, counter: dict, label: str) -> None:
+        counter[label] = counter.get(label, 0) + 1
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP ai_code_review_webhooks_total Webhook deliveries by outcome.",
+            "# TYPE ai_code_review_webhooks_total counter",
+        ]
+        lines += [f'ai_code_review_webhooks_total{{result="{label}"}} {value}' for label, value in sorted(self.webhooks.items())]
+        lines += [
+            "# HELP ai_code_review_reviews_total Finished reviews by HTTP status class.",
+            "# TYPE ai_code_review_reviews_total counter",
+        ]
+        lines += [f'ai_code_review_reviews_total{{status="{label}"}} {value}' for label, value in sorted(self.reviews.items())]
+        lines += [
+            "# HELP ai_code_review_review_seconds_total Time spent in finished reviews.",
+            "# TYPE ai_code_review_review_seconds_total counter",
+            f"ai_code_review_review_seconds_total {self.review_seconds:.3f}",
+            "# HELP ai_code_review_reviews_in_flight Reviews running now.",
+            "# TYPE ai_code_review_reviews_in_flight gauge",
+            f"ai_code_review_reviews_in_flight {self.in_flight}",
+            "# HELP ai_code_review_reviews_pending Accepted reviews waiting for a free slot.",
+            "# TYPE ai_code_review_reviews_pending gauge",
+            f"ai_code_review_reviews_pending {self.pending}",
+            "# HELP ai_code_review_uptime_seconds Seconds since the server started.",
+            "# TYPE ai_code_review_uptime_seconds gauge",
+            f"ai_code_review_uptime_seconds {time.time() - self.started:.0f}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class WebhookServer:
+    """
+    ASGI app that reviews GitHub pull request webhooks in a long-running process.
+
+    Deliveries are verified against WEBHOOK_SECRET and acknowledged with 202 before the
+    review starts, well within GitHub's 10 second delivery timeout. Reviews run as tasks on
+    the server's event loop, SERVER_MAX_CONCURRENT_REVIEWS at a time, so they share its
+    model clients and connection pools; only blocking GitHub, git and store calls take a
+    worker thread. Up to SERVER_MAX_PENDING_REVIEWS more wait for a slot; beyond that
+    deliveries get 503 and can be redelivered from GitHub.
+
+    Routes:
+        POST /webhook (or /): a GitHub webhook delivery.
+        GET /healthz: liveness and load as JSON.
+        GET /metrics: server counters in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.stats = ServerStats()
+        self._slots = None
+        self._tasks = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+        method, path = scope["method"], scope["path"].rstrip("/") or "/"
+        if method == "POST" and path in ("/", "/webhook"):
+            status, payload = await self._webhook(scope, receive)
+            await _send_json(send, status, payload)
+        elif method == "GET" and path == "/healthz":
+            await _send_json(send, 200, self.health())
+        elif method == "GET" and path == "/metrics":
+            await _send(send, 200, self.stats.to_prometheus().encode(), b"text/plain; version=0.0.4")
+        else:
+            await _send_json(send, 404, {"error": "not found"})
+
+    def health(self) -> dict:
+        return {
+            "status": "ok",
+            "reviews_in_flight": self.stats.in_flight,
+            "reviews_pending": self.stats.pending,
+            "uptime_seconds": round(time.time() - self.stats.started),
+        }
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def start(self) -> None:
+        """Sets up the review slots; called on lifespan startup, or by the first review otherwise."""
+        if not config.WEBHOOK_SECRET:
+            print("WEBHOOK_SECRET is not set; every webhook delivery will be rejected.")
+        self._slots = asyncio.Semaphore(config.SERVER_MAX_CONCURRENT_REVIEWS)
+
+    async def shutdown(self) -> None:
+        if not self._tasks:
+            return
+        print(f"Waiting for {len(self._tasks)} review(s) to finish.")
+        _, unfinished = await asyncio.wait(self._tasks, timeout=SHUTDOWN_GRACE_SECONDS)
+        for task in unfinished:
+            task.cancel()
+        if unfinished:
+            await asyncio.wait(unfinished)
+
+    async def _webhook(self, scope, receive):
+        headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]}
+        body = await _read_body(receive)
+        if body is None:
+            self.stats.count(self.stats.webhooks, "too_large")
+            return 413, {"error": "payload too large"}
+        if not verify_signature(config.WEBHOOK_SECRET, body, headers.get("x-hub-signature-256", "")):
+            self.stats.count(self.stats.webhooks, "unauthorized")
+            return 401, {"error": "invalid signature"}
+
+        github_event = headers.get("x-github-event", "pull_request")
+        if github_event == "ping":
+            self.stats.count(self.stats.webhooks, "ping")
+            return 200, {"message": "pong"}
+        if github_event != "pull_request":
+            self.stats.count(self.stats.webhooks, "ignored")
+            return 200, {"message": f"GitHub webhook ignored: {github_event} event"}
+        try:
+            text = body.decode("utf-8")
+            payload = json.loads(text)
+        except ValueError:
+            self.stats.count(self.stats.webhooks, "invalid")
+            return 400, {"error": "body is not JSON"}
+
+        # Checked here as well as in the handler so ignored events are answered as such.
+        should_review, skip_reason = should_review_event(payload)
+        if not should_review:
+            self.stats.count(self.stats.webhooks, "ignored")
+            return 200, {"message": f"GitHub PR webhook ignored: {skip_reason}"}
+        if self.stats.pending >= config.SERVER_MAX_PENDING_REVIEWS:
+            self.stats.count(self.stats.webhooks, "overloaded")
+            return 503, {"error": "too many reviews pending"}
+
+        self.stats.count(self.stats.webhooks, "accepted")
+        self.stats.pending += 1
+        task = asyncio.create_task(self._review({"body": text}))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return 202, {"message": f"GitHub PR webhook accepted: {payload.get('action', 'Unknown')}"}
+
+    async def _review(self, event):
+        # Imported on first review so the server starts without the review stack.
+        from lambda_handler import handle_event_async
+
+        if self._slots is None:
+            self.start()
+        started = time.perf_counter()
+        running = False
+        status = 500
+        try:
+            async with self._slots:
+                self.stats.pending -= 1
+                self.stats.in_flight += 1
+                running = True
+                response = await handle_event_async(event, None, "server")
+            status = response['statusCode']
+        except Exception as e:
+            print(f"Review raised: {e}")
+        finally:
+            # Runs as well when shutdown cancels a review, whether or not it had a slot.
+            if running:
+                self.stats.in_flight -= 1
+            else:
+                self.stats.pending -= 1
+            self.stats.review_seconds += time.perf_counter() - started
+            self.stats.count(self.stats.reviews, f"{status // 100}xx")
+
+
+async def _read_body(receive):
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _send(send, status, body, content_type):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_json(send, status, payload):
+    await _send(send, status, json.dumps(payload).encode(), b"application/json")
+
+
+app = WebhookServer()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve GitHub pull request webhooks from a long-running process.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args(argv)
+    try:
+        import uvicorn
+    except ImportError:
+        print("The webhook server needs uvicorn: install the `server` extra (poetry install -E server).")
+        return 1
+    # One process and one event loop, so every review shares the same clients and pools.
+    uvicorn.run(app, host=args.host, port=args.port, workers=1, lifespan="on")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class KeyValueStore:
+    """
+    Minimal string key/value store with optional per-entry TTL.
+
+    Backends evict expired entries lazily on read, and the local backends also evict the
+    least recently used entries once they hold more than `max_entries`.
+    """
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def add(self, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """
+        Sets the key only if it is missing or expired, as one atomic step.
+
+        Returns:
+            bool: Whether the value was stored; False if the key already held a live value.
+        """
+        raise NotImplementedError
+
+    def get_json(self, key: str):
+        value = self.get(key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, key: str, value, ttl: Optional[float] = None) -> None:
+        self.set(key, json.dumps(value), ttl)
+
+
+def _expires_at(ttl: Optional[float]) -> Optional[float]:
+    return time.time() + ttl if ttl else None
+
+
+class MemoryStore(KeyValueStore):
+    """In-process LRU store, used for tests and as a per-container cache."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._entries[key] = (value, _expires_at(ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] >= time.time()):
+                return False
+            self._entries[key] = (value, _expires_at(ttl))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return True
+
+
+class SQLiteStore(KeyValueStore):
+    """Single-file SQLite store; survives warm Lambda invocations when kept under /tmp."""
+
+    def __init__(self, path: str, max_entries: int = 10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS kv_accessed_at ON kv (accessed_at)")
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM kv WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE kv SET accessed_at = ? WHERE key = ?", (now, key))
+            return value
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, _expires_at(ttl), now),
+            )
+            self._evict(now)
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        with self._lock:
+            # One statement, so it is atomic across processes sharing the file as well.
+            cursor = self._conn.execute(
+                "INSERT INTO kv (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value,"
+                " expires_at = excluded.expires_at, accessed_at = excluded.accessed_at"
+                " WHERE kv.expires_at IS NOT NULL AND kv.expires_at < ?",
+                (key, value, _expires_at(ttl), now, now),
+            )
+            added = cursor.rowcount == 1
+            if added:
+                self._evict(now)
+            return added
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM kv").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM kv WHERE key IN (SELECT key FROM kv ORDER BY accessed_at LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+
+class FileStore(KeyValueStore):
+    """One JSON file per key in a directory; file mtimes double as the LRU clock."""
+
+    def __init__(self, directory: str, max_entries: int = 10000):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at") is not None and entry["expires_at"] < time.time():
+            self.delete(key)
+            return None
+        os.utime(path)
+        return entry["value"]
+
+    def set(self, key, value, ttl=None):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "value": value, "expires_at": _expires_at(ttl)}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def add(self, key, value, ttl=None):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": key, "value": value, "expires_at": _expires_at(ttl)}, f)
+        try:
+            # Unlike a rename, a hard link fails when the target exists.
+            os.link(tmp_path, path)
+        except FileExistsError:
+            # get() removes the entry if it has expired, making room for one more try.
+            if self.get(key) is not None or not _link(tmp_path, path):
+                return False
+        finally:
+            os.remove(tmp_path)
+        self._evict()
+        return True
+
+    def _evict(self):
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith(".json")]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[: len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def _link(source, target):
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        return False
+    return True
+
+
+class DynamoDBStore(KeyValueStore):
+    """
+    DynamoDB-backed store for production.
+
+    Expects a table with a string partition key `key` and DynamoDB TTL enabled on the
+    numeric `expires_at` attribute. Eviction is left to DynamoDB TTL; there is no LRU cap.
+    """
+
+    def __init__(self, table_name: str):
+        import boto3
+
+        self.table = boto3.resource("dynamodb").Table(table_name)
+
+    def get(self, key):
+        item = self.table.get_item(Key={"key": key}).get("Item")
+        if item is None:
+            return None
+        # DynamoDB TTL deletion can lag by hours, so check expiry ourselves.
+        expires_at = item.get("expires_at")
+        if expires_at is not None and float(expires_at) < time.time():
+            return None
+        return item["value"]
+
+    def set(self, key, value, ttl=None):
+        item = {"key": key, "value": value}
+        if ttl:
+            item["expires_at"] = int(time.time() + ttl)
+        self.table.put_item(Item=item)
+
+    def delete(self, key):
+        self.table.delete_item(Key={"key": key})
+
+    def add(self, key, value, ttl=None):
+        item = {"key": key, "value": value}
+        if ttl:
+            item["expires_at"] = int(time.time() + ttl)
+        try:
+            self.table.put_item(
+                Item=item,
+                # An item past its TTL may not have been deleted yet.
+                ConditionExpression="attribute_not_exists(#key) OR expires_at < :now",
+                ExpressionAttributeNames={"#key": "key"},
+                ExpressionAttributeValues={":now": int(time.time())},
+            )
+        except self.table.meta.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+
+def create_store(url: str, max_entries: int = 10000) -> KeyValueStore:
+    """
+    Builds a store from a URL-like setting.
+
+    Args:
+        url (str): One of `memory://`, `sqlite:///path/to/db`, `file:///path/to/dir`
+            or `dynamodb://table-name`.
+        max_entries (int): LRU cap for the local backends.
+
+    Returns:
+        KeyValueStore: The configured store.
+    """
+    scheme, _, location = url.partition("://")
+    if scheme == "memory":
+        return MemoryStore(max_entries)
+    if scheme == "sqlite":
+        return SQLiteStore(location, max_entries)
+    if scheme == "file":
+        return FileStore(location, max_entries)
+    if scheme == "dynamodb":
+        return DynamoDBStore(location)
+    raise ValueError(f"Unsupported store URL: {url}")
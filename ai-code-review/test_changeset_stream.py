@@ -0,0 +1,110 @@
+import io
+import json
+import changeset_stream
+from changeset_stream import iter_changeset_files
+from utils import construct_pull_request_url
+
+PR_URL = construct_pull_request_url("owner/repo", 5)
+FILES_URL = f"{PR_URL}/files"
+PAGE_2 = f"{FILES_URL}?per_page=100&page=2"
+
+
+class FakeResponse:
+    def __init__(self, items=None, next_url=None, text=""):
+        body = json.dumps(items).encode()
+        self.raw = io.BytesIO(body)
+        self.items = items
+        self.text = text
+        self.links = {"next": {"url": next_url}} if next_url else {}
+
+    def json(self):
+        return self.items
+
+    def iter_lines(self, chunk_size=None, decode_unicode=False):
+        return iter(self.text.splitlines())
+
+    def raise_for_status(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FakeGitHub:
+    def __init__(self, pages, diff=""):
+        self.pages = pages
+        self.diff = diff
+        self.requests = []
+
+    def get(self, url, token=None, params=None, stream=False):
+        self.requests.append(url)
+        return self.pages[url]
+
+    def request(self, method, url, token=None, headers=None, stream=False):
+        self.requests.append(headers["Accept"])
+        return FakeResponse(text=self.diff)
+
+
+def _install(monkeypatch, pages, diff=""):
+    github = FakeGitHub(pages, diff)
+    monkeypatch.setattr(changeset_stream, "get_github_client", lambda: github)
+    return github
+
+
+def test_files_are_read_across_pages(monkeypatch):
+    github = _install(monkeypatch, {
+        FILES_URL: FakeResponse([{"filename": "a.py", "status": "added", "patch": "@@ -0,0 +1 @@\n+a"}], next_url=PAGE_2),
+        PAGE_2: FakeResponse([{"filename": "b.py", "status": "renamed", "previous_filename": "old.py", "patch": ""}]),
+    })
+    assert list(iter_changeset_files("owner/repo", 5, "token")) == [
+        {"filename": "a.py", "status": "added", "patch": "@@ -0,0 +1 @@\n+a", "previous_filename": None},
+        {"filename": "b.py", "status": "renamed", "patch": "", "previous_filename": "old.py"},
+    ]
+    # The diff is only fetched when GitHub left out a patch.
+    assert github.requests == [FILES_URL, PAGE_2]
+
+
+DIFF = """\
+diff --git a/small.py b/small.py
+index 1..2 100644
+--- a/small.py
++++ b/small.py
+@@ -1 +1 @@
+-a
++b
+diff --git a/big.py b/big.py
+index 3..4 100644
+--- a/big.py
++++ b/big.py
+@@ -1 +1,2 @@
+ x
++y
+"""
+
+
+def test_omitted_patches_are_filled_in_from_the_diff(monkeypatch):
+    _install(monkeypatch, {FILES_URL: FakeResponse([
+        {"filename": "small.py", "status": "modified", "patch": "@@ -1 +1 @@\n-a\n+b", "additions": 1, "deletions": 1},
+        {"filename": "big.py", "status": "modified", "additions": 1},
+        {"filename": "gone.py", "status": "modified", "additions": 5},
+        {"filename": "logo.png", "status": "added"},
+    ])}, DIFF)
+    files = {record["filename"]: record["patch"] for record in iter_changeset_files("owner/repo", 5, "token")}
+    assert files == {
+        "small.py": "@@ -1 +1 @@\n-a\n+b",
+        "big.py": "@@ -1 +1,2 @@\n x\n+y",
+        "gone.py": "(patch not available from GitHub)",
+        # Binary files have no additions or deletions and keep an empty patch.
+        "logo.png": "",
+    }
+
+
+def test_long_diff_patches_are_truncated(monkeypatch):
+    monkeypatch.setattr(changeset_stream, "MAX_FETCHED_PATCH_CHARS", 20)
+    diff = "diff --git a/big.py b/big.py\n@@ -1 +1,9 @@\n" + "".join(f"+line {n}\n" for n in range(9))
+    _install(monkeypatch, {FILES_URL: FakeResponse([{"filename": "big.py", "status": "modified", "additions": 9}])}, diff)
+    [record] = iter_changeset_files("owner/repo", 5, "token")
+    assert record["patch"] == "@@ -1 +1,9 @@\n(patch truncated)"
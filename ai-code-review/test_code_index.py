@@ -0,0 +1,101 @@
+import pytest
+import code_index
+from code_index import CodeIndex, extract_symbols, update_code_index
+
+UTILS = '''\
+def slugify(text):
+    return text.lower().replace(" ", "-")
+
+
+class Page:
+    def url(self):
+        return "/" + slugify(self.title)
+'''
+
+VIEWS = '''\
+from utils import slugify
+
+
+def render(page):
+    return slugify(page.title)
+'''
+
+APP_JS = '''\
+export function parseQuery(query) {
+  return query.split("&");
+}
+
+const handler = async (event) => {
+  return parseQuery(event.query);
+};
+'''
+
+
+def test_python_symbols_and_call_sites():
+    symbols, refs = extract_symbols("utils.py", UTILS)
+    assert ("slugify", "function", 1, 2) in symbols
+    assert ("Page", "class", 5, 7) in symbols
+    assert ("url", "function", 6, 7) in symbols
+    assert ("slugify", 7, 'return "/" + slugify(self.title)') in refs
+
+
+def test_other_languages_use_line_patterns():
+    symbols, refs = extract_symbols("app.js", APP_JS)
+    assert [symbol[0] for symbol in symbols] == ["parseQuery", "handler"]
+    assert any(name == "parseQuery" and line == 6 for name, line, _ in refs)
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    """A fake repository whose trees and blobs tests can change between commits."""
+    blobs = {"b1": UTILS, "b2": VIEWS, "b3": APP_JS}
+    trees = {"c1": {"utils.py": "b1", "views.py": "b2"}}
+    fetched = []
+
+    def fetch_blob(repository_full_name, sha, github_token):
+        fetched.append(sha)
+        if sha not in blobs:
+            raise OSError("blob unavailable")
+        return blobs[sha]
+    monkeypatch.setattr(code_index, "_fetch_tree", lambda repository_full_name, commit, github_token: dict(trees[commit]))
+    monkeypatch.setattr(code_index, "_fetch_blob", fetch_blob)
+    return blobs, trees, fetched
+
+
+def test_update_indexes_only_changed_files(repository, tmp_path):
+    blobs, trees, fetched = repository
+    index = CodeIndex(str(tmp_path / "index.db"))
+    assert update_code_index(index, "owner/repo", "c1") == 2
+    assert update_code_index(index, "owner/repo", "c1") == 0
+    trees["c2"] = {"utils.py": "b1", "app.js": "b3"}
+    fetched.clear()
+    assert update_code_index(index, "owner/repo", "c2") == 1
+    assert fetched == ["b3"]
+    assert index.indexed_commit == "c2"
+    assert index.indexed_blobs() == {"utils.py": "b1", "app.js": "b3"}
+    assert index.definitions("render") == []
+
+
+def test_failed_fetch_is_retried_on_the_next_update(repository, tmp_path):
+    blobs, trees, fetched = repository
+    trees["c1"]["missing.py"] = "b4"
+    index = CodeIndex(str(tmp_path / "index.db"))
+    assert update_code_index(index, "owner/repo", "c1") == 2
+    # The index is not marked as being at c1 until every file made it in.
+    assert index.indexed_commit is None
+    blobs["b4"] = "def later():\n    pass\n"
+    fetched.clear()
+    assert update_code_index(index, "owner/repo", "c1") == 1
+    assert fetched == ["b4"]
+    assert index.indexed_commit == "c1"
+
+
+def test_related_context_finds_the_changed_function_and_its_callers(repository, tmp_path):
+    index = CodeIndex(str(tmp_path / "index.db"))
+    update_code_index(index, "owner/repo", "c1")
+    patch = "@@ -1,2 +1,2 @@\n def slugify(text):\n-    return text.lower()\n+    return text.lower().replace(\" \", \"-\")"
+    context = index.related_context([{"filename": "utils.py", "status": "modified", "patch": patch}], max_tokens=2000)
+    assert "#### Changed code in function `slugify` (utils.py:1-2)" in context
+    assert "#### Call sites of `slugify`" in context
+    assert "views.py:5: return slugify(page.title)" in context
+    assert index.related_context([{"filename": "utils.py", "status": "modified", "patch": patch}], max_tokens=10) == ""
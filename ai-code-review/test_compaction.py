@@ -0,0 +1,41 @@
+from compaction import compact_patch, omitted_line_count
+
+REINDENTED = "@@ -1,2 +1,2 @@\n-if x:\n-  y()\n+if x:\n+    y()"
+CHANGED = "@@ -10,3 +10,3 @@\n a = 1\n-b = 2\n+b = 3\n c = 4"
+
+
+def test_whitespace_only_hunks_are_dropped_where_indentation_is_cosmetic():
+    patch, dropped = compact_patch(f"{REINDENTED}\n{CHANGED}", 3, "src/app.js")
+    assert dropped == 1
+    assert patch == CHANGED
+
+
+def test_whitespace_only_hunks_are_kept_where_indentation_matters():
+    for filename in ("app.py", "deploy.yaml", "Makefile", ""):
+        patch, dropped = compact_patch(f"{REINDENTED}\n{CHANGED}", 3, filename)
+        assert dropped == 0
+        assert patch == f"{REINDENTED}\n{CHANGED}"
+
+
+def test_long_unchanged_runs_are_collapsed_with_their_line_count():
+    context = "\n".join(f" line {number}" for number in range(20))
+    patch, _ = compact_patch(f"@@ -1,42 +1,42 @@\n-old\n+new\n{context}\n-old2\n+new2", 2, "a.py")
+    lines = patch.splitlines()
+    assert lines[:5] == ["@@ -1,42 +1,42 @@", "-old", "+new", " line 0", " line 1"]
+    assert omitted_line_count(lines[5]) == 16
+    assert lines[6:] == [" line 18", " line 19", "-old2", "+new2"]
+
+
+def test_leading_and_trailing_context_keeps_only_the_lines_next_to_the_change():
+    before = "\n".join(f" before {number}" for number in range(10))
+    after = "\n".join(f" after {number}" for number in range(10))
+    patch, _ = compact_patch(f"@@ -1,21 +1,21 @@\n{before}\n-x\n+y\n{after}", 1, "a.py")
+    lines = patch.splitlines()
+    assert omitted_line_count(lines[1]) == 9
+    assert lines[2:6] == [" before 9", "-x", "+y", " after 0"]
+    assert omitted_line_count(lines[6]) == 9
+
+
+def test_short_context_runs_are_left_alone():
+    patch, dropped = compact_patch(CHANGED, 3, "a.py")
+    assert (patch, dropped) == (CHANGED, 0)
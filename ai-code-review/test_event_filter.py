@@ -0,0 +1,72 @@
+import asyncio
+import threading
+import pytest
+from event_filter import ReviewCoalescer, should_review_event
+from storage import MemoryStore, SQLiteStore
+
+REPO = "owner/repo"
+
+
+@pytest.mark.parametrize("action", ["opened", "reopened", "synchronize", "ready_for_review"])
+def test_code_changing_actions_are_reviewed(action):
+    assert should_review_event({"action": action, "pull_request": {"state": "open"}}) == (True, "")
+
+
+@pytest.mark.parametrize("body", [
+    {"action": "labeled", "pull_request": {"state": "open"}},
+    {"action": "edited"},
+    {"action": "synchronize", "pull_request": {"state": "closed"}},
+])
+def test_other_events_are_skipped(body):
+    should_review, reason = should_review_event(body)
+    assert not should_review
+    assert reason
+
+
+@pytest.fixture
+def coalescer():
+    return ReviewCoalescer(MemoryStore())
+
+
+def test_redelivered_head_is_not_registered_twice(coalescer):
+    assert coalescer.register(REPO, 1, "a")
+    assert not coalescer.register(REPO, 1, "a")
+    coalescer.mark_reviewed(REPO, 1, "a")
+    assert not coalescer.register(REPO, 1, "a")
+    # Other PRs are tracked separately.
+    assert coalescer.register(REPO, 2, "a")
+
+
+def test_newer_push_supersedes_the_pending_review(coalescer):
+    assert coalescer.register(REPO, 1, "a")
+    assert coalescer.register(REPO, 1, "b")
+    assert not coalescer.wait_until_settled(REPO, 1, "a")
+    assert coalescer.wait_until_settled(REPO, 1, "b")
+    assert not asyncio.run(coalescer.wait_until_settled_async(REPO, 1, "a"))
+    # A superseded review must not overwrite the newer head.
+    coalescer.mark_reviewed(REPO, 1, "a")
+    assert coalescer.is_latest(REPO, 1, "b")
+
+
+def test_released_head_can_be_retried(coalescer):
+    assert coalescer.register(REPO, 1, "a")
+    coalescer.release(REPO, 1, "a")
+    assert coalescer.register(REPO, 1, "a")
+
+
+def test_concurrent_deliveries_register_a_head_once(tmp_path):
+    # One connection per thread, like webhook handlers in separate processes.
+    coalescers = [ReviewCoalescer(SQLiteStore(str(tmp_path / "events.db"))) for _ in range(8)]
+    barrier = threading.Barrier(len(coalescers))
+    results = []
+
+    def deliver(coalescer):
+        barrier.wait()
+        results.append(coalescer.register(REPO, 1, "a"))
+
+    threads = [threading.Thread(target=deliver, args=(coalescer,)) for coalescer in coalescers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 1
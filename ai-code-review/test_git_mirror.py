@@ -0,0 +1,56 @@
+import git_mirror
+from git_mirror import parse_diff
+
+DIFF = """\
+diff --git a/app.py b/app.py
+index 1111111..2222222 100644
+--- a/app.py
++++ b/app.py
+@@ -1,2 +1,2 @@
+-x = 1
++x = 2
+ y = 3
+diff --git a/old name.py b/new name.py
+similarity index 90%
+rename from old name.py
+rename to new name.py
+index 3333333..4444444 100644
+--- a/old name.py
++++ b/new name.py
+@@ -4 +4 @@
+-a
++b
+diff --git a/moved.txt b/docs/moved.txt
+similarity index 100%
+rename from moved.txt
+rename to docs/moved.txt
+diff --git a/logo.png b/logo.png
+new file mode 100644
+index 0000000..5555555
+Binary files /dev/null and b/logo.png differ
+diff --git a/gone.py b/gone.py
+deleted file mode 100644
+index 6666666..0000000
+--- a/gone.py
++++ /dev/null
+@@ -1 +0,0 @@
+-print("bye")
+"""
+
+
+def test_files_are_parsed_like_the_github_api():
+    files = list(parse_diff(DIFF.splitlines(keepends=True)))
+    assert files == [
+        {'filename': 'app.py', 'status': 'modified', 'patch': "@@ -1,2 +1,2 @@\n-x = 1\n+x = 2\n y = 3", 'previous_filename': None},
+        {'filename': 'new name.py', 'status': 'renamed', 'patch': "@@ -4 +4 @@\n-a\n+b", 'previous_filename': 'old name.py'},
+        {'filename': 'docs/moved.txt', 'status': 'renamed', 'patch': '', 'previous_filename': 'moved.txt'},
+        {'filename': 'logo.png', 'status': 'added', 'patch': '', 'previous_filename': None},
+        {'filename': 'gone.py', 'status': 'removed', 'patch': '@@ -1 +0,0 @@\n-print("bye")', 'previous_filename': None},
+    ]
+
+
+def test_long_patches_are_truncated(monkeypatch):
+    monkeypatch.setattr(git_mirror, "MAX_FETCHED_PATCH_CHARS", 30)
+    lines = ["diff --git a/big.py b/big.py", "@@ -1,5 +1,5 @@"] + [f"+line {n}" for n in range(10)]
+    [record] = parse_diff(lines)
+    assert record['patch'] == "@@ -1,5 +1,5 @@\n+line 0\n(patch truncated)"
@@ -0,0 +1,99 @@
+import pytest
+import github_auth
+from datetime import datetime, timezone
+from github_auth import InstallationTokenProvider, RepoAccessCache, credential_key
+from storage import MemoryStore
+
+
+def _iso(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+class FakeApp:
+    """Stands in for the GitHub App endpoints, minting numbered tokens valid for an hour."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.requests = []
+
+    def __call__(self, method, path):
+        self.requests.append((method, path))
+        if path.endswith("/installation"):
+            return {"id": 7}
+        return {"token": f"token-{len(self.requests)}", "expires_at": _iso(self.clock[0] + 3600)}
+
+
+@pytest.fixture
+def provider(monkeypatch):
+    clock = [1_700_000_000.0]
+    monkeypatch.setattr(github_auth.time, "time", lambda: clock[0])
+    provider = InstallationTokenProvider("1", "key", refresh_seconds=300)
+    provider._app_request = FakeApp(clock)
+    provider.clock = clock
+    return provider
+
+
+def test_token_is_reused_until_it_is_close_to_expiry(provider):
+    first = provider.token(7)
+    provider.clock[0] += 3000
+    assert provider.token(7) == first
+    provider.clock[0] += 301
+    second = provider.token(7)
+    assert second != first
+    assert provider.installation_for_token(second) == 7
+    assert provider.installation_for_token(first) is None
+
+
+def test_installation_is_looked_up_once_per_repository(provider):
+    assert provider.installation_id("owner/repo") == 7
+    assert provider.installation_id("owner/repo") == 7
+    assert provider._app_request.requests == [("GET", "/repos/owner/repo/installation")]
+
+
+def test_installation_tokens_share_a_credential_key(provider, monkeypatch):
+    monkeypatch.setattr(github_auth, "get_installation_token_provider", lambda: provider)
+    assert credential_key(provider.token(7)) == "installation:7"
+    provider.clock[0] += 3500
+    # Cached results keyed on the old token stay valid for the new one.
+    assert credential_key(provider.token(7)) == "installation:7"
+    assert credential_key("ghp_user").startswith("token:")
+    assert "ghp_user" not in credential_key("ghp_user")
+
+
+@pytest.fixture
+def access_cache(monkeypatch):
+    monkeypatch.setattr(github_auth, "get_installation_token_provider", lambda: None)
+    return RepoAccessCache(MemoryStore(), ttl=3600, negative_ttl=60)
+
+
+def test_grants_outlive_denials(access_cache, monkeypatch):
+    now = github_auth.time.time()
+    access_cache.set("owner/granted", "token", True)
+    access_cache.set("owner/denied", "token", False)
+    assert access_cache.get("owner/granted", "token") is True
+    assert access_cache.get("owner/denied", "token") is False
+    assert access_cache.get("owner/granted", "other token") is None
+    monkeypatch.setattr("storage.time.time", lambda: now + 61)
+    assert access_cache.get("owner/granted", "token") is True
+    assert access_cache.get("owner/denied", "token") is None
+
+
+def test_store_shares_results_between_processes(access_cache):
+    access_cache.set("owner/repo", "token", True)
+    other_process = RepoAccessCache(access_cache.store, ttl=3600, negative_ttl=60)
+    assert other_process.get("owner/repo", "token") is True
+
+
+class BrokenStore(MemoryStore):
+    def get(self, key):
+        raise OSError("table gone")
+
+    def set(self, key, value, ttl=None):
+        raise OSError("table gone")
+
+
+def test_broken_store_falls_back_to_memory(access_cache):
+    access_cache.store = BrokenStore()
+    access_cache.set("owner/repo", "token", True)
+    assert access_cache.get("owner/repo", "token") is True
+    assert access_cache.get("owner/other", "token") is None
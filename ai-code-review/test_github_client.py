@@ -0,0 +1,97 @@
+import pytest
+import github_client
+from config import config
+from storage import MemoryStore
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, payload=None, next_url=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.links = {"next": {"url": next_url}} if next_url else {}
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise github_client.requests.exceptions.HTTPError(f"{self.status_code}", response=self)
+
+
+class FakeGitHub:
+    """Answers GETs from a table of URLs and records every call."""
+
+    def __init__(self, pages=None, patch_status=200, post_id=7):
+        self.pages = pages or {}
+        self.patch_status = patch_status
+        self.post_id = post_id
+        self.calls = []
+
+    def get(self, url, token=None, params=None):
+        self.calls.append(("GET", url, params))
+        return self.pages[url]
+
+    def patch(self, url, token=None, data=None):
+        self.calls.append(("PATCH", url, None))
+        return FakeResponse(self.patch_status)
+
+    def post(self, url, token=None, data=None):
+        self.calls.append(("POST", url, None))
+        return FakeResponse(201, {"id": self.post_id})
+
+
+COMMENTS_URL = github_client.construct_comments_url("owner/repo", 5)
+PAGE_2 = f"{COMMENTS_URL}?per_page=100&page=2"
+
+
+@pytest.fixture
+def github(monkeypatch):
+    monkeypatch.setattr(config, "TEST_MODE", False)
+    index = MemoryStore()
+    monkeypatch.setattr(github_client, "get_comment_index", lambda: index)
+
+    def install(fake):
+        monkeypatch.setattr(github_client, "get_github_client", lambda: fake)
+        return fake
+    install.index = index
+    return install
+
+
+def test_comments_are_read_page_by_page(github):
+    fake = github(FakeGitHub({
+        COMMENTS_URL: FakeResponse(payload=[{"id": 1}, {"id": 2}], next_url=PAGE_2),
+        PAGE_2: FakeResponse(payload=[{"id": 3}]),
+    }))
+    assert [c["id"] for c in github_client.iter_issue_comments("owner/repo", 5)] == [1, 2, 3]
+    # The next link carries its own query string.
+    assert fake.calls == [("GET", COMMENTS_URL, {"per_page": 100}), ("GET", PAGE_2, None)]
+
+
+def test_later_pages_are_not_fetched_once_the_bot_comment_is_found(github):
+    fake = github(FakeGitHub({
+        COMMENTS_URL: FakeResponse(payload=[{"id": 1, "body": "hi"}, {"id": 2, "body": "Automated Code Review"}], next_url=PAGE_2),
+    }))
+    assert github_client.get_bot_comment_id(5, "owner/repo") == 2
+    assert len(fake.calls) == 1
+    assert github.index.get("comment:owner/repo#5") == "2"
+
+
+def test_indexed_comment_id_skips_the_comment_listing(github):
+    fake = github(FakeGitHub())
+    github.index.set("comment:owner/repo#5", "42")
+    assert github_client.get_bot_comment_id(5, "owner/repo") == 42
+    assert fake.calls == []
+
+
+def test_new_comment_is_recorded_in_the_index(github):
+    github(FakeGitHub(post_id=9))
+    github_client.post_or_update_comment("owner/repo", 5, "Review", None, "token", False)
+    assert github.index.get("comment:owner/repo#5") == "9"
+
+
+def test_deleted_indexed_comment_is_forgotten_and_reposted(github):
+    fake = github(FakeGitHub(patch_status=404, post_id=10))
+    github.index.set("comment:owner/repo#5", "42")
+    github_client.post_or_update_comment("owner/repo", 5, "Review", 42, "token", False)
+    assert [method for method, _, _ in fake.calls] == ["PATCH", "POST"]
+    assert github.index.get("comment:owner/repo#5") == "10"
@@ -0,0 +1,98 @@
+import pytest
+import requests
+import github_http
+from github_http import GitHubClient
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, text=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+class FakeSession:
+    """Plays back responses (or raises exceptions) in order and records the calls."""
+
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(github_http.time, "sleep", lambda seconds: None)
+    client = GitHubClient(token="token", max_retries=2)
+
+    def play(*outcomes):
+        client.session = FakeSession(outcomes)
+        return client.session
+    client.play = play
+    return client
+
+
+RATE_LIMITED = [
+    FakeResponse(429),
+    FakeResponse(403, {"Retry-After": "1"}),
+    FakeResponse(403, {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "0"}),
+]
+
+
+@pytest.mark.parametrize("method", ["GET", "PATCH", "POST"])
+@pytest.mark.parametrize("response", RATE_LIMITED)
+def test_explicit_rate_limits_are_retried_for_every_method(client, method, response):
+    session = client.play(response, FakeResponse(200))
+    assert client.request(method, "https://api.github.com/x").status_code == 200
+    assert session.calls == [method, method]
+
+
+@pytest.mark.parametrize("status", [500, 502, 503, 504])
+def test_server_errors_are_retried_for_idempotent_methods(client, status):
+    session = client.play(FakeResponse(status), FakeResponse(200))
+    assert client.request("GET", "https://api.github.com/x").status_code == 200
+    assert len(session.calls) == 2
+
+
+@pytest.mark.parametrize("response", [
+    FakeResponse(502),
+    FakeResponse(403, text="API rate limit exceeded"),
+])
+def test_post_is_not_retried_unless_explicitly_rate_limited(client, response):
+    session = client.play(response)
+    assert client.request("POST", "https://api.github.com/x").status_code == response.status_code
+    assert session.calls == ["POST"]
+
+
+def test_connection_errors_are_only_retried_for_idempotent_methods(client):
+    session = client.play(requests.exceptions.ConnectionError("reset"), FakeResponse(200))
+    assert client.request("GET", "https://api.github.com/x").status_code == 200
+    assert len(session.calls) == 2
+
+    client.play(requests.exceptions.ConnectionError("reset"))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.request("POST", "https://api.github.com/x")
+
+
+def test_retries_stop_after_max_retries(client):
+    session = client.play(*[FakeResponse(503) for _ in range(3)])
+    assert client.request("GET", "https://api.github.com/x").status_code == 503
+    assert len(session.calls) == 3
+
+
+def test_waits_longer_than_the_backoff_cap_are_not_retried(client):
+    session = client.play(FakeResponse(429, {"Retry-After": "3600"}))
+    assert client.request("POST", "https://api.github.com/x").status_code == 429
+    assert len(session.calls) == 1
+
+
+def test_client_errors_are_returned_as_they_are(client):
+    session = client.play(FakeResponse(404), FakeResponse(403))
+    assert client.request("GET", "https://api.github.com/x").status_code == 404
+    assert len(session.calls) == 1
@@ -0,0 +1,37 @@
+import incremental
+from github_client import BOT_COMMENT_MARKER
+from incremental import format_reviewed_marker, merge_incremental_review, parse_reviewed_sha
+
+FIRST = "a" * 40
+SECOND = "b" * 40
+THIRD = "c" * 40
+
+
+def comment(content, head_sha):
+    return f"{BOT_COMMENT_MARKER} header\n{content}{format_reviewed_marker(head_sha)}"
+
+
+def test_push_review_is_appended_under_a_section_and_moves_the_marker():
+    merged = merge_incremental_review(comment("Full review.", FIRST), "Looks fine.", FIRST, SECOND)
+    assert merged.startswith("Full review.")
+    assert "### Changes since `aaaaaaa` (`aaaaaaa...bbbbbbb`)\n\nLooks fine." in merged
+    assert BOT_COMMENT_MARKER not in merged
+    assert parse_reviewed_sha(merged) == SECOND
+    assert merged.count("ai-code-review:head_sha") == 1
+
+
+def test_successive_pushes_keep_their_sections_in_order():
+    merged = merge_incremental_review(comment("Full review.", FIRST), "Second push.", FIRST, SECOND)
+    merged = merge_incremental_review(comment(merged, SECOND), "Third push.", SECOND, THIRD)
+    assert merged.index("Second push.") < merged.index("Third push.")
+    assert parse_reviewed_sha(merged) == THIRD
+
+
+def test_oldest_sections_are_dropped_to_fit_but_the_full_review_stays(monkeypatch):
+    monkeypatch.setattr(incremental, "MAX_COMMENT_LENGTH", 300)
+    body = comment("Full review.", FIRST)
+    for number, (last_sha, head_sha) in enumerate([(FIRST, SECOND), (SECOND, THIRD), (THIRD, FIRST)]):
+        body = comment(merge_incremental_review(body, f"Push {number} " + "x" * 60, last_sha, head_sha), head_sha)
+    assert "Full review." in body
+    assert "Push 0" not in body
+    assert "Push 2" in body
@@ -0,0 +1,64 @@
+import json
+import pytest
+import job_queue
+import worker
+from job_queue import SQLiteJobQueue, create_queue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(str(tmp_path / "queue.db"), visibility_timeout=60)
+
+
+def test_received_job_is_hidden_until_acked_or_timed_out(queue, monkeypatch):
+    queue.enqueue({"pr_number": 1})
+    [(receipt, job)] = queue.receive()
+    assert job == {"pr_number": 1}
+    assert queue.receive() == []
+    # An unacknowledged job comes back after the visibility timeout.
+    now = job_queue.time.time()
+    monkeypatch.setattr(job_queue.time, "time", lambda: now + 61)
+    [(receipt, job)] = queue.receive()
+    queue.ack(receipt)
+    assert queue.receive() == []
+
+
+def test_delayed_job_is_not_received_early(queue, monkeypatch):
+    queue.enqueue({"pr_number": 1}, delay_seconds=30)
+    assert queue.receive() == []
+    now = job_queue.time.time()
+    monkeypatch.setattr(job_queue.time, "time", lambda: now + 31)
+    assert [job for _, job in queue.receive()] == [{"pr_number": 1}]
+
+
+def test_jobs_are_received_oldest_first(queue):
+    for number in range(3):
+        queue.enqueue({"pr_number": number})
+    assert [job["pr_number"] for _, job in queue.receive(max_jobs=2)] == [0, 1]
+    assert [job["pr_number"] for _, job in queue.receive(max_jobs=2)] == [2]
+
+
+def test_create_queue_picks_the_backend(tmp_path):
+    assert isinstance(create_queue(f"sqlite://{tmp_path}/queue.db"), SQLiteJobQueue)
+    with pytest.raises(ValueError):
+        create_queue("redis://localhost")
+
+
+def _job(number):
+    return {"repository_full_name": "owner/repo", "pr_number": number, "head_sha": "a"}
+
+
+def test_worker_handler_reports_only_failed_jobs(monkeypatch):
+    monkeypatch.setattr(worker, "run_review_job", lambda job: {"statusCode": 500 if job["pr_number"] == 2 else 200})
+    event = {"Records": [{"messageId": f"m{number}", "body": json.dumps(_job(number))} for number in (1, 2, 3)]}
+    assert worker.worker_handler(event, None) == {"batchItemFailures": [{"itemIdentifier": "m2"}]}
+
+
+def test_run_worker_leaves_failed_jobs_on_the_queue(queue, monkeypatch):
+    monkeypatch.setattr(worker, "get_job_queue", lambda: queue)
+    monkeypatch.setattr(worker, "run_review_job", lambda job: {"statusCode": 502 if job["pr_number"] == 2 else 200})
+    for number in (1, 2):
+        queue.enqueue(_job(number))
+    worker.run_worker(max_jobs=2)
+    # The failed job is still leased; it is redelivered once the visibility timeout passes.
+    assert queue._conn.execute("SELECT body FROM jobs").fetchall() == [(json.dumps(_job(2)),)]
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+import model_router
+from model_router import Completion, ModelRouter, ModelRouterError, Provider
+
+MESSAGES = [{"role": "user", "content": "Review this."}]
+
+
+class FakeProvider(Provider):
+    """Fails calls to the models in `failing` and records the models called."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = []
+
+    def complete(self, model, messages, max_completion_tokens, response_format=None, timeout=None):
+        self.calls.append(model)
+        if model in self.failing:
+            raise RuntimeError(f"{model} is down")
+        return Completion(model=model, text=f"review by {model}")
+
+    async def acomplete(self, model, messages, max_completion_tokens, response_format=None, timeout=None):
+        return self.complete(model, messages, max_completion_tokens, response_format, timeout)
+
+    def stream(self, model, messages, max_completion_tokens, timeout=None):
+        self.calls.append(model)
+        if model in self.failing:
+            raise RuntimeError(f"{model} is down")
+        yield from ["review ", f"by {model}"]
+
+
+def _router(provider, models=("gpt-4o-mini", "gpt-4.1"), **kwargs):
+    return ModelRouter({"openai": provider}, {"feedback": list(models)}, **kwargs)
+
+
+def test_failed_model_fails_over_to_the_next_candidate():
+    provider = FakeProvider(failing={"gpt-4o-mini"})
+    completion = _router(provider).complete("feedback", MESSAGES, 100)
+    assert completion.model == "gpt-4.1"
+    assert provider.calls == ["gpt-4o-mini", "gpt-4.1"]
+
+
+def test_async_calls_fail_over_too():
+    provider = FakeProvider(failing={"gpt-4o-mini"})
+    completion = asyncio.run(_router(provider).acomplete("feedback", MESSAGES, 100))
+    assert completion.model == "gpt-4.1"
+
+
+def test_error_lists_every_failed_model():
+    router = _router(FakeProvider(failing={"gpt-4o-mini", "gpt-4.1"}))
+    with pytest.raises(ModelRouterError, match="gpt-4o-mini: .*gpt-4.1: "):
+        router.complete("feedback", MESSAGES, 100)
+
+
+def test_circuit_opens_after_repeated_failures_and_closes_after_cooldown(monkeypatch):
+    provider = FakeProvider(failing={"gpt-4o-mini"})
+    router = _router(provider, failure_threshold=2, cooldown_s=60)
+    for _ in range(2):
+        router.complete("feedback", MESSAGES, 100)
+    provider.calls.clear()
+    router.complete("feedback", MESSAGES, 100)
+    # The open circuit skips the failing model without calling it.
+    assert provider.calls == ["gpt-4.1"]
+
+    now = model_router.time.monotonic()
+    monkeypatch.setattr(model_router.time, "monotonic", lambda: now + 61)
+    provider.failing.clear()
+    provider.calls.clear()
+    assert router.complete("feedback", MESSAGES, 100).model == "gpt-4o-mini"
+    assert provider.calls == ["gpt-4o-mini"]
+
+
+def test_models_that_cannot_fit_the_prompt_are_skipped(monkeypatch):
+    router = _router(FakeProvider())
+    assert [spec.name for spec in router.candidates("feedback", 200_000, 1000)] == ["gpt-4.1"]
+    monkeypatch.setattr(model_router, "count_tokens", lambda text: 2_000_000)
+    with pytest.raises(ModelRouterError, match="No available model"):
+        router.complete("feedback", MESSAGES, 100)
+
+
+def test_models_outside_the_latency_slo_are_tried_last():
+    router = _router(FakeProvider(), models=("o1-mini", "gpt-4o-mini"), latency_slo_s=2)
+    assert [spec.name for spec in router.candidates("feedback", 1000, 100)] == ["gpt-4o-mini", "o1-mini"]
+
+
+def test_stream_fails_over_before_the_first_piece():
+    provider = FakeProvider(failing={"gpt-4o-mini"})
+    assert "".join(_router(provider).stream("feedback", MESSAGES, 100)) == "review by gpt-4.1"
@@ -0,0 +1,104 @@
+import asyncio
+import pytest
+import openai_client
+from config import config
+from review_cache import ReviewCache
+from storage import MemoryStore
+
+
+def _stage(result, deps=(), log=None, delay=0.0):
+    async def run(dep_results):
+        if log is not None:
+            log.append(("start", result, dict(dep_results)))
+        await asyncio.sleep(delay)
+        return result
+    return (deps, run)
+
+
+def test_run_stage_graph_passes_dependency_results():
+    log = []
+    results = asyncio.run(openai_client.run_stage_graph({
+        "review": _stage("R", log=log),
+        "context": _stage("C", log=log),
+        "suggestions": _stage("S", deps=("review", "context"), log=log),
+    }))
+    assert results == {"review": "R", "context": "C", "suggestions": "S"}
+    assert ("start", "S", {"review": "R", "context": "C"}) in log
+
+
+def test_run_stage_graph_overlaps_independent_stages():
+    async def timed():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await openai_client.run_stage_graph({name: _stage(name, delay=0.1) for name in ("a", "b", "c")})
+        return loop.time() - started
+    assert asyncio.run(timed()) < 0.25
+
+
+@pytest.mark.parametrize("stages", [
+    {"a": _stage("a", deps=("missing",))},
+    {"a": _stage("a", deps=("b",)), "b": _stage("b", deps=("a",))},
+])
+def test_run_stage_graph_rejects_unresolvable_dependencies(stages):
+    with pytest.raises(ValueError):
+        asyncio.run(openai_client.run_stage_graph(stages))
+
+
+class _Router:
+    def stage_key(self, stage):
+        return "model"
+
+
+@pytest.fixture
+def review_cache(monkeypatch):
+    cache = ReviewCache(MemoryStore())
+    monkeypatch.setattr(openai_client, "get_review_cache", lambda: cache)
+    monkeypatch.setattr(openai_client, "get_model_router", _Router)
+    monkeypatch.setattr(config, "CHUNK_MAX_TOKENS", 400)
+    return cache
+
+
+def _files(count, edited=None):
+    files = []
+    for index in range(count):
+        body = "\n".join(f"+    value_{index}_{line} = compute({line})" for line in range(20))
+        if index == edited:
+            body += "\n+    edited = True"
+        files.append({"filename": f"src/module_{index}.py", "status": "modified", "patch": f"@@ -1,0 +1,20 @@\n{body}"})
+    return files
+
+
+def _review(files, description="Adds the modules."):
+    """Plans the chunks of files, 'reviews' the misses and returns the chunk changes sent to the model."""
+    chunks, cached, misses = openai_client._plan_chunks(files, description)
+    feedback_by_chunk = dict(cached)
+    openai_client._store_chunk_feedback(chunks, feedback_by_chunk, misses, [f"feedback {key}" for _, _, key in misses])
+    assert sorted(feedback_by_chunk) == list(range(len(chunks)))
+    assert [part["filename"] for chunk in chunks for part in chunk] == [file["filename"] for file in files]
+    return chunks, misses
+
+
+def test_chunk_keys_are_stable_across_identical_pushes(review_cache):
+    chunks, misses = _review(_files(30))
+    assert len(chunks) > 3 and len(misses) == len(chunks)
+    _, misses = _review(_files(30))
+    assert misses == []
+
+
+def test_editing_one_file_only_resends_its_chunk(review_cache):
+    _review(_files(30))
+    _, misses = _review(_files(30, edited=0))
+    assert len(misses) == 1
+    assert "src/module_0.py" in misses[0][1]
+
+
+def test_dropping_an_early_file_keeps_later_chunks_cached(review_cache):
+    _review(_files(30))
+    _, misses = _review(_files(30)[1:])
+    assert len(misses) == 1
+
+
+def test_editing_the_description_resends_every_chunk(review_cache):
+    chunks, _ = _review(_files(30))
+    _, misses = _review(_files(30), description="Adds the modules and explains why.")
+    assert len(misses) == len(chunks)
@@ -0,0 +1,122 @@
+import asyncio
+import pytest
+import rate_limiter
+from rate_limiter import AdaptiveConcurrency, RateLimiter, TokenBucket, parse_reset_duration
+
+
+class RateLimitError(Exception):
+    def __init__(self, headers=None, code=None):
+        super().__init__("rate limited")
+        self.status_code = 429
+        self.code = code
+        self.response = type("Response", (), {"headers": headers or {}})()
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1), ("6m0s", 360), ("20ms", 0.02), ("1h2m", 3720), ("2.5", 2.5), ("", None), ("soon", None),
+])
+def test_parse_reset_duration(value, seconds):
+    if seconds is None:
+        assert parse_reset_duration(value) is None
+    else:
+        assert parse_reset_duration(value) == pytest.approx(seconds)
+
+
+def test_overdrawn_bucket_waits_for_the_refill():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.reserve(60) == 0
+    assert bucket.reserve(2) == pytest.approx(2, abs=0.05)
+
+
+def test_bucket_adopts_the_servers_lower_budget():
+    bucket = TokenBucket(per_minute=60)
+    bucket.sync(limit=120, remaining=0)
+    assert bucket.capacity == 120
+    assert bucket.reserve(1) == pytest.approx(0.5, abs=0.05)
+
+
+def test_concurrency_grows_additively_and_halves_on_rate_limit():
+    concurrency = AdaptiveConcurrency(initial=2, maximum=3)
+    # Each success adds 1/limit, so a full window of successes adds one.
+    concurrency.on_success()
+    assert concurrency.limit == pytest.approx(2.5)
+    for _ in range(3):
+        concurrency.on_success()
+    assert concurrency.limit == 3
+    concurrency.on_rate_limited()
+    assert concurrency.limit == pytest.approx(1.5)
+    concurrency.on_rate_limited()
+    assert concurrency.limit == 1
+
+
+def test_rate_limited_call_is_retried_after_the_servers_delay(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(rate_limiter.time, "sleep", sleeps.append)
+    outcomes = [RateLimitError({"retry-after-ms": "1500"}), ("done", {})]
+
+    def call():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    limiter = RateLimiter(max_concurrency=4)
+    assert limiter.call("gpt-4o", 100, call) == "done"
+    assert 1.5 in sleeps
+    # Halved by the 429, then grown by the success.
+    assert limiter.for_model("gpt-4o").concurrency.limit == pytest.approx(2.5)
+
+
+def test_exhausted_quota_is_not_retried(monkeypatch):
+    monkeypatch.setattr(rate_limiter.time, "sleep", lambda seconds: None)
+    calls = []
+
+    def call():
+        calls.append(1)
+        raise RateLimitError(code="insufficient_quota")
+
+    with pytest.raises(RateLimitError):
+        RateLimiter().call("gpt-4o", 100, call)
+    assert len(calls) == 1
+
+
+def test_budgets_are_learned_from_response_headers():
+    limiter = RateLimiter()
+    headers = {"x-ratelimit-limit-requests": "500", "x-ratelimit-remaining-requests": "499"}
+    limiter.call("gpt-4o", 100, lambda: ("done", headers))
+    assert limiter.for_model("gpt-4o").requests.capacity == 500
+
+
+def test_async_calls_share_the_concurrency_limit():
+    limiter = RateLimiter(max_concurrency=2)
+    running = []
+    peak = []
+
+    async def call():
+        running.append(1)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.pop()
+        return "done", {}
+
+    async def main():
+        return await asyncio.gather(*(limiter.acall("gpt-4o", 100, call) for _ in range(6)))
+
+    assert asyncio.run(main()) == ["done"] * 6
+    assert max(peak) == 2
+
+
+def test_cancelled_async_waiter_holds_no_slot():
+    concurrency = AdaptiveConcurrency(initial=1, maximum=1)
+
+    async def main():
+        await concurrency.acquire_async()
+        waiter = asyncio.create_task(concurrency.acquire_async())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        concurrency.release()
+        await asyncio.wait_for(concurrency.acquire_async(), timeout=1)
+
+    asyncio.run(main())
+    assert concurrency.in_flight == 1
@@ -0,0 +1,64 @@
+from types import SimpleNamespace
+from compaction import compact_patch
+from review_comments import MAX_INLINE_COMMENTS, map_suggestions
+
+PATCH = "\n".join([
+    "@@ -10,4 +10,5 @@ def handler(event):",
+    "     body = parse(event)",
+    "-    user = body['user']",
+    "+    user = body.get('user')",
+    "+    if user is None:",
+    "         return",
+    "@@ -40,2 +41,2 @@",
+    " def other():",
+    "-    pass",
+    "+    return None",
+])
+FILES = [{"filename": "src/handler.py", "status": "modified", "patch": PATCH}]
+
+
+def suggestion(old_code, new_code, filename="src/handler.py"):
+    return SimpleNamespace(filename=filename, old_code=old_code, new_code=new_code)
+
+
+def test_single_line_suggestion_targets_the_new_file_line():
+    comments, unplaced = map_suggestions([suggestion("user = body.get('user')", "user = body.get('user', {})")], FILES)
+    assert unplaced == []
+    assert comments == [{
+        "path": "src/handler.py",
+        "line": 11,
+        "side": "RIGHT",
+        "body": "```suggestion\n    user = body.get('user', {})\n```",
+    }]
+
+
+def test_multi_line_suggestion_spans_its_lines():
+    old = "user = body.get('user')\nif user is None:"
+    comments, _ = map_suggestions([suggestion(old, "user = body.get('user')\nif not user:")], FILES)
+    assert (comments[0]["start_line"], comments[0]["line"]) == (11, 12)
+
+
+def test_line_numbers_follow_later_hunks_and_compacted_context():
+    comments, _ = map_suggestions([suggestion("return None", "return 0", filename="handler.py")], FILES)
+    assert comments[0]["line"] == 42
+
+    context = "\n".join(f" line {number}" for number in range(20))
+    patch, _ = compact_patch(f"@@ -1,21 +1,21 @@\n-a\n+b\n{context}\n+c", 2, "x.py")
+    comments, _ = map_suggestions([suggestion("c", "d", filename="x.py")], [{"filename": "x.py", "patch": patch}])
+    assert comments[0]["line"] == 22
+
+
+def test_code_outside_the_diff_is_left_unplaced():
+    missing = suggestion("never_changed()", "changed()")
+    removed_line = suggestion("user = body['user']", "user = body.get('user')")
+    comments, unplaced = map_suggestions([missing, removed_line], FILES)
+    assert comments == []
+    assert unplaced == [missing, removed_line]
+
+
+def test_suggestions_beyond_the_inline_limit_are_unplaced():
+    patch = "@@ -1,0 +1,60 @@\n" + "\n".join(f"+value_{number} = {number}" for number in range(60))
+    suggestions = [suggestion(f"value_{number} = {number}", f"value_{number} = 0", "a.py") for number in range(60)]
+    comments, unplaced = map_suggestions(suggestions, [{"filename": "a.py", "patch": patch}])
+    assert len(comments) == MAX_INLINE_COMMENTS
+    assert len(unplaced) == 60 - MAX_INLINE_COMMENTS
@@ -0,0 +1,109 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import pytest
+import lambda_handler
+import server as server_module
+from config import config
+from server import WebhookServer, verify_signature
+
+SECRET = "secret"
+PAYLOAD = json.dumps({"action": "opened", "pull_request": {"state": "open"}}).encode()
+
+
+def sign(body, secret=SECRET):
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def test_signature_must_match_the_body_and_secret():
+    assert verify_signature(SECRET, PAYLOAD, sign(PAYLOAD))
+    assert not verify_signature(SECRET, PAYLOAD + b" ", sign(PAYLOAD))
+    assert not verify_signature(SECRET, PAYLOAD, sign(PAYLOAD, "other"))
+    assert not verify_signature(SECRET, PAYLOAD, "")
+    assert not verify_signature("", PAYLOAD, sign(PAYLOAD, ""))
+
+
+async def request(app, method, path, body=b"", headers=()):
+    scope = {"type": "http", "method": method, "path": path, "headers": [(k.encode(), v.encode()) for k, v in headers]}
+    messages = [{"type": "http.request", "body": body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+    await app(scope, receive, send)
+    return sent[0]["status"], sent[1]["body"]
+
+
+async def deliver(app, body=PAYLOAD, signature=None, event="pull_request"):
+    headers = [("x-hub-signature-256", signature or sign(body)), ("x-github-event", event)]
+    status, _ = await request(app, "POST", "/webhook", body, headers)
+    return status
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(config, "WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(config, "SERVER_MAX_CONCURRENT_REVIEWS", 1)
+    monkeypatch.setattr(config, "SERVER_MAX_PENDING_REVIEWS", 1)
+    release = asyncio.Event()
+
+    async def handle_event_async(event, context, function):
+        await release.wait()
+        return {"statusCode": 200}
+    monkeypatch.setattr(lambda_handler, "handle_event_async", handle_event_async)
+    app = WebhookServer()
+    app.release = release
+    return app
+
+
+def test_unsigned_and_ignored_deliveries_do_not_start_reviews(server):
+    async def main():
+        server.start()
+        assert await deliver(server, signature=sign(PAYLOAD, "other")) == 401
+        assert await deliver(server, event="ping") == 200
+        assert await deliver(server, json.dumps({"action": "labeled"}).encode()) == 200
+    asyncio.run(main())
+    assert server.stats.webhooks == {"unauthorized": 1, "ping": 1, "ignored": 1}
+    assert not server._tasks
+
+
+def test_deliveries_beyond_the_pending_limit_get_503_and_gauges_settle(server):
+    async def main():
+        server.start()
+        assert await deliver(server) == 202
+        # Let the first review start so it moves from pending to in flight.
+        while server.stats.in_flight == 0:
+            await asyncio.sleep(0.01)
+        assert await deliver(server) == 202
+        assert await deliver(server) == 503
+        assert (server.stats.in_flight, server.stats.pending) == (1, 1)
+        status, body = await request(server, "GET", "/metrics")
+        assert b"ai_code_review_reviews_pending 1" in body
+        server.release.set()
+        await asyncio.wait(server._tasks)
+        await server.shutdown()
+    asyncio.run(main())
+    assert (server.stats.in_flight, server.stats.pending) == (0, 0)
+    assert server.stats.reviews == {"2xx": 2}
+    assert server.stats.webhooks == {"accepted": 2, "overloaded": 1}
+
+
+def test_reviews_unfinished_at_shutdown_are_cancelled_and_leave_the_gauges(server, monkeypatch):
+    monkeypatch.setattr(server_module, "SHUTDOWN_GRACE_SECONDS", 0.05)
+
+    async def main():
+        server.start()
+        assert await deliver(server) == 202
+        while server.stats.in_flight == 0:
+            await asyncio.sleep(0.01)
+        assert await deliver(server) == 202
+        assert (server.stats.in_flight, server.stats.pending) == (1, 1)
+        # One review holds the only slot and the other waits for it; neither finishes in time.
+        await server.shutdown()
+    asyncio.run(main())
+    assert (server.stats.in_flight, server.stats.pending) == (0, 0)
+    assert server.stats.reviews == {"5xx": 2}
@@ -0,0 +1,99 @@
+import pytest
+import storage
+from review_cache import ReviewCache, review_cache_key
+from storage import FileStore, MemoryStore, SQLiteStore, create_store
+
+
+@pytest.fixture(params=["memory", "sqlite", "file"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore(max_entries=2)
+    if request.param == "sqlite":
+        return SQLiteStore(str(tmp_path / "cache.db"), max_entries=2)
+    return FileStore(str(tmp_path / "cache"), max_entries=2)
+
+
+def test_values_round_trip(store):
+    store.set("a", "1")
+    store.set_json("b", {"x": [1, 2]})
+    assert store.get("a") == "1"
+    assert store.get_json("b") == {"x": [1, 2]}
+    assert store.get("missing") is None
+    store.delete("a")
+    assert store.get("a") is None
+
+
+def test_expired_entries_are_not_returned(store, monkeypatch):
+    now = storage.time.time()
+    store.set("a", "1", ttl=10)
+    monkeypatch.setattr(storage.time, "time", lambda: now + 11)
+    assert store.get("a") is None
+
+
+def test_add_only_sets_missing_or_expired_keys(store, monkeypatch):
+    now = storage.time.time()
+    assert store.add("a", "1", ttl=10)
+    assert not store.add("a", "2", ttl=10)
+    assert store.get("a") == "1"
+    monkeypatch.setattr(storage.time, "time", lambda: now + 11)
+    assert store.add("a", "3")
+    assert store.get("a") == "3"
+
+
+@pytest.mark.parametrize("make_store", [
+    lambda path: MemoryStore(max_entries=2),
+    lambda path: SQLiteStore(str(path / "cache.db"), max_entries=2),
+])
+def test_least_recently_used_entry_is_evicted(make_store, tmp_path, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(storage.time, "time", lambda: next(clock))
+    store = make_store(tmp_path)
+    store.set("a", "1")
+    store.set("b", "2")
+    # Reading "a" makes "b" the least recently used entry.
+    assert store.get("a") == "1"
+    store.set("c", "3")
+    assert store.get("b") is None
+    assert store.get("a") == "1"
+    assert store.get("c") == "3"
+
+
+def test_create_store_picks_the_backend(tmp_path):
+    assert isinstance(create_store("memory://"), MemoryStore)
+    assert isinstance(create_store(f"sqlite://{tmp_path}/kv.db"), SQLiteStore)
+    assert isinstance(create_store(f"file://{tmp_path}/kv"), FileStore)
+    with pytest.raises(ValueError):
+        create_store("redis://localhost")
+
+
+def test_cache_key_depends_on_every_part():
+    key = review_cache_key("patch", "gpt-4o", "v1")
+    assert key.startswith("review:feedback:")
+    assert key == review_cache_key("patch", "gpt-4o", "v1")
+    assert key != review_cache_key("patch 2", "gpt-4o", "v1")
+    assert key != review_cache_key("patch", "gpt-4o-mini", "v1")
+    assert key != review_cache_key("patch", "gpt-4o", "v2")
+    assert key != review_cache_key("patch", "gpt-4o", "v1", context="PR description")
+    assert review_cache_key("patch", "gpt-4o", "v1", kind="summary").startswith("review:summary:")
+
+
+class BrokenStore(MemoryStore):
+    def get(self, key):
+        raise OSError("disk gone")
+
+    def set(self, key, value, ttl=None):
+        raise OSError("disk gone")
+
+
+def test_review_cache_stores_reviews():
+    cache = ReviewCache(MemoryStore())
+    key = review_cache_key("patch", "gpt-4o", "v1")
+    assert cache.get(key) is None
+    cache.put(key, "Looks good.")
+    assert cache.get(key) == "Looks good."
+
+
+def test_broken_store_does_not_fail_the_review():
+    cache = ReviewCache(BrokenStore())
+    cache.put("key", "Looks good.")
+    assert cache.get("key") is None
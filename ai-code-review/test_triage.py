@@ -0,0 +1,35 @@
+import pytest
+from triage import classify_hunk
+
+
+def hunk(*lines):
+    return "\n".join(("@@ -1,1 +1,1 @@",) + lines)
+
+
+@pytest.mark.parametrize("filename, text, reason", [
+    ("a.js", hunk("-// old note", "+// new note"), "comments only"),
+    ("a.py", hunk("-# old note", "+# new note"), "comments only"),
+    ("a.c", hunk("-/* old */", "+/* new", "+ * more */"), "comments only"),
+    ("a.py", hunk("-x = f(a,b)", "+x = f(a, b)"), "formatting, comments or docstrings only"),
+    ("a.py", hunk("-x = 1", "+x = 1  # explained"), "formatting, comments or docstrings only"),
+    ("a.go", hunk("-\tif x {", "+    if x {"), "whitespace only"),
+    ("a.py", hunk("-import os", "-import re", "+import re", "+import os"), "imports reordered"),
+    ("pyproject.toml", hunk('-version = "1.2.3"', '+version = "1.2.4"'), "version bump"),
+    ("requirements-dev.txt", hunk("-pytest>=8.0 # version", "+pytest>=8.1 # version"), "version bump"),
+])
+def test_housekeeping_hunks(filename, text, reason):
+    assert classify_hunk(filename, text) == reason
+
+
+@pytest.mark.parametrize("filename, text", [
+    ("a.py", hunk("-x = 1", "+x = 2")),
+    # Indentation is syntax in Python.
+    ("a.py", hunk("-    y()", "+y()")),
+    # Code after a closing block comment is code.
+    ("a.js", hunk("-/* ok */ return 1;", "+/* ok */ return 2;")),
+    # A version number outside a dependency manifest is a behaviour change.
+    ("client.py", hunk("-API_VERSION = '2.1'", "+API_VERSION = '2.2'")),
+    ("a.py", hunk("-import os", "+import sys")),
+])
+def test_substantive_hunks(filename, text):
+    assert classify_hunk(filename, text) is None
@@ -0,0 +1,33 @@
+from functools import lru_cache
+
+# Rough average for code with the GPT tokenizers, used when tiktoken is not installed.
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+    except ImportError:
+        print("tiktoken is not installed; estimating token counts from text length.")
+        return None
+    return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts the model tokens in a piece of text.
+
+    Uses the o200k_base encoding shared by the gpt-4o and o1 models when tiktoken is
+    installed, and falls back to a length-based estimate otherwise.
+
+    Args:
+        text (str): The text to measure.
+
+    Returns:
+        int: The token count.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
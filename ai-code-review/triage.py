@@ -0,0 +1,222 @@
+import fnmatch
+import io
+import re
+import token
+import tokenize
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Tuple
+from chunking import split_patch_into_hunks
+
+# Comment line prefixes by file extension, including block comment continuation lines.
+_C_STYLE_COMMENTS = ("//", "/*", "* ", "*/")
+COMMENT_PREFIXES = {
+    ".py": ("#",), ".rb": ("#",), ".sh": ("#",), ".yaml": ("#",), ".yml": ("#",), ".toml": ("#",),
+    ".js": _C_STYLE_COMMENTS, ".jsx": _C_STYLE_COMMENTS, ".ts": _C_STYLE_COMMENTS, ".tsx": _C_STYLE_COMMENTS,
+    ".go": _C_STYLE_COMMENTS, ".java": _C_STYLE_COMMENTS, ".kt": _C_STYLE_COMMENTS, ".rs": _C_STYLE_COMMENTS,
+    ".c": _C_STYLE_COMMENTS, ".h": _C_STYLE_COMMENTS, ".cc": _C_STYLE_COMMENTS, ".cpp": _C_STYLE_COMMENTS,
+    ".cs": _C_STYLE_COMMENTS, ".swift": _C_STYLE_COMMENTS, ".scala": _C_STYLE_COMMENTS, ".php": _C_STYLE_COMMENTS + ("#",),
+}
+# Languages whose indentation carries no meaning, so whitespace-only edits are formatting.
+WHITESPACE_INSENSITIVE = {
+    ".js", ".jsx", ".ts", ".tsx", ".go", ".java", ".kt", ".rs", ".c", ".h", ".cc", ".cpp", ".cs",
+    ".swift", ".scala", ".php", ".rb", ".json", ".css", ".scss", ".html", ".xml", ".sql",
+}
+# Files whose version lines are package or dependency versions; a changed number anywhere
+# else (e.g. `api_version >= 2.1` in code) is a behaviour change.
+DEPENDENCY_MANIFESTS = (
+    "pyproject.toml", "setup.py", "setup.cfg", "Pipfile", "Pipfile.lock", "poetry.lock", "requirements*.txt",
+    "package.json", "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "go.mod", "go.sum", "Cargo.toml",
+    "Cargo.lock", "Gemfile", "Gemfile.lock", "*.gemspec", "pom.xml", "build.gradle", "build.gradle.kts",
+    "composer.json", "composer.lock", "*.csproj", "Chart.yaml",
+)
+_IMPORT_LINE = re.compile(r"^\s*(?:import\s|from\s+\S+\s+import\s|#include\s|use\s|require\(|const\s+\w+\s*=\s*require\()")
+_VERSION_NUMBER = re.compile(r"\d+(?:\.\d+)+(?:[-.+]?[0-9A-Za-z]+)*")
+_VERSION_KEY = re.compile(r"version", re.IGNORECASE)
+_SKIPPED_TOKENS = {token.COMMENT, token.NL, token.ENCODING, token.ENDMARKER}
+
+
+@dataclass
+class TriageReport:
+    """Files and hunks the triage kept away from the model, and why."""
+
+    skipped_files: List[Tuple[str, str]] = field(default_factory=list)
+    skipped_hunks: int = 0
+
+    def format_skipped(self) -> str:
+        """Markdown note for the review comment listing what was not reviewed."""
+        if not self.skipped_files and not self.skipped_hunks:
+            return ""
+        lines = [f"- `{filename}`: {reason}" for filename, reason in self.skipped_files]
+        if self.skipped_hunks:
+            lines.append(f"- {self.skipped_hunks} housekeeping hunk(s) in the reviewed files")
+        return (
+            f"<details><summary>Not reviewed: {len(self.skipped_files)} file(s) with only housekeeping changes"
+            "</summary>\n\n" + "\n".join(lines) + "\n</details>"
+        )
+
+
+def _changed_lines(hunk_lines: List[str]) -> Tuple[List[str], List[str]]:
+    """Returns the removed and added lines of a hunk."""
+    removed = [line[1:] for line in hunk_lines if line.startswith("-")]
+    added = [line[1:] for line in hunk_lines if line.startswith("+")]
+    return removed, added
+
+
+def _side(hunk_lines: List[str], dropped: str) -> List[str]:
+    """The old (dropped="+") or new (dropped="-") text of a hunk."""
+    return [line[1:] for line in hunk_lines if not line.startswith((dropped, "\\"))]
+
+
+def file_extension(filename: str) -> str:
+    """Lower-cased extension of a path, e.g. ".py", or "" without one."""
+    basename = filename.rsplit("/", 1)[-1]
+    return basename[basename.rfind("."):].lower() if "." in basename else ""
+
+
+def _python_tokens(lines: List[str]) -> Optional[List[Tuple[int, str]]]:
+    """
+    Tokens of a Python fragment that carry meaning: no comments, no blank or continuation
+    lines and no docstrings (strings standing alone as a statement). None if it does not tokenize.
+    """
+    try:
+        tokens = list(tokenize.generate_tokens(io.StringIO("\n".join(lines) + "\n").readline))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return None
+    tokens = [tok for tok in tokens if tok.type not in _SKIPPED_TOKENS]
+    meaningful = []
+    statement_start = True
+    for index, tok in enumerate(tokens):
+        if tok.type == token.NEWLINE and index and tokens[index - 1].type == token.STRING and statement_start:
+            # The NEWLINE ending a dropped docstring goes with it.
+            continue
+        if tok.type == token.STRING and statement_start:
+            if index + 1 == len(tokens) or tokens[index + 1].type == token.NEWLINE:
+                continue
+        statement_start = tok.type in (token.NEWLINE, token.INDENT, token.DEDENT)
+        meaningful.append((tok.type, tok.string))
+    return meaningful
+
+
+def _may_be_cosmetic(hunk: str, removed: List[str], added: List[str]) -> bool:
+    """
+    Cheap filter run before tokenizing: a cosmetic Python change keeps the same characters
+    outside of whitespace and comments, or sits in or next to a docstring.
+    """
+    if '"""' in hunk or "'''" in hunk:
+        return True
+    return _code_characters(removed) == _code_characters(added)
+
+
+def _code_characters(lines: List[str]) -> str:
+    return "".join("".join(line.split("#", 1)[0].split()) for line in lines)
+
+
+def is_dependency_manifest(filename: str) -> bool:
+    basename = filename.rsplit("/", 1)[-1]
+    return any(fnmatch.fnmatch(basename, pattern) for pattern in DEPENDENCY_MANIFESTS)
+
+
+def _without_versions(lines: List[str]) -> Counter:
+    return Counter(_VERSION_NUMBER.sub("<version>", line).strip() for line in lines if line.strip())
+
+
+def _is_comment_line(line: str, prefixes: Tuple[str, ...]) -> bool:
+    stripped = line.strip()
+    # A lone `*` continues a block comment; `*p` is code.
+    if not stripped or stripped == "*":
+        return True
+    if not stripped.startswith(prefixes):
+        return False
+    if stripped.startswith(("//", "#")):
+        return True
+    # A block comment line only counts if the comment runs on or closes at the end of it:
+    # in `/* ok */ return 1;` everything after `*/` is code.
+    close = stripped.find("*/", 2 if stripped.startswith("/*") else 0)
+    return close == -1 or close == len(stripped) - 2
+
+
+def classify_hunk(filename: str, hunk: str) -> Optional[str]:
+    """
+    Labels a hunk as housekeeping when the model has nothing to say about it.
+
+    Returns:
+        str or None: Why the hunk is trivial (e.g. "comments only"), or None if it is substantive.
+    """
+    hunk_lines = hunk.splitlines()[1:]
+    removed, added = _changed_lines(hunk_lines)
+    if not removed and not added:
+        return "no line changes"
+    extension = file_extension(filename)
+    prefixes = COMMENT_PREFIXES.get(extension)
+    if prefixes and all(_is_comment_line(line, prefixes) for line in removed + added):
+        return "comments only"
+    if extension == ".py" and _may_be_cosmetic(hunk, removed, added):
+        old_tokens = _python_tokens(_side(hunk_lines, "+"))
+        if old_tokens is not None and old_tokens == _python_tokens(_side(hunk_lines, "-")):
+            return "formatting, comments or docstrings only"
+    elif extension in WHITESPACE_INSENSITIVE:
+        if "".join("".join(line.split()) for line in removed) == "".join("".join(line.split()) for line in added):
+            return "whitespace only"
+    changed = [line for line in removed + added if line.strip()]
+    if changed and Counter(line.strip() for line in removed if line.strip()) == Counter(line.strip() for line in added if line.strip()):
+        if all(_IMPORT_LINE.match(line) for line in changed):
+            return "imports reordered"
+    if changed and is_dependency_manifest(filename) and all(_VERSION_KEY.search(line) for line in changed):
+        if _without_versions(removed) == _without_versions(added):
+            return "version bump"
+    return None
+
+
+def triage_file(file: dict) -> Tuple[Optional[dict], Optional[str], int]:
+    """
+    Removes housekeeping hunks from a file record.
+
+    Returns:
+        tuple: The file with only substantive hunks (None if nothing is left), the reason
+            when the whole file was skipped, and the number of hunks removed.
+    """
+    patch = file.get("patch") or ""
+    if not patch.strip():
+        if file.get("status") == "renamed" and file.get("previous_filename"):
+            return None, f"renamed from `{file['previous_filename']}` without changes", 0
+        return file, None, 0
+    kept = []
+    reasons = []
+    for hunk in split_patch_into_hunks(patch):
+        reason = classify_hunk(file["filename"], hunk) if hunk.startswith("@@") else None
+        if reason is None:
+            kept.append(hunk)
+        else:
+            reasons.append(reason)
+    if not reasons:
+        return file, None, 0
+    if not kept:
+        unique = sorted(set(reasons))
+        return None, unique[0] if len(unique) == 1 else "housekeeping changes (" + ", ".join(unique) + ")", len(reasons)
+    return dict(file, patch="\n".join(kept)), None, len(reasons)
+
+
+def triage_changeset(files: Iterable[dict], report: TriageReport) -> Iterator[dict]:
+    """
+    Yields the file records that still need a review, recording what was left out in report.
+
+    Runs before compaction on the raw patches: pure renames, and hunks that only touch
+    formatting, comments, docstrings, import order or manifest version numbers, never reach the model.
+    Python hunks are compared token by token, so re-wrapped lines count as formatting while
+    an indentation change does not.
+
+    Args:
+        files (iterable): File records, e.g. from get_changeset_files or iter_changeset_files.
+        report (TriageReport): Collects the skipped files and hunks.
+
+    Yields:
+        dict: File records with only their substantive hunks.
+    """
+    for file in files:
+        kept, reason, skipped_hunks = triage_file(file)
+        if kept is None:
+            report.skipped_files.append((file["filename"], reason))
+        else:
+            report.skipped_hunks += skipped_hunks
+            yield kept
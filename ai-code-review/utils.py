@@ -1,5 +1,5 @@
 import json
-import requests
+from config import config
 
 def parse_event_body(event):
     """
@@ -13,6 +13,31 @@ def parse_event_body(event):
     """
     return json.loads(event.get('body', '{}'))
 
+def build_review_job(body):
+    """
+    Extracts the fields a review needs from a webhook body.
+
+    Args:
+        body (dict): Parsed webhook body.
+
+    Returns:
+        dict: The review job.
+    """
+    pr_details = body.get('pull_request', {})
+    repository_info = body.get('repository', {})
+    return {
+        'action': body.get('action', 'Unknown'),
+        'pr_title': pr_details.get('title', 'No Title'),
+        'pr_number': pr_details.get('number', 'Unknown'),
+        'pr_description': pr_details.get('body', 'No Description'),
+        'repository_full_name': repository_info.get('full_name', 'Unknown'),
+        'base_branch': pr_details.get('base', {}).get('ref', 'Unknown'),
+        'head_branch': pr_details.get('head', {}).get('ref', 'Unknown'),
+        'head_sha': pr_details.get('head', {}).get('sha'),
+        # Set on deliveries to a GitHub App
+        'installation_id': body.get('installation', {}).get('id'),
+    }
+
 def construct_compare_url(repository_full_name, base_branch, head_branch):
     """
     Constructs the GitHub compare URL.
@@ -25,7 +50,7 @@ def construct_compare_url(repository_full_name, base_branch, head_branch):
     Returns:
         str: The compare URL.
     """
-    return f"https://api.github.com/repos/{repository_full_name}/compare/{base_branch}...{head_branch}"
+    return f"{config.GITHUB_API_URL}/repos/{repository_full_name}/compare/{base_branch}...{head_branch}"
 
 def construct_comments_url(repository_full_name, pr_number):
     """
@@ -38,7 +63,7 @@ def construct_comments_url(repository_full_name, pr_number):
     Returns:
         str: The comments URL.
     """
-    return f"https://api.github.com/repos/{repository_full_name}/issues/{pr_number}/comments"
+    return f"{config.GITHUB_API_URL}/repos/{repository_full_name}/issues/{pr_number}/comments"
 
 def construct_comment_url(repository_full_name, comment_id):
     """
@@ -51,41 +76,137 @@ def construct_comment_url(repository_full_name, comment_id):
     Returns:
         str: The comment URL.
     """
-    return f"https://api.github.com/repos/{repository_full_name}/issues/comments/{comment_id}"
+    return f"{config.GITHUB_API_URL}/repos/{repository_full_name}/issues/comments/{comment_id}"
 
-def get_changeset(repository_full_name, base_branch, head_branch, github_token):
+def construct_pull_request_url(repository_full_name, pr_number):
     """
-    Retrieves the changeset between two branches.
+    Constructs the GitHub URL for a PR.
 
     Args:
         repository_full_name (str): Full name of the repository.
-        base_branch (str): The base branch name.
-        head_branch (str): The head branch name.
-        github_token (str): GitHub access token.
+        pr_number (int): Pull request number.
+
+    Returns:
+        str: The pull request URL.
+    """
+    return f"{config.GITHUB_API_URL}/repos/{repository_full_name}/pulls/{pr_number}"
+
+def construct_reviews_url(repository_full_name, pr_number):
+    """
+    Constructs the GitHub URL for the reviews of a PR.
+
+    Args:
+        repository_full_name (str): Full name of the repository.
+        pr_number (int): Pull request number.
+
+    Returns:
+        str: The reviews URL.
+    """
+    return f"{construct_pull_request_url(repository_full_name, pr_number)}/reviews"
+
+def format_file_changes(file):
+    """
+    Formats a single file record the way it appears in the review prompt.
+
+    Args:
+        file (dict): A file record from get_changeset_files.
+
+    Returns:
+        str: The formatted file changes.
+    """
+    return f"File: {file['filename']}\nChanges:\n{file['patch']}\n"
+
+def format_changeset(files, commit_messages):
+    """
+    Formats file records and commit messages into the changeset text sent to the model.
+
+    Args:
+        files (list): File records from get_changeset_files.
+        commit_messages (str): Newline separated commit messages.
 
     Returns:
         str: The formatted changeset.
     """
-    compare_url = construct_compare_url(repository_full_name, base_branch, head_branch)
-    headers = {
-        'Accept': 'application/vnd.github.v3+json',
-        'Authorization': f'token {github_token}'
-    }
+    changeset_text = "\n".join(format_file_changes(file) for file in files)
+
+    # Combine all context
+    return f"{changeset_text}\nCommit Messages:\n{commit_messages}"
+
+def fetch_comparison(repository_full_name, base, head, github_token):
+    """
+    Fetches the compare API response between two refs.
+
+    Args:
+        repository_full_name (str): Full name of the repository.
+        base (str): The base branch name or commit SHA.
+        head (str): The head branch name or commit SHA.
+        github_token (str): GitHub access token.
 
-    response = requests.get(compare_url, headers=headers)
+    Returns:
+        dict: The comparison, including its `status` (ahead, behind, diverged or identical).
+    """
+    # Imported here so parsing webhooks does not pay for importing requests.
+    from github_http import get_github_client
+
+    compare_url = construct_compare_url(repository_full_name, base, head)
+
+    response = get_github_client().get(compare_url, token=github_token)
     response.raise_for_status()
-    comparison = response.json()
-    changeset = []
+    return response.json()
+
+def parse_comparison(comparison):
+    """
+    Extracts per-file records and commit messages from a compare API response.
+
+    Args:
+        comparison (dict): The compare API response.
+
+    Returns:
+        tuple: A list of file records (dicts with filename, status, patch and
+            previous_filename) and the newline separated commit messages.
+    """
+    files = []
     for file in comparison.get('files', []):
-        filename = file.get('filename', 'Unknown file')
-        patch = file.get('patch', '')
-        changeset.append(f"File: {filename}\nChanges:\n{patch}\n")
-    changeset_text = "\n".join(changeset)
+        files.append({
+            'filename': file.get('filename', 'Unknown file'),
+            'status': file.get('status', 'modified'),
+            'patch': file.get('patch', ''),
+            'previous_filename': file.get('previous_filename'),
+        })
 
     # Include commit messages for additional context
     commits = comparison.get('commits', [])
     commit_messages = "\n".join([commit.get('commit', {}).get('message', '') for commit in commits])
+    return files, commit_messages
 
-    # Combine all context
-    full_context = f"{changeset_text}\nCommit Messages:\n{commit_messages}"
-    return full_context
+def get_changeset_files(repository_full_name, base_branch, head_branch, github_token):
+    """
+    Retrieves the per-file changes and commit messages between two branches.
+
+    Args:
+        repository_full_name (str): Full name of the repository.
+        base_branch (str): The base branch name.
+        head_branch (str): The head branch name.
+        github_token (str): GitHub access token.
+
+    Returns:
+        tuple: A list of file records (dicts with filename, status, patch and
+            previous_filename) and the newline separated commit messages.
+    """
+    return parse_comparison(fetch_comparison(repository_full_name, base_branch, head_branch, github_token))
+
+def get_changeset(repository_full_name, base_branch, head_branch, github_token):
+    """
+    Retrieves the changeset between two branches.
+
+    Args:
+        repository_full_name (str): Full name of the repository.
+        base_branch (str): The base branch name.
+        head_branch (str): The head branch name.
+        github_token (str): GitHub access token.
+
+    Returns:
+        str: The formatted changeset.
+    """
+    files, commit_messages = get_changeset_files(repository_full_name, base_branch, head_branch, github_token)
+    return format_changeset(files, commit_messages)
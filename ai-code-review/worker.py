@@ -0,0 +1,337 @@
+import asyncio
+import json
+import subprocess
+import requests
+from config import config
+from compaction import compact_changeset
+from event_filter import get_review_coalescer
+from github_auth import GitHubAuthError, get_github_token
+from github_client import (
+    ProgressiveComment,
+    verify_repo_access,
+    get_bot_comment_id,
+    get_comment_body,
+    post_or_update_comment
+)
+from incremental import format_progress, format_reviewed_marker, merge_incremental_review, parse_reviewed_sha
+from job_queue import get_job_queue
+from metrics import current_metrics, invocation, timed
+from triage import TriageReport, triage_changeset
+from changeset_stream import fetch_pull_request_commit_messages, iter_changeset_files
+from utils import fetch_comparison, format_changeset, parse_comparison
+
+
+def run_review_job(job, full_context=None):
+    """
+    Reviews a pull request and posts the result as a PR comment.
+
+    Args:
+        job (dict): A review job from build_review_job. With `full_review` set, the whole PR
+            is reviewed again even if its head commit was already reviewed.
+        full_context (str, optional): Precomputed changeset, used by test_main.py.
+
+    Returns:
+        dict: The response dictionary.
+    """
+    return asyncio.run(run_review_job_async(job, full_context))
+
+
+async def run_review_job_async(job, full_context=None):
+    """
+    Async counterpart of run_review_job, for callers that already run an event loop.
+
+    GitHub, git and store calls block, so they run on worker threads; with ASYNC_REVIEW the
+    model calls run on the caller's loop and share its connection pool.
+    """
+    repository_full_name = job['repository_full_name']
+    pr_number = job['pr_number']
+    head_sha = job.get('head_sha')
+
+    coalescer = get_review_coalescer() if head_sha and not config.TEST_MODE else None
+    if coalescer and not await asyncio.to_thread(coalescer.is_latest, repository_full_name, pr_number, head_sha):
+        print(f"Head {head_sha} was superseded by a newer push.")
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f"GitHub PR webhook ignored: {head_sha} superseded")
+        }
+
+    # Installation token of the GitHub App when one is configured, else GITHUB_ACCESS_TOKEN
+    try:
+        with timed("github_token"):
+            github_token = await asyncio.to_thread(get_github_token, repository_full_name, job.get('installation_id'))
+    except GitHubAuthError as e:
+        print(e)
+        if coalescer:
+            await asyncio.to_thread(coalescer.release, repository_full_name, pr_number, head_sha)
+        return {
+            'statusCode': 500,
+            'body': json.dumps(str(e))
+        }
+
+    # Verify repository access
+    with timed("verify_repo"):
+        has_access = config.TEST_MODE or await asyncio.to_thread(verify_repo_access, repository_full_name, github_token)
+    if not has_access:
+        if coalescer:
+            await asyncio.to_thread(coalescer.release, repository_full_name, pr_number, head_sha)
+        return {
+            'statusCode': 403,
+            'body': json.dumps(f"API key does not have access to the repository: {repository_full_name}")
+        }
+
+    with timed("comment_lookup"):
+        if config.TEST_MODE:
+            comment_id = None
+        else:
+            comment_id = await asyncio.to_thread(get_bot_comment_id, pr_number, repository_full_name, github_token)
+
+        # The bot comment records the head it last reviewed, so later pushes only review the delta
+        previous_body = None
+        last_sha = None
+        if comment_id and head_sha and config.INCREMENTAL_REVIEW and not job.get('full_review'):
+            previous_body = await asyncio.to_thread(get_comment_body, repository_full_name, comment_id, github_token)
+            last_sha = parse_reviewed_sha(previous_body)
+    if last_sha and last_sha == head_sha:
+        print(f"Head {head_sha} has already been reviewed.")
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f"GitHub PR webhook ignored: {head_sha} already reviewed")
+        }
+
+    # openai and pydantic are only imported once a review actually runs, keeping cold
+    # starts of ignored events, duplicates and 403s cheap.
+    from openai_client import ReviewResponse, review_code_with_openai, review_code_with_openai_async
+
+    changeset_files = None
+    triage = TriageReport()
+    progressive = None
+    on_progress = None
+    try:
+        if config.STREAM_REVIEW and not config.TEST_MODE:
+            # Post a placeholder right away and fill it in as the review streams in
+            progressive = ProgressiveComment(
+                repository_full_name, pr_number, comment_id, github_token,
+                config.STREAM_UPDATE_INTERVAL_SECONDS,
+            )
+            await asyncio.to_thread(progressive.start, format_progress(previous_body, ""))
+            on_progress = lambda partial_review: progressive.update(format_progress(previous_body, partial_review))
+
+        # Get the changeset
+        if not full_context:
+            # One thread for the whole fetch: the PR's files stream from the API as compaction consumes them.
+            changeset_files, full_context, last_sha = await asyncio.to_thread(
+                _fetch_changeset, job, last_sha, github_token, triage
+            )
+            metrics = current_metrics()
+            if metrics:
+                metrics.set_property("ChangedFiles", len(changeset_files))
+                metrics.set_property("SkippedFiles", len(triage.skipped_files))
+        code_context = None
+        if config.CODE_INDEX_DIR and config.DETAILED_REVIEW and head_sha and changeset_files is not None:
+            from code_index import related_code_for_changeset
+
+            code_context = lambda: related_code_for_changeset(
+                repository_full_name, head_sha, changeset_files, github_token
+            )
+        with timed("review"):
+            if changeset_files == [] and triage.skipped_files:
+                print("Only housekeeping changes; skipping the model.")
+                openai_review = ReviewResponse(pull_request_description="", feedback="No substantive changes to review.")
+            else:
+                review_args = (full_context, job['pr_title'], job['pr_description'], changeset_files, on_progress, code_context)
+                if config.ASYNC_REVIEW:
+                    openai_review: ReviewResponse = await review_code_with_openai_async(*review_args)
+                else:
+                    openai_review = await asyncio.to_thread(review_code_with_openai, *review_args)
+        if progressive:
+            comment_id = progressive.comment_id
+
+        if coalescer and not await asyncio.to_thread(coalescer.is_latest, repository_full_name, pr_number, head_sha):
+            # A newer push arrived while this review was running; its own review will post.
+            print(f"Dropping stale review of {head_sha}.")
+            return {
+                'statusCode': 200,
+                'body': json.dumps(f"GitHub PR webhook ignored: {head_sha} superseded")
+            }
+
+        if openai_review is not None:
+            review_content = openai_review.pull_request_description + "\n" + openai_review.feedback
+            if openai_review.detailed_feedback:
+                review_content += "\n\n### Detailed Review\n" + openai_review.detailed_feedback
+            if triage.format_skipped():
+                review_content += "\n\n" + triage.format_skipped()
+            if last_sha:
+                review_content = merge_incremental_review(previous_body, review_content, last_sha, head_sha)
+            elif head_sha:
+                review_content += format_reviewed_marker(head_sha)
+            with timed("post_comment"):
+                await asyncio.to_thread(
+                    post_or_update_comment,
+                    repository_full_name,
+                    pr_number,
+                    review_content,
+                    comment_id,
+                    github_token,
+                    config.TEST_MODE
+                )
+            if openai_review.code_suggestions and config.INLINE_SUGGESTIONS and changeset_files and head_sha:
+                from review_comments import post_code_suggestions
+
+                with timed("post_review"):
+                    await asyncio.to_thread(
+                        post_code_suggestions,
+                        repository_full_name,
+                        pr_number,
+                        head_sha,
+                        openai_review.code_suggestions,
+                        changeset_files,
+                        github_token,
+                        config.TEST_MODE
+                    )
+            if coalescer:
+                await asyncio.to_thread(coalescer.mark_reviewed, repository_full_name, pr_number, head_sha)
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        if progressive:
+            await asyncio.to_thread(progressive.finish, format_progress(previous_body, "_The review failed and will be retried._"))
+        if coalescer:
+            await asyncio.to_thread(coalescer.release, repository_full_name, pr_number, head_sha)
+        return {
+            'statusCode': 500,
+            'body': json.dumps(f"An error occurred: {e}")
+        }
+
+    return {
+        'statusCode': 200,
+        'body': json.dumps(f"GitHub PR webhook processed: {job['action']}")
+    }
+
+
+def _fetch_changeset(job, last_sha, github_token, triage):
+    """
+    Fetches, triages and compacts the PR's changes; blocking, so run on a worker thread.
+
+    Returns:
+        tuple: The file records, the formatted changeset, and last_sha if only the commits
+            since it were fetched (else None).
+    """
+    repository_full_name = job['repository_full_name']
+    pr_number = job['pr_number']
+    head_sha = job.get('head_sha')
+    with timed("fetch_changeset"):
+        mirrored = _fetch_mirror_changeset(job, last_sha, github_token) if config.GIT_MIRROR_DIR and head_sha else None
+        if mirrored is not None:
+            # Diffed locally; incremental when the head still builds on last_sha.
+            changeset_files, commit_messages, last_sha = mirrored
+        else:
+            comparison = _fetch_incremental_comparison(repository_full_name, last_sha, head_sha, github_token) if last_sha else None
+            if comparison is None:
+                # Stream the full PR file by file; compaction keeps it within the token budget.
+                last_sha = None
+                changeset_files = iter_changeset_files(repository_full_name, pr_number, github_token)
+                commit_messages = fetch_pull_request_commit_messages(
+                    repository_full_name, pr_number, github_token
+                )
+            else:
+                changeset_files, commit_messages = parse_comparison(comparison)
+        if config.TRIAGE_TRIVIAL_CHANGES:
+            # Housekeeping hunks and pure renames never reach the model.
+            changeset_files = triage_changeset(changeset_files, triage)
+        changeset_files, _ = compact_changeset(
+            changeset_files,
+            config.COMPACT_EXCLUDE_GLOBS,
+            # A wider context asked of the mirror's diff is kept.
+            max(config.COMPACT_CONTEXT_LINES, config.GIT_DIFF_CONTEXT_LINES if mirrored else 0),
+            config.REVIEW_TOKEN_BUDGET,
+        )
+        full_context = format_changeset(changeset_files, commit_messages)
+    return changeset_files, full_context, last_sha
+
+
+def _fetch_incremental_comparison(repository_full_name, last_sha, head_sha, github_token):
+    """
+    Fetches the last_sha...head_sha comparison, or None when a full review is needed instead.
+    """
+    try:
+        comparison = fetch_comparison(repository_full_name, last_sha, head_sha, github_token)
+    except requests.exceptions.RequestException as e:
+        # The last reviewed commit may be gone after a force push.
+        print(f"Failed to compare {last_sha[:7]}...{head_sha[:7]}: {e}")
+        return None
+    if comparison.get('status') != 'ahead':
+        print(f"Head {head_sha[:7]} does not build on {last_sha[:7]}; reviewing the full PR.")
+        return None
+    print(f"Reviewing only the commits since {last_sha[:7]}.")
+    return comparison
+
+
+def _fetch_mirror_changeset(job, last_sha, github_token):
+    """
+    Diffs the PR in the local git mirror, or returns None to fall back to the GitHub API.
+    """
+    from git_mirror import GitMirrorError, get_mirror_changeset
+
+    try:
+        return get_mirror_changeset(
+            job['repository_full_name'], job['base_branch'], job['head_sha'], github_token, last_sha
+        )
+    except (GitMirrorError, OSError, subprocess.SubprocessError) as e:
+        print(f"Git mirror of {job['repository_full_name']} unavailable, using the GitHub API: {e}")
+        return None
+
+
+def _run_measured_job(job, function):
+    with invocation(function) as metrics:
+        metrics.set_property("Repository", job['repository_full_name'])
+        metrics.set_property("PullRequest", job['pr_number'])
+        result = run_review_job(job)
+        metrics.set_property("StatusCode", result['statusCode'])
+        return result
+
+
+def worker_handler(event, context):
+    """
+    AWS Lambda handler for the SQS review queue.
+
+    Failed jobs are reported back as batch item failures so SQS redelivers only those.
+
+    Args:
+        event (dict): The SQS event with one or more records.
+        context (LambdaContext): The runtime information.
+
+    Returns:
+        dict: The partial batch response.
+    """
+    failures = []
+    for record in event.get('Records', []):
+        job = json.loads(record['body'])
+        print(f"Processing review job for {job['repository_full_name']}#{job['pr_number']} at {job.get('head_sha')}")
+        result = _run_measured_job(job, "worker_handler")
+        if result['statusCode'] >= 500:
+            failures.append({'itemIdentifier': record['messageId']})
+    return {'batchItemFailures': failures}
+
+
+def run_worker(max_jobs=None):
+    """
+    Polls the configured queue and runs review jobs until max_jobs have been handled.
+
+    Args:
+        max_jobs (int, optional): Stop after this many jobs; runs forever when None.
+    """
+    queue = get_job_queue()
+    if queue is None:
+        raise RuntimeError("REVIEW_QUEUE_URL is not set.")
+    handled = 0
+    while max_jobs is None or handled < max_jobs:
+        for receipt, job in queue.receive(max_jobs=1, wait_seconds=20):
+            result = _run_measured_job(job, "run_worker")
+            # Leave failed jobs unacknowledged so they are retried after the visibility timeout.
+            if result['statusCode'] < 500:
+                queue.ack(receipt)
+            handled += 1
+
+
+if __name__ == "__main__":
+    run_worker()